@@ -1,27 +1,211 @@
 import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-import pandas as pd
+import numpy as np
 from dotenv import load_dotenv
-from google import genai
-from google.genai import types
+
+from factors import (
+    MA_WINDOW,
+    STRATEGY_CHASE,
+    STRATEGY_ENGAGE,
+    STRATEGY_STOP,
+    RollingWindow,
+    classify_strategies,
+    compute_h_scores,
+    factor_matrix,
+    factor_shares,
+    format_ratio,
+    publication_order,
+    rolling_ma_ratios,
+    score_stats,
+)
+from history_snapshot import load_snapshot, save_snapshot
+from lazy_import import lazy_import
+from llm_cache import make_cache_key
+from metrics import default_metrics
+from rate_limiter import estimate_tokens, gemini_http_options, get_default_limiter
+
+# pandas 和 google.genai 导入较慢，第一次使用时才加载
+pd = lazy_import("pandas")
+genai = lazy_import("google.genai")
 
 load_dotenv()
 
+MODEL_NAME = "gemini-2.5-flash"
+
+# 规则引擎能确定策略时直接套用的决策模板 (不调用 LLM)
+RULE_TEMPLATES = {
+    STRATEGY_CHASE: {
+        "analysis": "Z Score {z:.2f} 显著爆款，收藏+分享贡献了 {share:.0%} 的热度，属于硬核干货",
+        "next_title_suggestions": ["{title}（进阶版）", "{title}：第二弹"],
+        "cover_prompt": "延续原封面风格，突出“进阶/第二弹”字样",
+    },
+    STRATEGY_STOP: {
+        "analysis": "Z Score {z:.2f} 表现不及预期，内容没有进入更大的流量池",
+        "next_title_suggestions": [
+            "{title}（换个角度重写）",
+            "关于{title}，很多人忽略了这一点",
+        ],
+        "cover_prompt": "更换封面主视觉，使用更醒目的大字标题",
+    },
+    STRATEGY_ENGAGE: {
+        "analysis": "Z Score {z:.2f}，评论贡献了 {comment:.0%} 的热度，属于高争议/高互动",
+        "next_title_suggestions": [
+            "{title}｜评论区问题集中解答",
+            "关于{title}，你们问得最多的问题",
+        ],
+        "cover_prompt": "使用问答/对话框样式封面，突出“答疑”",
+    },
+}
+
 
 class QuantContentAgent:
-    def __init__(self, history_file="post_data.csv"):
-        # 1. 初始化 Client
-        self.client = genai.Client()
+    def __init__(
+        self,
+        history_file="post_data.csv",
+        rate_limiter=None,
+        cache=None,
+        rule_engine=False,
+        snapshot=True,
+    ):
+        # 1. Gemini 客户端在第一次调用 LLM 时才创建，LLM 调用经过 RPM/TPM 限流
+        self._client = None
+        self._client_lock = threading.Lock()
+        self.rate_limiter = rate_limiter or get_default_limiter()
+        # 可选的响应缓存 (llm_cache.ResponseCache)，为 None 时不缓存
+        self.cache = cache
+        # 开启后决策矩阵能明确判断的帖子直接套用模板，只有模糊的帖子调用 LLM
+        self.rule_engine = rule_engine
 
-        # 2. 读取历史数据
+        # 2. 历史数据在第一次用到时才读取；CSV 旁有有效的快照 (history_snapshot)
+        # 时 H Score 统计量和 MA 窗口直接取自快照，不解析 CSV
+        self.history_file = history_file
+        self.snapshot = snapshot
+        self._history = None
+        self._snapshot = load_snapshot(history_file) if snapshot else None
+        self.invalidate_metrics_cache()
+
+    @property
+    def client(self):
+        """Gemini 客户端，第一次访问时创建 (规则引擎能判断的帖子不会用到)"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = genai.Client(http_options=gemini_http_options())
+        return self._client
+
+    @property
+    def history(self):
+        """
+        历史数据 (不复制)；缓存的统计量只在重新赋值时失效，
+        修改后需要重新赋值 (agent.history = df) 才会重新计算
+        """
+        return self._history_frame()
+
+    @history.setter
+    def history(self, value):
+        # 保存副本，调用方之后原地修改 value 不会让缓存的统计量过期；
+        # 替换历史数据时让缓存的分数和统计量失效，快照也不再对应
+        self._history = value.copy()
+        self._snapshot = None
+        self.invalidate_metrics_cache()
+
+    def _history_frame(self):
+        """agent 内部持有的历史数据，第一次用到时才读取"""
+        if self._history is None:
+            self._history = self._load_history()
+        return self._history
+
+    def _load_history(self):
+        """
+        读取历史 CSV 并算好 H Score 和统计量 (写入缓存)；
+        没有有效快照时顺便写出快照，供下次启动直接使用
+        """
         try:
-            self.history = pd.read_csv(history_file)
+            df = pd.read_csv(self.history_file)
         except FileNotFoundError:
             # 确保列名包含计算 H Score 所需的所有字段
-            self.history = pd.DataFrame(
-                columns=["title", "like", "comment", "save", "share"]
+            return pd.DataFrame(columns=["title", "like", "comment", "save", "share"])
+
+        with default_metrics.span("baseline"):
+            self._history_scores = compute_h_scores(df)
+            self._history_stats = score_stats(self._history_scores)
+        # 已有的 MA 窗口 (取自快照) 保持不变：快照按发布顺序保存，
+        # 末尾与 CSV 的发布顺序末尾相同，record_post 追加的新帖子也不能丢
+
+        if self.snapshot and self._snapshot is None:
+            order = publication_order(df)
+            save_snapshot(
+                self.history_file, self._history_scores[order], *self._history_stats
             )
+        return df
+
+    def _from_snapshot(self):
+        """历史数据尚未读取且有有效快照时，统计量和 MA 窗口取自快照"""
+        return self._history is None and self._snapshot is not None
+
+    def _history_rows(self):
+        if self._from_snapshot():
+            return self._snapshot.rows
+        return len(self._history_frame())
+
+    def invalidate_metrics_cache(self):
+        """清空缓存的历史 H Score 向量和统计量 (替换 history 时自动调用)"""
+        self._history_scores = None
+        self._history_stats = None
+        self._history_window = None
+
+    def _get_history_stats(self):
+        """
+        返回历史 H Score 的 (均值, 标准差)，结果缓存在 agent 上
+        agent 持有历史数据的私有副本，只有替换 history 时才需要重新计算
+        """
+        if self._from_snapshot():
+            return self._snapshot.mean, self._snapshot.std
+
+        history = self._history_frame()
+        if self._history_stats is None:
+            with default_metrics.span("baseline"):
+                self._history_scores = compute_h_scores(history)
+                self._history_stats = score_stats(self._history_scores)
+            self._history_window = None
+        return self._history_stats
+
+    def _get_history_window(self):
+        """
+        按发布顺序取历史最近 MA_WINDOW 篇的 H Score 组成环形缓冲区，
+        与统计量一起缓存；record_post 追加的新帖子保留到 history 被替换为止
+        """
+        self._get_history_stats()
+        if self._history_window is None:
+            if self._from_snapshot():
+                # 快照中的 H Score 已按发布顺序排列，只读取最后 MA_WINDOW 篇
+                recent = self._snapshot.scores[-MA_WINDOW:]
+            else:
+                recent = self._history_scores[publication_order(self._history)]
+            self._history_window = RollingWindow(MA_WINDOW, recent)
+        return self._history_window
+
+    def get_ma_ratio(self, h_score):
+        """当前帖子的 H/MA5：H Score 与此前最近 5 篇 H Score 均值之比"""
+        return self._get_history_window().ratio(h_score)
+
+    def record_post(self, new_post):
+        """新帖子发布后 O(1) 更新 MA 窗口，之后的帖子以它为参照"""
+        self._get_history_window().push(self._calculate_h_score(new_post))
+
+    def _ma_ratios(self, df, h_scores):
+        """按发布顺序一次性计算一批帖子的 H/MA5，批内较早的帖子计入较晚帖子的 MA"""
+        window = self._get_history_window()
+        order = publication_order(df)
+        sequence = np.concatenate([window.values(), h_scores[order]])
+        _, ratios = rolling_ma_ratios(sequence, MA_WINDOW)
+        result = np.empty(len(df))
+        result[order] = ratios[len(window) :]
+        return result
 
     def _calculate_h_score(self, row):
         """
@@ -49,24 +233,35 @@ class QuantContentAgent:
         # 1. 计算当前帖子的 H Score
         current_h_score = self._calculate_h_score(new_post)
 
-        # 2. 计算历史 H Score 分布 (用于计算 Z-Score)
-        z_score = 0.0
-        if not self.history.empty and len(self.history) > 2:
-            # 对历史每一行数据应用 H Score 公式
-            history_scores = self.history.apply(self._calculate_h_score, axis=1)
+        # 2. 基于历史 H Score 分布计算 Z-Score
+        z_score = self._z_scores(current_h_score)
 
-            mean = history_scores.mean()
-            std = history_scores.std()
+        return current_h_score, z_score
 
-            # 防止标准差为 0
-            if std == 0:
-                std = 1e-5
+    def _z_scores(self, h_scores):
+        """
+        用历史 H Score 分布把 H Score (标量或 NumPy 数组) 转换为 Z Score
+        历史数据不足 3 条时 Z Score 为 0
+        """
+        if self._history_rows() <= 2:
+            return h_scores * 0.0
 
-            z_score = (current_h_score - mean) / std
+        # 历史 H Score 分布由列式引擎一次算出并缓存
+        mean, std = self._get_history_stats()
 
-        return current_h_score, z_score
+        # 防止标准差为 0
+        if std == 0:
+            std = 1e-5
+
+        return (h_scores - mean) / std
+
+    def ai_strategic_decision(
+        self, new_post, h_score, z_score, user_comments, ma_ratio=None
+    ):
+        if ma_ratio is None:
+            ma_ratio = self.get_ma_ratio(h_score)
+        prompt_started = time.perf_counter()
 
-    def ai_strategic_decision(self, new_post, h_score, z_score, user_comments):
         # 构造详细的因子解释，让 AI 理解分数的构成
         factor_breakdown = (
             f"点赞({new_post.get('like',0)}) + "
@@ -82,6 +277,7 @@ class QuantContentAgent:
         - 帖子标题: "{new_post['title']}"
         - H Score (绝对热度): {h_score} (因子构成: {factor_breakdown})
         - Z Score (相对表现): {z_score:.2f} ( > 1.0 为显著爆款, < -0.5 为表现不及预期)
+        - H/MA{MA_WINDOW} (近期表现): {format_ratio(ma_ratio)} (与此前最近 {MA_WINDOW} 篇 H Score 均值之比, > 1 为跑赢近期水平)
         - 用户评论摘录: "{user_comments}"
 
         【决策逻辑】
@@ -96,20 +292,149 @@ class QuantContentAgent:
         3. next_title_suggestions: [2个建议标题]。
         4. cover_prompt: 封面提示词。
         """
+        default_metrics.observe("prompt_build", time.perf_counter() - prompt_started)
+
+        config = genai.types.GenerateContentConfig(
+            response_mime_type="application/json", temperature=0.7
+        )
+
+        # 相同模型、配置和 prompt 的结果直接从缓存返回
+        cache_key = None
+        if self.cache is not None:
+            cache_key = make_cache_key(MODEL_NAME, config, prompt)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                default_metrics.inc("llm_cache_hits")
+                return cached
 
         try:
-            response = self.client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    response_mime_type="application/json", temperature=0.7
-                ),
+            response = self.rate_limiter.call(
+                lambda: self._generate(prompt, config),
+                tokens=estimate_tokens(prompt),
             )
-            return json.loads(response.text)
+            with default_metrics.span("parse"):
+                decision = json.loads(response.text)
         except Exception as e:
             return None
 
+        if cache_key is not None:
+            self.cache.set(cache_key, decision)
+        return decision
+
+    def _generate(self, prompt, config):
+        """调用一次 Gemini，记录延迟、请求数和 token 用量"""
+        default_metrics.inc("llm_requests")
+        with default_metrics.span("llm"):
+            response = self.client.models.generate_content(
+                model=MODEL_NAME, contents=prompt, config=config
+            )
+        default_metrics.record_usage(response)
+        return response
+
+    def rule_decisions(self, df, z_scores):
+        """
+        规则引擎：按因子占比和 Z Score 向量化打策略标签，
+        返回 {行位置: 模板决策}，只包含能明确判断的帖子
+        """
+        matrix = factor_matrix(df)
+        labels = classify_strategies(matrix, z_scores)
+        shares = factor_shares(matrix)
+        titles = df["title"].tolist() if "title" in df else [""] * len(df)
+
+        decisions = {}
+        for pos in np.flatnonzero(labels != ""):
+            values = {
+                "z": float(z_scores[pos]),
+                "title": titles[pos],
+                "comment": shares[pos, 1],
+                "share": shares[pos, 2] + shares[pos, 3],
+            }
+            template = RULE_TEMPLATES[labels[pos]]
+            decisions[int(pos)] = {
+                "analysis": template["analysis"].format(**values),
+                "strategy": labels[pos],
+                "next_title_suggestions": [
+                    title.format(**values)
+                    for title in template["next_title_suggestions"]
+                ],
+                "cover_prompt": template["cover_prompt"],
+            }
+        return decisions
+
     def run_review(self, new_post, comments):
         h_score, z_score = self.get_market_metrics(new_post)
+        if self.rule_engine:
+            decided = self.rule_decisions(pd.DataFrame([new_post]), [z_score])
+            if decided:
+                return decided[0]
         decision = self.ai_strategic_decision(new_post, h_score, z_score, comments)
         return decision
+
+    def run_review_many(
+        self, posts, comments_column="comment_extracted", max_workers=8
+    ):
+        """
+        批量复盘：一次向量化计算所有帖子的 H/Z Score 和 H/MA5，并发调用 LLM，
+        按完成顺序逐条产出 (索引, H Score, Z Score, 决策)；
+        开启 rule_engine 时能明确判断的帖子不调用 LLM，最先产出
+
+        posts 可以是 DataFrame (评论摘录取自 comments_column 列)，
+        也可以是 (帖子 dict, 评论) 的可迭代对象，此时索引为其位置
+        """
+        if isinstance(posts, pd.DataFrame):
+            df = posts
+            if comments_column in df:
+                comments = df[comments_column].fillna("").tolist()
+            else:
+                comments = [""] * len(df)
+        else:
+            pairs = list(posts)
+            df = pd.DataFrame([post for post, _ in pairs])
+            comments = [comment for _, comment in pairs]
+
+        if df.empty:
+            return
+
+        # 1. 一次性计算全部 H Score 和 Z Score
+        h_scores = compute_h_scores(df)
+        z_scores = self._z_scores(h_scores)
+        ma_ratios = self._ma_ratios(df, h_scores)
+        records = df.to_dict("records")
+
+        # 2. 规则引擎能明确判断的帖子直接产出
+        decided = self.rule_decisions(df, z_scores) if self.rule_engine else {}
+        for pos, decision in decided.items():
+            h_score = _as_score(h_scores[pos])
+            yield df.index[pos], h_score, float(z_scores[pos]), decision
+
+        # 3. 其余帖子并发调用 LLM，谁先完成先返回谁；
+        # 调用方提前放弃生成器时取消尚未开始的调用，不再等待全部完成
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = {}
+            for pos, index in enumerate(df.index):
+                if pos in decided:
+                    continue
+                h_score = _as_score(h_scores[pos])
+                z_score = float(z_scores[pos])
+                future = executor.submit(
+                    self.ai_strategic_decision,
+                    records[pos],
+                    h_score,
+                    z_score,
+                    comments[pos],
+                    float(ma_ratios[pos]),
+                )
+                futures[future] = (index, h_score, z_score)
+
+            for future in as_completed(futures):
+                index, h_score, z_score = futures[future]
+                yield index, h_score, z_score, future.result()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _as_score(value):
+    """把 NumPy 标量转换为 Python 数字，整数值保持为 int 以便写入 prompt"""
+    value = float(value)
+    return int(value) if value.is_integer() else value
@@ -0,0 +1,14 @@
+"""
+原子写入 - 先写临时文件再替换，读取方 (node_exporter、下一次运行)
+不会读到写了一半的文件
+"""
+
+import os
+
+
+def write_atomic(path, text):
+    """把 text 写入 path：先写 path.tmp，再用 os.replace 替换"""
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(temp_path, path)
@@ -0,0 +1,187 @@
+"""
+离线批处理任务 - 把待分析 Prompt 写成 JSONL 任务文件，提交给批量预测后端，
+稍后轮询并取回结果
+
+任务文件每行: {"key": record_id, "request": GenerateContentRequest}
+结果文件每行: {"key": record_id, "response": GenerateContentResponse} 或 {"key", "error"}
+"""
+
+import json
+import os
+import shutil
+import time
+
+from lazy_import import lazy_import
+
+genai = lazy_import("google.genai")
+
+# 批处理任务状态
+JOB_PENDING = "pending"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+_GEMINI_SUCCEEDED = "JOB_STATE_SUCCEEDED"
+_GEMINI_FAILED = ("JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED")
+
+
+def build_request(prompt):
+    """单个 Prompt 对应的 GenerateContentRequest (与交互调用相同的 JSON 输出配置)"""
+    return {
+        "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+        "generation_config": {"response_mime_type": "application/json"},
+    }
+
+
+def write_job_file(path, prompts):
+    """把 {key: prompt} 写成 JSONL 任务文件，返回写入的行数"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for key, prompt in prompts.items():
+            line = {"key": key, "request": build_request(prompt)}
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+    return len(prompts)
+
+
+def read_prompts(path):
+    """读取任务文件，返回 {key: prompt}"""
+    prompts = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            parts = item["request"]["contents"][0]["parts"]
+            prompts[item["key"]] = "".join(part.get("text", "") for part in parts)
+    return prompts
+
+
+def parse_results(lines):
+    """
+    解析结果文件的各行，返回 {key: 分析结果 dict}
+    出错、无候选或响应不是 JSON 对象的条目不会出现在结果中
+    """
+    results = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+            parts = item["response"]["candidates"][0]["content"]["parts"]
+            result = json.loads("".join(part.get("text", "") for part in parts))
+        except (ValueError, KeyError, IndexError, TypeError):
+            continue
+        if isinstance(result, dict):
+            results[str(item.get("key"))] = result
+    return results
+
+
+def load_job_state(path):
+    """读取进行中的任务状态，没有任务时返回 None"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_job_state(path, state):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+
+
+def clear_job_state(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+class GeminiBatchBackend:
+    """Gemini Batch API：上传任务文件、创建批处理任务、下载结果文件"""
+
+    def __init__(self, client, model):
+        self.client = client
+        self.model = model
+
+    def submit(self, job_file, display_name=None):
+        """提交任务文件，返回任务名"""
+        uploaded = self.client.files.upload(
+            file=job_file,
+            config=genai.types.UploadFileConfig(
+                display_name=display_name or os.path.basename(job_file),
+                mime_type="jsonl",
+            ),
+        )
+        job = self.client.batches.create(
+            model=self.model,
+            src=uploaded.name,
+            config={"display_name": display_name or os.path.basename(job_file)},
+        )
+        return job.name
+
+    def poll(self, job_name):
+        """返回任务状态 JOB_PENDING / JOB_SUCCEEDED / JOB_FAILED"""
+        job = self.client.batches.get(name=job_name)
+        state = getattr(job.state, "name", job.state)
+        if state == _GEMINI_SUCCEEDED:
+            return JOB_SUCCEEDED
+        if state in _GEMINI_FAILED:
+            return JOB_FAILED
+        return JOB_PENDING
+
+    def fetch(self, job_name):
+        """下载已完成任务的结果文件，返回其中的各行"""
+        job = self.client.batches.get(name=job_name)
+        content = self.client.files.download(file=job.dest.file_name)
+        return content.decode("utf-8").splitlines()
+
+
+class LocalBatchBackend:
+    """
+    基于本地目录的批处理后端，用于测试和本地演练
+    respond(prompt) 返回模型输出文本；为 None 时任务一直处于等待状态，
+    直到结果文件被外部写入 (<任务名>.output.jsonl)
+    """
+
+    def __init__(self, directory, respond=None):
+        self.directory = directory
+        self.respond = respond
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, job_name, kind):
+        return os.path.join(self.directory, f"{job_name}.{kind}.jsonl")
+
+    def submit(self, job_file, display_name=None):
+        job_name = display_name or f"job-{int(time.time() * 1000)}"
+        shutil.copyfile(job_file, self._path(job_name, "input"))
+        return job_name
+
+    def poll(self, job_name):
+        if os.path.exists(self._path(job_name, "output")):
+            return JOB_SUCCEEDED
+        if not os.path.exists(self._path(job_name, "input")):
+            return JOB_FAILED
+        if self.respond is None:
+            return JOB_PENDING
+
+        # 逐条执行任务，单条失败记录为 error 行
+        with open(self._path(job_name, "output"), "w", encoding="utf-8") as f:
+            for key, prompt in read_prompts(self._path(job_name, "input")).items():
+                try:
+                    text = self.respond(prompt)
+                    content = {"role": "model", "parts": [{"text": text}]}
+                    line = {
+                        "key": key,
+                        "response": {"candidates": [{"content": content}]},
+                    }
+                except Exception as e:
+                    line = {"key": key, "error": {"message": str(e)}}
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+        return JOB_SUCCEEDED
+
+    def fetch(self, job_name):
+        with open(self._path(job_name, "output"), encoding="utf-8") as f:
+            return f.read().splitlines()
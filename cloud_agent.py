@@ -1,79 +1,440 @@
+import base64
+import functools
+import hashlib
 import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
-import pandas as pd
-import requests
 from dotenv import load_dotenv
-from google import genai
-from google.genai import types
+
+from factors import (
+    FACTOR_WEIGHTS,
+    MA_WINDOW,
+    STRATEGY_CHASE,
+    STRATEGY_ENGAGE,
+    STRATEGY_STOP,
+    RollingWindow,
+    RunningStats,
+    classify_strategies,
+    factor_shares,
+    format_ratio,
+    rolling_ma_ratios,
+)
+from lazy_import import lazy_import
+from llm_cache import make_cache_key
+from metrics import default_metrics
+from rate_limiter import gemini_http_options, get_default_limiter
+from token_budget import default_estimator, pack_batches
+
+# requests 和 google.genai 导入较慢，第一次使用时才加载
+requests = lazy_import("requests")
+genai = lazy_import("google.genai")
 
 load_dotenv()
 
+MODEL_NAME = "gemini-2.5-flash"
+
+# 单篇和打包分析共用的判断标准
+JUDGEMENT_CRITERIA = """- Z > 1.0 : 爆款 (Alpha收益) -> 建议追涨/出系列。
+        - Z < -0.5: 跑输大盘 -> 建议止损/改进封面。
+        - 收藏高但Z分低: 属于干货但流量池受限。"""
+
+# 规则引擎能确定策略时直接套用的建议模板 (不调用 LLM)
+RULE_TEMPLATES = {
+    STRATEGY_CHASE: {
+        "analysis": "爆款 (Z={z:.2f})，收藏+分享贡献了 {share:.0%} 的热度，属于硬核干货",
+        "action": "追涨：趁热出进阶版/系列续集",
+        "next_title": "{title}（进阶版）",
+    },
+    STRATEGY_STOP: {
+        "analysis": "跑输大盘 (Z={z:.2f})，表现低于历史水平",
+        "action": "止损：换选题方向，改进标题和封面",
+        "next_title": "{title}（换个角度重写）",
+    },
+    STRATEGY_ENGAGE: {
+        "analysis": "高互动 (Z={z:.2f})，评论贡献了 {comment:.0%} 的热度，讨论度高",
+        "action": "互动：集中回复评论区问题，整理答疑",
+        "next_title": "{title}｜评论区问题集中解答",
+    },
+}
+
+# 分析结果必须包含的字段，以及打包请求的 JSON 数组响应格式
+ANALYSIS_KEYS = ("analysis", "action", "next_title")
+# 打包请求中每篇笔记的输出预算 (analysis/action/next_title 三个短字段)
+OUTPUT_TOKENS_PER_POST = 150
+
+
+@functools.lru_cache(maxsize=None)
+def batch_response_schema():
+    """打包请求的响应格式，第一次发送打包请求时才构造 (需要加载 google.genai)"""
+    types = genai.types
+    return types.Schema(
+        type=types.Type.ARRAY,
+        items=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                key: types.Schema(type=types.Type.STRING)
+                for key in ("record_id",) + ANALYSIS_KEYS
+            },
+            required=["record_id", *ANALYSIS_KEYS],
+        ),
+    )
+
+
+# 读取待分析记录时需要的字段
+PENDING_FIELDS = ["标题", "点赞", "评论", "收藏", "分享", "状态"]
+# 构建历史基准线只需要的数字字段 (不含体积较大的 AI建议 文本列)
+BASELINE_FIELDS = ["点赞", "评论", "收藏", "分享", "状态"]
+
+# 飞书接口限流或服务端错误时自动重试的状态码
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# 飞书开放平台接口地址，可通过 base_url 指向其他地址 (如本地压测替身服务)
+FEISHU_BASE_URL = "https://open.feishu.cn/open-apis"
+
+# 飞书返回的"访问令牌无效/过期"错误码
+INVALID_TOKEN_CODES = (99991663, 99991668)
+
+
+def _response_code(response):
+    """取飞书响应体中的业务错误码，无法解析时返回 None"""
+    try:
+        return response.json().get("code")
+    except Exception as e:
+        return None
+
+
+class TenantTokenManager:
+    """
+    租户访问令牌管理：记录过期时间并提前刷新，
+    可选地把令牌加密缓存到本地文件，供紧接着的下一次运行复用
+    """
+
+    def __init__(
+        self,
+        fetch_token,
+        app_id,
+        app_secret,
+        refresh_margin=300,
+        retry_interval=30,
+        cache_file=None,
+    ):
+        """
+        fetch_token: 无参函数，返回 (令牌, 有效秒数)，失败时令牌为 None
+        refresh_margin: 距过期还剩多少秒时提前刷新
+        retry_interval: 获取失败后至少间隔多少秒再重新请求
+        cache_file: 本地缓存文件路径，为 None 时不落盘
+        """
+        self.fetch_token = fetch_token
+        self.app_id = app_id
+        self.app_secret = app_secret
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+        self.cache_file = cache_file
+
+        self.token = None
+        self.expires_at = 0.0
+        self._last_failure = None
+
+        self._load_cache()
+
+    def get(self):
+        """返回有效的令牌，即将过期或已失效时自动刷新"""
+        if self.token and time.time() < self.expires_at - self.refresh_margin:
+            return self.token
+        if (
+            self._last_failure is not None
+            and time.time() - self._last_failure < self.retry_interval
+        ):
+            return self.token
+        return self.refresh()
+
+    def refresh(self):
+        """立即向服务端请求新令牌"""
+        token, expire = self.fetch_token()
+        if not token:
+            # 提前刷新失败时，尚未真正过期的旧令牌仍可继续使用
+            if time.time() >= self.expires_at:
+                self.token = None
+            self._last_failure = time.time()
+            return self.token
+
+        self.token = token
+        self.expires_at = time.time() + expire
+        self._last_failure = None
+        self._save_cache()
+        return token
+
+    def invalidate(self):
+        """标记当前令牌失效，下一次 get() 会重新请求"""
+        self.token = None
+        self.expires_at = 0.0
+        self._last_failure = None
+
+    def _cipher(self):
+        """由 app_secret 派生缓存文件的加密密钥"""
+        from cryptography.fernet import Fernet
+
+        key = hashlib.sha256(self.app_secret.encode("utf-8")).digest()
+        return Fernet(base64.urlsafe_b64encode(key))
+
+    def _load_cache(self):
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, "rb") as f:
+                cached = json.loads(self._cipher().decrypt(f.read()))
+        except Exception as e:
+            # 缓存损坏、密钥变更或缺少 cryptography 时忽略缓存
+            return
+        if cached.get("app_id") == self.app_id:
+            self.token = cached.get("token")
+            self.expires_at = cached.get("expires_at", 0.0)
+
+    def _save_cache(self):
+        if not self.cache_file:
+            return
+        payload = json.dumps(
+            {"app_id": self.app_id, "token": self.token, "expires_at": self.expires_at}
+        ).encode("utf-8")
+        try:
+            encrypted = self._cipher().encrypt(payload)
+            # 仅当前用户可读写
+            fd = os.open(self.cache_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(encrypted)
+        except Exception as e:
+            return
+
 
 class FeishuConnector:
-    def __init__(self, app_id, app_secret, user_access_token=None):
+    def __init__(
+        self,
+        app_id,
+        app_secret,
+        user_access_token=None,
+        pool_size=10,
+        keep_alive=True,
+        connect_timeout=5,
+        read_timeout=30,
+        max_retries=3,
+        backoff_factor=0.5,
+        token_cache_file=None,
+        base_url=FEISHU_BASE_URL,
+    ):
         self.app_id = app_id
+        self.base_url = base_url.rstrip("/")
         self.app_secret = app_secret
         self.user_access_token = user_access_token
+        # 最近一次 iter_records 中途失败的原因，成功读完时为 None
+        self.last_error = None
 
-        # 优先使用用户令牌，否则使用应用令牌
-        if user_access_token:
-            self.token = user_access_token
-        else:
-            self.token = self._get_tenant_access_token()
+        # 所有请求共用一个连接池；(连接超时, 读取超时)，避免卡在无响应的连接上
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = self._build_session(
+            pool_size, keep_alive, max_retries, backoff_factor
+        )
 
-    def _get_tenant_access_token(self):
-        url = "https://open.feishu.cn/open-apis/auth/v3/tenant_access_token/internal"
-        resp = requests.post(
-            url, json={"app_id": self.app_id, "app_secret": self.app_secret}
+        # 优先使用用户令牌，否则使用应用令牌 (由令牌管理器负责过期刷新)
+        self.token_manager = None
+        if not user_access_token:
+            self.token_manager = TenantTokenManager(
+                self._get_tenant_access_token,
+                app_id,
+                app_secret,
+                cache_file=token_cache_file,
+            )
+            self.token_manager.get()
+
+    @property
+    def token(self):
+        if self.token_manager is None:
+            return self.user_access_token
+        return self.token_manager.get()
+
+    @staticmethod
+    def _build_session(pool_size, keep_alive, max_retries, backoff_factor):
+        """
+        创建带连接池的 Session：复用 TCP/TLS 连接，
+        遇到 429/5xx 时按指数退避重试，并遵循 Retry-After 响应头
+        """
+        from urllib3.util.retry import Retry
+
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=None,  # 读取和字段更新都是幂等的，全部允许重试
+            respect_retry_after_header=True,
+            raise_on_status=False,
         )
-        result = resp.json()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+        )
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        if not keep_alive:
+            session.headers["Connection"] = "close"
+        return session
+
+    def close(self):
+        """关闭连接池"""
+        self.session.close()
+
+    def _get_tenant_access_token(self):
+        """请求新的租户令牌，返回 (令牌, 有效秒数)，失败时返回 (None, 0)"""
+        url = f"{self.base_url}/auth/v3/tenant_access_token/internal"
+        try:
+            resp = self.session.post(
+                url,
+                json={"app_id": self.app_id, "app_secret": self.app_secret},
+                timeout=self.timeout,
+            )
+            result = resp.json()
+        except Exception as e:
+            return None, 0
         if result.get("code") == 0:
-            return result.get("tenant_access_token")
+            return result.get("tenant_access_token"), result.get("expire", 7200)
         else:
-            return None
+            return None, 0
 
-    def get_records(self, app_token, table_id):
-        if not self.token:
-            return []
+    def _request(self, method, url, **kwargs):
+        """
+        带鉴权头和超时发送请求；令牌被服务端判定无效时，
+        刷新租户令牌后透明地重试一次
+        """
+        send = getattr(self.session, method)
+        headers = dict(kwargs.pop("headers", None) or {})
+        headers["Authorization"] = f"Bearer {self.token}"
+        response = self._send(send, url, headers=headers, **kwargs)
 
-        # 读取"待分析"的数据
-        url = f"https://open.feishu.cn/open-apis/bitable/v1/apps/{app_token}/tables/{table_id}/records"
-        headers = {"Authorization": f"Bearer {self.token}"}
-        # 筛选条件：状态=待分析 (这里简化处理，读取全部，代码里过滤)
+        if self.token_manager and _response_code(response) in INVALID_TOKEN_CODES:
+            self.token_manager.invalidate()
+            token = self.token_manager.get()
+            if token:
+                default_metrics.inc("feishu_retries")
+                headers["Authorization"] = f"Bearer {token}"
+                response = self._send(send, url, headers=headers, **kwargs)
+        return response
 
+    def _send(self, send, url, **kwargs):
+        """发送一次请求并计数：请求数、连接池内部重试次数、失败数"""
+        default_metrics.inc("feishu_requests")
         try:
-            resp = requests.get(url, headers=headers)
-            if resp.status_code == 200:
+            response = send(url, timeout=self.timeout, **kwargs)
+        except Exception:
+            default_metrics.inc("feishu_errors")
+            raise
+        history = getattr(getattr(response.raw, "retries", None), "history", None)
+        if isinstance(history, tuple) and history:
+            default_metrics.inc("feishu_retries", len(history))
+        if response.status_code != 200 or _response_code(response) not in (0, None):
+            default_metrics.inc("feishu_errors")
+        return response
+
+    @staticmethod
+    def status_filter(status):
+        """生成按状态筛选的多维表格筛选公式"""
+        return f'CurrentValue.[状态]="{status}"'
+
+    @staticmethod
+    def modified_since_filter(field, timestamp):
+        """
+        服务端筛选公式：只返回修改时间字段 (飞书"最后更新时间"类型) 不早于
+        timestamp (秒) 所在日期的记录；公式只能精确到天
+        """
+        date = time.strftime("%Y-%m-%d", time.gmtime(timestamp))
+        return f'CurrentValue.[{field}]>=TODATE("{date}")'
+
+    def get_records(self, app_token, table_id, filter_formula=None, field_names=None):
+        """读取表格中的全部记录 (自动翻页)"""
+        return list(
+            self.iter_records(
+                app_token,
+                table_id,
+                filter_formula=filter_formula,
+                field_names=field_names,
+            )
+        )
+
+    def iter_records(
+        self,
+        app_token,
+        table_id,
+        page_size=500,
+        on_progress=None,
+        filter_formula=None,
+        field_names=None,
+        automatic_fields=False,
+    ):
+        """
+        逐页读取表格记录的生成器，每页到达后立即产出其中的记录
+
+        page_size: 每页条数，飞书上限为 500
+        on_progress: 可选回调 on_progress(已读取条数, 总条数)，每页调用一次
+        filter_formula: 可选的服务端筛选公式，见 status_filter
+        field_names: 可选的字段列表，只返回这些字段
+        automatic_fields: 为 True 时记录附带 created_time / last_modified_time
+        读取中途出错时生成器提前结束，并把原因记录在 self.last_error
+        """
+        self.last_error = None
+        if not self.token:
+            self.last_error = "no token"
+            return
+
+        url = f"{self.base_url}/bitable/v1/apps/{app_token}/tables/{table_id}/records"
+        params = {"page_size": page_size}
+        if filter_formula:
+            params["filter"] = filter_formula
+        if field_names:
+            params["field_names"] = json.dumps(field_names, ensure_ascii=False)
+        if automatic_fields:
+            params["automatic_fields"] = "true"
+        fetched = 0
+
+        while True:
+            try:
+                with default_metrics.span("feishu_fetch"):
+                    resp = self._request("get", url, params=params)
+                if resp.status_code != 200:
+                    self.last_error = f"HTTP {resp.status_code}"
+                    return
                 result = resp.json()
-                if result.get("code") == 0:
-                    return result.get("data", {}).get("items", [])
-                else:
-                    return []
-            else:
-                return []
-        except Exception as e:
-            return []
+            except Exception as e:
+                self.last_error = str(e)
+                return
+
+            if result.get("code") != 0:
+                self.last_error = f"code {result.get('code')}"
+                return
+
+            data = result.get("data") or {}
+            items = data.get("items") or []
+            fetched += len(items)
+            if on_progress:
+                on_progress(fetched, data.get("total", fetched))
+
+            yield from items
+
+            page_token = data.get("page_token")
+            if not data.get("has_more") or not page_token:
+                return
+            params["page_token"] = page_token
 
     def update_record(self, app_token, table_id, record_id, ai_suggestion):
         if not self.token:
             return False
 
-        url = f"https://open.feishu.cn/open-apis/bitable/v1/apps/{app_token}/tables/{table_id}/records/{record_id}"
-        headers = {
-            "Authorization": f"Bearer {self.token}",
-            "Content-Type": "application/json; charset=utf-8",
-        }
-        payload = {
-            "fields": {
-                "AI建议": ai_suggestion,
-                "状态": "已分析",  # 更新状态，避免重复跑
-            }
-        }
+        url = f"{self.base_url}/bitable/v1/apps/{app_token}/tables/{table_id}/records/{record_id}"
+        headers = {"Content-Type": "application/json; charset=utf-8"}
+        payload = {"fields": analysis_fields(ai_suggestion)}
 
         try:
-            response = requests.put(url, headers=headers, json=payload)
+            with default_metrics.span("feishu_write"):
+                response = self._request("put", url, headers=headers, json=payload)
             if response.status_code == 200:
                 result = response.json()
                 if result.get("code") == 0:
@@ -85,80 +446,340 @@ class FeishuConnector:
         except Exception as e:
             return False
 
+    def batch_update_records(self, app_token, table_id, updates, batch_size=500):
+        """
+        通过 batch_update 接口批量更新记录，每个请求最多 500 条
+
+        updates: [{"record_id": ..., "fields": {...}}, ...]
+        返回 {record_id: 是否成功}，失败的记录可以单独重试
+        """
+        results = {item["record_id"]: False for item in updates}
+        if not self.token or not updates:
+            return results
+
+        url = f"{self.base_url}/bitable/v1/apps/{app_token}/tables/{table_id}/records/batch_update"
+        headers = {"Content-Type": "application/json; charset=utf-8"}
+
+        for start in range(0, len(updates), batch_size):
+            chunk = updates[start : start + batch_size]
+            try:
+                with default_metrics.span("feishu_write"):
+                    response = self._request(
+                        "post", url, headers=headers, json={"records": chunk}
+                    )
+                if response.status_code != 200:
+                    continue
+                result = response.json()
+            except Exception as e:
+                continue
+
+            if result.get("code") != 0:
+                continue
+
+            # 以返回结果中实际更新的记录为准
+            for record in (result.get("data") or {}).get("records") or []:
+                if record.get("record_id") in results:
+                    results[record["record_id"]] = True
+
+        return results
+
+
+def analysis_fields(ai_suggestion):
+    """分析结果回写到表格时的字段"""
+    return {
+        "AI建议": ai_suggestion,
+        "状态": "已分析",  # 更新状态，避免重复跑
+    }
+
+
+class WriteBackBuffer:
+    """
+    回写缓冲区：收集分析结果，攒够 max_batch_size 条或距最早一条超过
+    flush_interval 秒时，通过 batch_update 一次性写回
+
+    时间条件在 add() 时检查，结束前需调用 flush() (或使用 with 语句)
+    """
+
+    def __init__(
+        self, connector, app_token, table_id, max_batch_size=500, flush_interval=10.0
+    ):
+        self.connector = connector
+        self.app_token = app_token
+        self.table_id = table_id
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+
+        self.pending = {}
+        self.results = {}
+        self._failed_fields = {}
+        self._first_added_at = None
+
+    def add(self, record_id, ai_suggestion):
+        """加入一条待写回结果，满足条件时自动 flush"""
+        if not self.pending:
+            self._first_added_at = time.monotonic()
+        # 同一记录多次写入时只保留最新结果
+        self.pending[record_id] = analysis_fields(ai_suggestion)
+
+        if (
+            len(self.pending) >= self.max_batch_size
+            or time.monotonic() - self._first_added_at >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        """写回缓冲区中的全部结果，返回本次的 {record_id: 是否成功}"""
+        if not self.pending:
+            return {}
+
+        updates = [
+            {"record_id": record_id, "fields": fields}
+            for record_id, fields in self.pending.items()
+        ]
+        self.pending = {}
+        self._first_added_at = None
+
+        flushed = self.connector.batch_update_records(
+            self.app_token, self.table_id, updates, batch_size=self.max_batch_size
+        )
+        # 记住失败记录的字段，供 retry_failed 逐条重试
+        for item in updates:
+            if flushed.get(item["record_id"]):
+                self._failed_fields.pop(item["record_id"], None)
+            else:
+                self._failed_fields[item["record_id"]] = item["fields"]
+        self.results.update(flushed)
+        return flushed
+
+    @property
+    def failed(self):
+        """写回失败的 record_id 列表"""
+        return list(self._failed_fields)
+
+    def retry_failed(self):
+        """对批量写回失败的记录逐条重试，返回重试后仍失败的 record_id"""
+        for record_id, fields in list(self._failed_fields.items()):
+            if self.connector.update_record(
+                self.app_token, self.table_id, record_id, fields["AI建议"]
+            ):
+                self.results[record_id] = True
+                del self._failed_fields[record_id]
+        return self.failed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+
 
 class CloudQuantAgent:
-    def __init__(self):
-        self.client = genai.Client(api_key=os.environ["GEMINI_API_KEY"])
-        # 历史统计基准
-        self.history_mean = 0.0
-        self.history_std = 1.0
-        self.has_history = False
+    def __init__(
+        self, rate_limiter=None, cache=None, estimator=None, rule_engine=False
+    ):
+        # Gemini 客户端在第一次调用 LLM 时才创建，密钥缺失仍在这里报错
+        self._api_key = os.environ["GEMINI_API_KEY"]
+        self._client = None
+        self._client_lock = threading.Lock()
+        # LLM 调用经过 RPM/TPM 限流，默认与 QuantContentAgent 共用限流器
+        self.rate_limiter = rate_limiter or get_default_limiter()
+        # 本地 token 估算器 (token_budget.TokenEstimator)，用于限流预算和打包
+        self.estimator = estimator or default_estimator
+        # 开启后决策矩阵能明确判断的笔记直接套用模板，只有模糊的笔记调用 LLM
+        self.rule_engine = rule_engine
+        # 可选的响应缓存 (llm_cache.ResponseCache)，为 None 时不缓存
+        self.cache = cache
+        # 历史统计基准：增量统计量、每条记录的 H Score (用于修正) 和
+        # 最近 MA_WINDOW 篇笔记的 H Score (用于计算 H/MA5)
+        self.reset_baseline()
+
+    @property
+    def client(self):
+        """Gemini 客户端，第一次访问时创建 (没有待分析记录的运行不会用到)"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = genai.Client(
+                        api_key=self._api_key, http_options=gemini_http_options()
+                    )
+        return self._client
 
     def _calc_h_score(self, like, comment, save, share):
         """核心因子公式"""
         return (like * 1) + (comment * 4) + (save * 5) + (share * 10)
 
-    def build_history_baseline(self, all_records):
+    def reset_baseline(self):
+        """清空历史基准 (统计量、按记录的 H Score 和 MA 窗口)"""
+        self.baseline = RunningStats()
+        self.baseline_scores = {}
+        self.history_window = RollingWindow(MA_WINDOW)
+        self._refresh_baseline()
+
+    def build_history_baseline(self, all_records, incremental=False, complete=None):
         """
-        Step 1: 遍历所有记录，计算历史 H Score 的均值和标准差
+        Step 1: 遍历所有记录，计算历史 H Score 的均值和标准差，
+        并按记录顺序 (即发布顺序) 保留最近 MA_WINDOW 篇作为 MA 窗口
+
+        incremental=True 时在已加载的基准状态上对账：all_records 仍是完整的
+        "已分析"记录，但只有新增、指标变化和已消失的记录会更新统计量；
+        complete 为读完 all_records 后调用的函数，返回 False 表示读取中断，
+        此时没出现的记录可能只是没读到，不从统计中移除
+        返回是否完整读取
         """
-        h_scores = []
+        with default_metrics.span("baseline"):
+            if not incremental:
+                self.reset_baseline()
+            seen = self.update_history_baseline(all_records)
+            finished = complete is None or complete()
+            if incremental and finished:
+                self.update_history_baseline(
+                    [], removed=set(self.baseline_scores) - seen
+                )
+            return finished
 
-        for item in all_records:
+    def update_history_baseline(self, records, removed=()):
+        """
+        增量更新历史基准，代价只与 records 的条数成正比：
+        新的"已分析"记录加入统计并进入 MA 窗口，指标变化的记录修正统计量，
+        不再是"已分析"的记录和 removed 中的 record_id 从统计中移除
+        返回本次出现的"已分析"记录的 record_id 集合
+        """
+        seen = set()
+        for item in records:
             fields = item["fields"]
-            status = fields.get("状态", "")
+            record_id = item.get("record_id")
 
             # 只使用"已分析"的旧数据来构建基准线，避免数据偷窥
-            if status == "已分析":
-                h = self._calc_h_score(
-                    fields.get("点赞", 0),
-                    fields.get("评论", 0),
-                    fields.get("收藏", 0),
-                    fields.get("分享", 0),
-                )
-                h_scores.append(h)
+            if fields.get("状态", "") != "已分析":
+                if record_id in self.baseline_scores:
+                    self.baseline.remove(self.baseline_scores.pop(record_id))
+                continue
+
+            h = self._calc_h_score(
+                fields.get("点赞", 0),
+                fields.get("评论", 0),
+                fields.get("收藏", 0),
+                fields.get("分享", 0),
+            )
+            if record_id is None:
+                # 没有 record_id 的记录无法追踪后续变化，只计入统计
+                self.baseline.push(h)
+                self.history_window.push(h)
+                continue
+
+            seen.add(record_id)
+            previous = self.baseline_scores.get(record_id)
+            if previous is None:
+                self.baseline.push(h)
+                self.history_window.push(h)
+            elif previous != h:
+                self.baseline.replace(previous, h)
+            self.baseline_scores[record_id] = h
 
-        # 计算统计量
-        if len(h_scores) > 2:
-            self.history_mean = np.mean(h_scores)
-            self.history_std = np.std(h_scores)
+        for record_id in removed:
+            if record_id in self.baseline_scores:
+                self.baseline.remove(self.baseline_scores.pop(record_id))
+
+        self._refresh_baseline()
+        return seen
+
+    def _refresh_baseline(self):
+        """由增量统计量更新均值、标准差 (总体标准差)，记录不足 3 条时视为没有基准"""
+        if self.baseline.count > 2:
+            self.history_mean = self.baseline.mean
+            self.history_std = self.baseline.std()
             if self.history_std == 0:
                 self.history_std = 1e-5  # 防止除零
             self.has_history = True
         else:
-            pass
+            self.history_mean = 0.0
+            self.history_std = 1.0
+            self.has_history = False
 
-    def analyze(self, post_data):
-        """
-        Step 2: 分析单条数据，结合 Z-Score
-        """
-        # 1. 计算绝对热度 H Score
-        like = post_data["like"]
-        comment = post_data["comment"]
-        save = post_data["save"]
-        share = post_data["share"]
+    def save_baseline_state(self, path):
+        """把基准状态写入 JSON 文件，供下一次运行增量更新"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        state = {
+            "stats": self.baseline.to_dict(),
+            "scores": self.baseline_scores,
+            "window": self.history_window.values().tolist(),
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
 
-        h_score = self._calc_h_score(like, comment, save, share)
+    def load_baseline_state(self, path):
+        """读取基准状态，文件不存在或损坏时返回 False"""
+        try:
+            with open(path, encoding="utf-8") as f:
+                state = json.load(f)
+            baseline = RunningStats.from_dict(state["stats"])
+            scores = dict(state["scores"])
+            window = RollingWindow(MA_WINDOW, state["window"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
 
-        # 2. 计算相对表现 Z Score
+        self.baseline = baseline
+        self.baseline_scores = scores
+        self.history_window = window
+        self._refresh_baseline()
+        return True
+
+    def _score(self, post_data):
+        """计算绝对热度 H Score 和相对表现 Z Score"""
+        h_score = self._calc_h_score(
+            post_data["like"],
+            post_data["comment"],
+            post_data["save"],
+            post_data["share"],
+        )
         z_score = 0.0
         if self.has_history:
             z_score = (h_score - self.history_mean) / self.history_std
+        return h_score, z_score
+
+    def _ma_ratio(self, post_data, h_score):
+        """笔记的 H/MA5，优先使用 with_ma_ratios 预先算好的值"""
+        if "ma_ratio" in post_data:
+            return post_data["ma_ratio"]
+        return self.history_window.ratio(h_score)
+
+    def with_ma_ratios(self, posts):
+        """
+        按顺序一次性计算一批笔记的 H/MA5，返回附带 ma_ratio 的笔记副本；
+        批内较早的笔记计入较晚笔记的 MA，已带 ma_ratio 的笔记保持原值
+        """
+        h_scores = np.array(
+            [self._score(post_data)[0] for post_data in posts], dtype=np.float64
+        )
+        sequence = np.concatenate([self.history_window.values(), h_scores])
+        _, ratios = rolling_ma_ratios(sequence, MA_WINDOW)
+        ratios = ratios[len(self.history_window) :]
+        return [
+            dict(post_data, ma_ratio=post_data.get("ma_ratio", float(ratio)))
+            for post_data, ratio in zip(posts, ratios)
+        ]
 
-        # 3. 生成 Prompt
-        prompt = f"""
+    def record_post(self, post_data):
+        """新笔记发布后 O(1) 更新 MA 窗口"""
+        self.history_window.push(self._score(post_data)[0])
+
+    def build_prompt(self, post_data, h_score, z_score):
+        """生成单篇笔记的分析 Prompt"""
+        ma_ratio = self._ma_ratio(post_data, h_score)
+        return f"""
         你是一个量化内容运营专家。请根据以下指标分析这篇笔记：
 
         【当前数据】
         - 标题: {post_data['title']}
         - H Score (绝对热度): {h_score}
         - Z Score (相对表现): {z_score:.2f} (历史均值: {self.history_mean:.2f})
-        - 因子明细: 点赞{like}, 评论{comment}, 收藏{save}, 分享{share}
+        - H/MA{MA_WINDOW} (近期表现): {format_ratio(ma_ratio)} (与此前最近 {MA_WINDOW} 篇 H Score 均值之比)
+        - 因子明细: 点赞{post_data['like']}, 评论{post_data['comment']}, 收藏{post_data['save']}, 分享{post_data['share']}
 
         【判断标准】
-        - Z > 1.0 : 爆款 (Alpha收益) -> 建议追涨/出系列。
-        - Z < -0.5: 跑输大盘 -> 建议止损/改进封面。
-        - 收藏高但Z分低: 属于干货但流量池受限。
+        {JUDGEMENT_CRITERIA}
 
         请输出简短的 JSON 格式建议：
         {{
@@ -169,14 +790,304 @@ class CloudQuantAgent:
         只输出 JSON 字符串。
         """
 
+    def build_batch_prompt(self, entries):
+        """
+        把多篇笔记打包进一个 Prompt，判断标准和输出格式只发送一次
+        entries: [(record_id, post_data, h_score, z_score), ...]
+        """
+        notes = "\n".join(
+            self._batch_entry(record_id, post_data, h_score, z_score)
+            for record_id, post_data, h_score, z_score in entries
+        )
+        return f"""
+        你是一个量化内容运营专家。请根据以下指标分别分析每一篇笔记
+        (H Score 为绝对热度，Z Score 为相对表现，历史均值: {self.history_mean:.2f}；
+        H/MA{MA_WINDOW} 为与此前最近 {MA_WINDOW} 篇 H Score 均值之比，null 表示暂无)：
+
+        【笔记列表】
+        {notes}
+
+        【判断标准】
+        {JUDGEMENT_CRITERIA}
+
+        请输出 JSON 数组，每篇笔记对应一项，record_id 与输入保持一致：
+        [
+            {{
+                "record_id": "笔记的 record_id",
+                "analysis": "一句话评价表现",
+                "action": "下一步具体操作 (如：修改标题/回复评论/准备下一篇)",
+                "next_title": "建议的下期标题"
+            }}
+        ]
+        只输出 JSON 字符串。
+        """
+
+    def _batch_entry(self, record_id, post_data, h_score, z_score):
+        """打包 Prompt 中一篇笔记占一行 JSON"""
+        ma_ratio = self._ma_ratio(post_data, h_score)
+        return json.dumps(
+            {
+                "record_id": record_id,
+                "标题": post_data["title"],
+                "H Score": h_score,
+                "Z Score": round(z_score, 2),
+                f"H/MA{MA_WINDOW}": None if np.isnan(ma_ratio) else round(ma_ratio, 2),
+                "点赞": post_data["like"],
+                "评论": post_data["comment"],
+                "收藏": post_data["save"],
+                "分享": post_data["share"],
+            },
+            ensure_ascii=False,
+        )
+
+    def plan_batches(self, posts, token_budget, max_posts=None):
+        """
+        按 token 预算把笔记装箱成若干打包请求，返回每批笔记在 posts 中的下标
+        每篇笔记的开销 = 其在 Prompt 中的一行 + 预留的输出 token，
+        每批另加一次共用指令的开销；单篇超出预算的笔记独占一批
+        """
+        overhead = self.estimator.estimate(self.build_batch_prompt([]))
+        sizes = []
+        for i, post_data in enumerate(posts):
+            h_score, z_score = self._score(post_data)
+            record_id = str(post_data.get("record_id", i))
+            entry = self._batch_entry(record_id, post_data, h_score, z_score)
+            sizes.append(self.estimator.estimate(entry) + OUTPUT_TOKENS_PER_POST)
+        return pack_batches(sizes, token_budget, overhead=overhead, max_items=max_posts)
+
+    def rule_decisions(self, posts):
+        """
+        规则引擎：对整批笔记向量化计算因子占比和策略标签，
+        返回 {下标: (模板建议, H Score, Z Score)}，只包含能明确判断的笔记
+        没有历史基准时 Z Score 无意义，全部交给 LLM
+        """
+        if not self.has_history or not posts:
+            return {}
+
+        matrix = np.array(
+            [[p["like"], p["comment"], p["save"], p["share"]] for p in posts],
+            dtype=np.float64,
+        )
+        z_scores = (matrix @ FACTOR_WEIGHTS - self.history_mean) / self.history_std
+        labels = classify_strategies(matrix, z_scores)
+        shares = factor_shares(matrix)
+
+        decisions = {}
+        for i in np.flatnonzero(labels != ""):
+            post_data = posts[i]
+            h_score, z_score = self._score(post_data)
+            values = {
+                "z": z_score,
+                "title": post_data["title"],
+                "comment": shares[i, 1],
+                "share": shares[i, 2] + shares[i, 3],
+            }
+            result = {
+                key: template.format(**values)
+                for key, template in RULE_TEMPLATES[labels[i]].items()
+            }
+            decisions[int(i)] = (result, h_score, z_score)
+        return decisions
+
+    def analyze(self, post_data):
+        """
+        Step 2: 分析单条数据，结合 Z-Score
+        """
+        if self.rule_engine:
+            decided = self.rule_decisions([post_data])
+            if decided:
+                return decided[0]
+
+        # 1. 计算 H Score 和 Z Score
+        h_score, z_score = self._score(post_data)
+
+        # 2. 生成 Prompt
+        with default_metrics.span("prompt_build"):
+            prompt = self.build_prompt(post_data, h_score, z_score)
+
+        config = genai.types.GenerateContentConfig(
+            response_mime_type="application/json"
+        )
+
+        # 相同模型、配置和 prompt 的结果直接从缓存返回
+        cache_key = None
+        if self.cache is not None:
+            cache_key = make_cache_key(MODEL_NAME, config, prompt)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                default_metrics.inc("llm_cache_hits")
+                return cached, h_score, z_score
+
         try:
-            resp = self.client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    response_mime_type="application/json"
-                ),
+            resp = self.rate_limiter.call(
+                lambda: self._generate(prompt, config),
+                tokens=self.estimator.estimate(prompt),
             )
-            return json.loads(resp.text), h_score, z_score
+            with default_metrics.span("parse"):
+                result = json.loads(resp.text)
         except Exception as e:
             return {"analysis": f"Error: {str(e)}", "action": "Retry"}, h_score, z_score
+
+        # 只缓存成功的结果，失败的调用下次仍会重试
+        if cache_key is not None:
+            self.cache.set(cache_key, result)
+        return result, h_score, z_score
+
+    def _generate(self, prompt, config):
+        """调用一次 Gemini，记录延迟、请求数和 token 用量"""
+        default_metrics.inc("llm_requests")
+        with default_metrics.span("llm"):
+            response = self.client.models.generate_content(
+                model=MODEL_NAME, contents=prompt, config=config
+            )
+        default_metrics.record_usage(response)
+        return response
+
+    def analyze_batch(self, posts):
+        """
+        把多篇笔记打包成一次 Gemini 请求分析，返回与 posts 顺序一致的
+        [(分析结果, H Score, Z Score), ...]
+
+        响应按 record_id 拆分并逐条校验，缺失或格式不对的笔记单独调用 analyze 补齐；
+        每篇笔记的结果以单篇 Prompt 为键写入缓存，与 analyze 共用
+        """
+        posts = list(posts)
+        results = [None] * len(posts)
+        single_config = genai.types.GenerateContentConfig(
+            response_mime_type="application/json"
+        )
+
+        # 1. 计算分数，已缓存的笔记直接返回
+        todo = []
+        seen = set()
+        for i, post_data in enumerate(posts):
+            h_score, z_score = self._score(post_data)
+            record_id = str(post_data.get("record_id", i))
+            if record_id in seen:
+                record_id = f"{record_id}#{i}"
+            seen.add(record_id)
+
+            cache_key = None
+            if self.cache is not None:
+                prompt = self.build_prompt(post_data, h_score, z_score)
+                cache_key = make_cache_key(MODEL_NAME, single_config, prompt)
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    default_metrics.inc("llm_cache_hits")
+                    results[i] = (cached, h_score, z_score)
+                    continue
+            todo.append((i, record_id, post_data, h_score, z_score, cache_key))
+
+        # 2. 剩余笔记打包成一次请求
+        parsed = {}
+        if len(todo) > 1:
+            entries = [(record_id, post, h, z) for _, record_id, post, h, z, _ in todo]
+            with default_metrics.span("prompt_build"):
+                prompt = self.build_batch_prompt(entries)
+            parsed = self._request_batch(prompt, entries)
+
+        # 3. 拆分结果，校验失败的笔记回退到单篇调用
+        for i, record_id, post_data, h_score, z_score, cache_key in todo:
+            result = parsed.get(record_id)
+            if result is None:
+                results[i] = self.analyze(post_data)
+                continue
+            if cache_key is not None:
+                self.cache.set(cache_key, result)
+            results[i] = (result, h_score, z_score)
+
+        return results
+
+    def _request_batch(self, prompt, entries):
+        """发送打包请求，返回 {record_id: 通过校验的结果}；请求失败时返回空字典"""
+        config = genai.types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=batch_response_schema(),
+        )
+        try:
+            resp = self.rate_limiter.call(
+                lambda: self._generate(prompt, config),
+                tokens=self.estimator.estimate(prompt),
+            )
+            with default_metrics.span("parse"):
+                items = json.loads(resp.text)
+        except Exception as e:
+            return {}
+
+        expected = {record_id for record_id, _, _, _ in entries}
+        parsed = {}
+        for item in items if isinstance(items, list) else []:
+            if not isinstance(item, dict):
+                continue
+            record_id = str(item.get("record_id"))
+            result = {key: item.get(key) for key in ANALYSIS_KEYS}
+            valid = all(isinstance(v, str) and v for v in result.values())
+            if valid and record_id in expected and record_id not in parsed:
+                parsed[record_id] = result
+        return parsed
+
+    def analyze_many(
+        self, posts, max_workers=4, batch_size=1, token_budget=None, on_result=None
+    ):
+        """
+        并发分析多条数据，同时最多 max_workers 个请求在途；
+        batch_size > 1 时每个请求打包多篇笔记 (见 analyze_batch)，
+        给定 token_budget 时按 token 预算装箱 (见 plan_batches)，
+        此时 batch_size > 1 作为每批篇数上限；
+        开启 rule_engine 时先由规则引擎处理能明确判断的笔记
+        on_result(位置, 结果) 在每条 LLM 分析完成时于工作线程中调用
+        返回与 posts 顺序一致的 [(分析结果, H Score, Z Score), ...]
+        """
+        posts = self.with_ma_ratios(list(posts))
+        results = [None] * len(posts)
+
+        # 规则引擎能明确判断的笔记不调用 LLM
+        if self.rule_engine:
+            for i, decision in self.rule_decisions(posts).items():
+                results[i] = decision
+        todo = [i for i, result in enumerate(results) if result is None]
+        pending = [posts[i] for i in todo]
+
+        if token_budget:
+            max_posts = batch_size if batch_size > 1 else None
+            index_chunks = self.plan_batches(pending, token_budget, max_posts=max_posts)
+        else:
+            index_chunks = [
+                list(range(i, min(i + batch_size, len(pending))))
+                for i in range(0, len(pending), batch_size)
+            ]
+
+        def run_chunk(indexes):
+            chunk_result = self._analyze_chunk([pending[i] for i in indexes])
+            for i, result in zip(indexes, chunk_result):
+                results[todo[i]] = result
+                if on_result is not None:
+                    on_result(todo[i], result)
+
+        if max_workers <= 1 or len(index_chunks) <= 1:
+            for indexes in index_chunks:
+                run_chunk(indexes)
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                list(executor.map(run_chunk, index_chunks))
+        return results
+
+    def _analyze_chunk(self, chunk):
+        if len(chunk) > 1:
+            try:
+                return self.analyze_batch(chunk)
+            except Exception as e:
+                pass
+        return [self._analyze_isolated(post) for post in chunk]
+
+    @staticmethod
+    def is_failed_result(result):
+        """分析失败 (需要重试) 的结果不应写回表格"""
+        return result.get("action") == "Retry"
+
+    def _analyze_isolated(self, post_data):
+        """单条分析出错时返回错误结果，不影响同批其他记录"""
+        try:
+            return self.analyze(post_data)
+        except Exception as e:
+            return {"analysis": f"Error: {str(e)}", "action": "Retry"}, None, None
@@ -5,64 +5,549 @@
 
 import json
 import os
+import threading
+import time
 
-from cloud_agent import CloudQuantAgent, FeishuConnector
+from batch_jobs import (
+    JOB_FAILED,
+    JOB_PENDING,
+    GeminiBatchBackend,
+    LocalBatchBackend,
+    clear_job_state,
+    load_job_state,
+    parse_results,
+    save_job_state,
+    write_job_file,
+)
+from cloud_agent import (
+    BASELINE_FIELDS,
+    FEISHU_BASE_URL,
+    MODEL_NAME,
+    PENDING_FIELDS,
+    CloudQuantAgent,
+    FeishuConnector,
+    WriteBackBuffer,
+)
+from factors import MA_WINDOW, RollingWindow
+from journal import RunJournal
+from llm_cache import ResponseCache
+from metrics import default_metrics
+from mirror import BitableMirror
+from pipeline import Pipeline, Stage
+from token_budget import TokenEstimator
+
+# 用于校准 token 估算器的样本篇数
+CALIBRATION_SAMPLES = 8
+
+
+def build_response_cache():
+    """
+    按环境变量创建 LLM 响应缓存：LLM_CACHE_PATH 为 SQLite 文件路径
+    (设为空字符串则只用内存缓存)，LLM_CACHE_BYPASS=1 时跳过缓存
+    """
+    path = os.environ.get("LLM_CACHE_PATH", ".cache/llm_responses.sqlite")
+    bypass = os.environ.get("LLM_CACHE_BYPASS") == "1"
+    if not path:
+        return ResponseCache(bypass=bypass)
+    return ResponseCache.from_path(path, bypass=bypass)
+
+
+def load_token_estimator(path, agent, posts):
+    """
+    读取 token 估算器的校准结果；文件不存在时用 Gemini count_tokens
+    对部分待分析笔记的 Prompt 校准并保存，校准失败 (如离线) 则使用默认系数
+    """
+    if os.path.exists(path):
+        return TokenEstimator.load(path)
+
+    estimator = TokenEstimator()
+    samples = []
+    for i, post in enumerate(posts[:CALIBRATION_SAMPLES]):
+        h_score, z_score = agent._score(post)
+        entry = (str(post.get("record_id", i)), post, h_score, z_score)
+        samples.append(agent.build_batch_prompt([entry]))
+    try:
+        estimator.calibrate(agent.client, samples, model=MODEL_NAME)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        estimator.save(path)
+    except Exception as e:
+        pass
+    return estimator
+
+
+def post_from_record(item):
+    """把多维表格记录转换为 CloudQuantAgent.analyze 的输入"""
+    fields = item["fields"]
+    return {
+        "record_id": item["record_id"],
+        "title": fields.get("标题", "无标题"),
+        "like": fields.get("点赞", 0),
+        "comment": fields.get("评论", 0),
+        "save": fields.get("收藏", 0),
+        "share": fields.get("分享", 0),
+    }
+
+
+def build_batch_backend(agent, directory):
+    """
+    按 BATCH_BACKEND 选择批处理后端：默认 Gemini Batch API；
+    local 为本地目录后端，收集时用交互 API 逐条执行 (用于测试和演练)
+    """
+    if os.environ.get("BATCH_BACKEND", "gemini") == "local":
+
+        def respond(prompt):
+            return agent.client.models.generate_content(
+                model=MODEL_NAME,
+                contents=prompt,
+                config={"response_mime_type": "application/json"},
+            ).text
+
+        return LocalBatchBackend(os.path.join(directory, "local"), respond=respond)
+    return GeminiBatchBackend(agent.client, MODEL_NAME)
+
+
+def job_state_file(job_dir):
+    """已提交、尚未收集的批处理任务状态文件"""
+    return os.path.join(job_dir, "state.json")
+
+
+def submit_batch_job(agent, backend, posts, job_dir):
+    """把全部待分析笔记的 Prompt 写成任务文件并提交，任务状态保存在 job_dir"""
+    prompts = {}
+    for post in agent.with_ma_ratios(posts):
+        h_score, z_score = agent._score(post)
+        prompts[post["record_id"]] = agent.build_prompt(post, h_score, z_score)
+
+    job_file = os.path.join(job_dir, f"job-{int(time.time())}.jsonl")
+    write_job_file(job_file, prompts)
+    job_name = backend.submit(job_file)
+    save_job_state(
+        job_state_file(job_dir),
+        {"job_name": job_name, "job_file": job_file, "record_ids": list(prompts)},
+    )
+    print(f"已提交批处理任务 {job_name}，共 {len(prompts)} 条记录")
+
+
+def mark_written(mirror, writer):
+    """把写回成功的记录在本地镜像中标记为"已分析"，镜像未启用时不做任何事"""
+    if mirror is None:
+        return
+    for record_id, ok in writer.results.items():
+        if ok:
+            mirror.update_fields(record_id, {"状态": "已分析"})
+
+
+def run_pipelined(agent, records, writer, max_workers=4, journal=None):
+    """
+    流水线模式：读取待分析记录、打分、LLM 分析和批量写回同时进行，
+    records 可以是边分页边返回的迭代器；H/MA5 按读取顺序在打分阶段滚动计算
+    records 是按"待分析"过滤的分页查询时，写回会把记录移出查询结果、
+    让后面的分页错位漏读，因此分析结果先暂存，读取结束后才交给 writer
+    返回 (各阶段计数器, 分析失败条数)
+    """
+    window = RollingWindow(MA_WINDOW, agent.history_window.values())
+    failed_analysis = []
+    # 读取结束前的分析结果 (record_id, 建议文本)，只由单线程的写回阶段访问
+    held = []
+    read_done = threading.Event()
+
+    def read():
+        try:
+            yield from records
+        finally:
+            read_done.set()
+
+    def score(item):
+        post = post_from_record(item)
+        h_score, z_score = agent._score(post)
+        post["ma_ratio"] = window.ratio(h_score)
+        window.push(h_score)
+        return post
+
+    def analyze(post):
+        record_id = post["record_id"]
+        if journal is not None and record_id in journal.analyzed:
+            return record_id, journal.analyzed[record_id]
+        analysis_result = agent._analyze_isolated(post)[0]
+        if journal is not None and not agent.is_failed_result(analysis_result):
+            journal.record_analyzed(record_id, analysis_result)
+        return record_id, analysis_result
+
+    def write(item):
+        record_id, analysis_result = item
+        # 分析失败的记录保持"待分析"，留给下一次运行
+        if agent.is_failed_result(analysis_result):
+            failed_analysis.append(record_id)
+            return None
+        held.append(
+            (record_id, json.dumps(analysis_result, ensure_ascii=False, indent=2))
+        )
+        if read_done.is_set():
+            release()
+        return None
+
+    def release():
+        for record_id, ai_suggestion in held:
+            writer.add(record_id, ai_suggestion)
+        held.clear()
+
+    def close():
+        release()
+        writer.flush()
+
+    pipeline = Pipeline(
+        [
+            Stage("score", score),
+            Stage("analyze", analyze, workers=max_workers),
+            Stage("write", write, close=close),
+        ]
+    )
+    stats = pipeline.run(read())
+    return stats, len(failed_analysis)
+
+
+def report_pipeline(stats):
+    """打印流水线各阶段的吞吐量"""
+    for name, stage in stats.items():
+        if name == "wall_time":
+            continue
+        print(
+            f"阶段 {name}: {stage['items']} 条，{stage['rate']:.1f} 条/秒，"
+            f"出错 {stage['errors']} 条"
+        )
+    print(f"流水线总耗时 {stats['wall_time']:.1f} 秒")
+
+
+def finish_write_back(writer, mirror=None, journal=None):
+    """批量写回失败的记录逐条重试，并同步镜像和运行日志"""
+    failed = writer.retry_failed()
+    if failed:
+        print(f"{len(failed)} 条记录写回失败: {', '.join(failed)}")
+    mark_written(mirror, writer)
+    if journal is not None:
+        journal.record_written(
+            record_id for record_id, ok in writer.results.items() if ok
+        )
+        # 只保留写回失败的结果，下次运行直接重试写回
+        journal.compact()
+        journal.close()
+
+
+def collect_batch_job(fs, app_token, table_id, backend, job_dir, mirror=None):
+    """
+    轮询已提交的批处理任务，完成后批量写回结果
+    任务未完成时保留状态等待下次收集；任务失败时清除状态，记录保持"待分析"
+    """
+    state_file = job_state_file(job_dir)
+    state = load_job_state(state_file)
+    if state is None:
+        print("没有待收集的批处理任务")
+        return
+
+    job_name = state["job_name"]
+    status = backend.poll(job_name)
+    if status == JOB_PENDING:
+        print(f"批处理任务 {job_name} 尚未完成")
+        return
+    if status == JOB_FAILED:
+        print(f"批处理任务 {job_name} 失败，记录保留为待分析")
+        clear_job_state(state_file)
+        return
+
+    results = parse_results(backend.fetch(job_name))
+    writer = WriteBackBuffer(fs, app_token, table_id)
+    for record_id in state["record_ids"]:
+        if record_id in results:
+            writer.add(
+                record_id, json.dumps(results[record_id], ensure_ascii=False, indent=2)
+            )
+    writer.flush()
+    failed = writer.retry_failed()
+    if failed:
+        print(f"{len(failed)} 条记录写回失败: {', '.join(failed)}")
+    mark_written(mirror, writer)
+
+    missing = sum(1 for record_id in state["record_ids"] if record_id not in results)
+    if missing:
+        print(f"{missing} 条记录没有有效结果，保留为待分析")
+
+    clear_job_state(state_file)
+    processed_count = sum(1 for ok in writer.results.values() if ok)
+    print(f"处理完成，共分析 {processed_count} 条记录")
+
+
+def report_metrics(snapshot):
+    """打印各阶段耗时分位数和 LLM 调用量"""
+    for name, timing in sorted(snapshot["timings"].items()):
+        print(
+            f"{name}: {timing['count']} 次，共 {timing['sum']:.2f} 秒，"
+            f"p50 {timing['p50']:.3f} / p95 {timing['p95']:.3f} / "
+            f"p99 {timing['p99']:.3f} 秒"
+        )
+    counters = snapshot["counters"]
+    print(
+        f"LLM 请求 {counters.get('llm_requests', 0)} 次 "
+        f"(错误 {counters.get('llm_errors', 0)}，重试 {counters.get('llm_retries', 0)})，"
+        f"prompt {counters.get('llm_prompt_tokens', 0)} tokens，"
+        f"响应 {counters.get('llm_response_tokens', 0)} tokens"
+    )
 
 
 def main():
-    """主运行函数"""
+    """主运行函数：整次运行计时，结束时 (包括出错时) 导出运行指标"""
+    # 运行指标导出目录 (metrics.json 和 Prometheus textfile)，设为空字符串则不导出
+    METRICS_DIR = os.environ.get("METRICS_DIR", ".cache/metrics")
+    default_metrics.reset()
+    try:
+        with default_metrics.span("run"):
+            run_analysis()
+    finally:
+        report_metrics(default_metrics.snapshot())
+        if METRICS_DIR:
+            default_metrics.export(METRICS_DIR)
+
+
+def run_analysis():
+    """一次完整的分析运行"""
     # 从环境变量获取密钥
     FS_APP_ID = os.environ["FS_APP_ID"]
     FS_APP_SECRET = os.environ["FS_APP_SECRET"]
     FS_APP_TOKEN = os.environ["FS_APP_TOKEN"]
     FS_TABLE_ID = os.environ["FS_TABLE_ID"]
     FS_USER_ACCESS_TOKEN = os.environ.get("FS_USER_ACCESS_TOKEN")
+    # 可选：飞书开放平台接口地址 (压测时指向本地替身服务)
+    FS_BASE_URL = os.environ.get("FS_BASE_URL", FEISHU_BASE_URL)
+    # 可选：租户令牌的本地加密缓存文件，连续运行时复用令牌
+    FS_TOKEN_CACHE_FILE = os.environ.get("FS_TOKEN_CACHE_FILE")
+    # 同时在途的 Gemini 请求数上限
+    ANALYSIS_CONCURRENCY = int(os.environ.get("ANALYSIS_CONCURRENCY", "4"))
+    # 每个 Gemini 请求打包的笔记数，1 表示逐篇分析
+    ANALYSIS_BATCH_SIZE = int(os.environ.get("ANALYSIS_BATCH_SIZE", "1"))
+    # 每个打包请求的 token 预算 (含输出)，0 表示按 ANALYSIS_BATCH_SIZE 固定篇数打包
+    ANALYSIS_TOKEN_BUDGET = int(os.environ.get("ANALYSIS_TOKEN_BUDGET", "0"))
+    # token 估算器校准结果文件
+    TOKEN_ESTIMATOR_FILE = os.environ.get(
+        "TOKEN_ESTIMATOR_FILE", ".cache/token_estimator.json"
+    )
+    # 运行模式：online 交互调用；submit 提交离线批处理任务；collect 收集结果并写回
+    ANALYSIS_MODE = os.environ.get("ANALYSIS_MODE", "online")
+    # 批处理任务文件和任务状态目录
+    BATCH_JOB_DIR = os.environ.get("BATCH_JOB_DIR", ".cache/batch_jobs")
+    # 历史基准的增量统计状态文件，设为空字符串则每次全量重建
+    BASELINE_STATE_FILE = os.environ.get(
+        "BASELINE_STATE_FILE", ".cache/baseline_state.json"
+    )
+    # 多维表格本地镜像 (SQLite)，设为空字符串则每次直接从飞书读取
+    MIRROR_PATH = os.environ.get("MIRROR_PATH", ".cache/bitable_mirror.sqlite")
+    # 表格中"最后更新时间"类型字段的名称，用于增量同步
+    FS_MODIFIED_FIELD = os.environ.get("FS_MODIFIED_FIELD", "最后更新时间")
+    # 运行日志：记录已付费的分析结果和写回状态，中断后重跑时复用，设为空字符串则关闭
+    JOURNAL_FILE = os.environ.get("JOURNAL_FILE", ".cache/run_journal.jsonl")
+    # 流水线模式：读取、打分、分析和写回并发进行 (逐篇分析，不做打包)
+    ANALYSIS_PIPELINE = os.environ.get("ANALYSIS_PIPELINE") == "1"
+    # 规则引擎：决策矩阵能明确判断的记录直接套用模板，不调用 LLM (RULE_ENGINE=0 关闭)
+    RULE_ENGINE = os.environ.get("RULE_ENGINE", "1") != "0"
 
     # 初始化连接器和代理
-    fs = FeishuConnector(FS_APP_ID, FS_APP_SECRET, FS_USER_ACCESS_TOKEN)
-    agent = CloudQuantAgent()
+    fs = FeishuConnector(
+        FS_APP_ID,
+        FS_APP_SECRET,
+        FS_USER_ACCESS_TOKEN,
+        token_cache_file=FS_TOKEN_CACHE_FILE,
+        base_url=FS_BASE_URL,
+    )
+    agent = CloudQuantAgent(cache=build_response_cache(), rule_engine=RULE_ENGINE)
+    mirror = BitableMirror(MIRROR_PATH) if MIRROR_PATH else None
 
-    # 获取记录
-    records = fs.get_records(FS_APP_TOKEN, FS_TABLE_ID)
-    if not records:
-        print("未获取到任何记录")
+    if ANALYSIS_MODE == "collect":
+        backend = build_batch_backend(agent, BATCH_JOB_DIR)
+        collect_batch_job(
+            fs, FS_APP_TOKEN, FS_TABLE_ID, backend, BATCH_JOB_DIR, mirror=mirror
+        )
         return
+    if ANALYSIS_MODE == "submit":
+        # 上一个任务收集前不再提交，避免同一批记录被重复分析
+        state = load_job_state(job_state_file(BATCH_JOB_DIR))
+        if state is not None:
+            print(f"已有未收集的批处理任务 {state['job_name']}，跳过提交")
+            return
 
-    # 构建历史基准线
-    agent.build_history_baseline(records)
-
-    # 处理待分析记录
-    processed_count = 0
-    for item in records:
-        fields = item["fields"]
-        record_id = item["record_id"]
-        status = fields.get("状态", "")
-
-        if status == "待分析":
-            post_data = {
-                "title": fields.get("标题", "无标题"),
-                "like": fields.get("点赞", 0),
-                "comment": fields.get("评论", 0),
-                "save": fields.get("收藏", 0),
-                "share": fields.get("分享", 0),
-            }
-
-            # 分析数据
-            analysis_result, h_score, z_score = agent.analyze(post_data)
-
-            # 转换为JSON字符串
-            ai_suggestion_text = json.dumps(
-                analysis_result, ensure_ascii=False, indent=2
-            )
+    def report_progress(fetched, total):
+        print(f"已读取 {fetched}/{total} 条记录")
 
-            # 更新记录
-            success = fs.update_record(
-                FS_APP_TOKEN, FS_TABLE_ID, record_id, ai_suggestion_text
+    if mirror is not None:
+        # 只拉取上次同步之后修改过的记录，基准和待分析记录都从本地镜像读取
+        stats = mirror.sync(
+            fs,
+            FS_APP_TOKEN,
+            FS_TABLE_ID,
+            field_names=PENDING_FIELDS,
+            modified_field=FS_MODIFIED_FIELD,
+            on_progress=report_progress,
+        )
+        print(
+            f"镜像同步 ({stats['mode']})：拉取 {stats['fetched']} 条，"
+            f"变化 {stats['changed']} 条，删除 {stats['deleted']} 条"
+        )
+        if fs.last_error is not None:
+            print(f"镜像同步未完成 ({fs.last_error})，使用本地镜像中已有的记录")
+        baseline_records = mirror.records("已分析")
+    else:
+        # 服务端只返回"已分析"记录的数字字段，边下载边累积
+        baseline_records = fs.iter_records(
+            FS_APP_TOKEN,
+            FS_TABLE_ID,
+            on_progress=report_progress,
+            filter_formula=fs.status_filter("已分析"),
+            field_names=BASELINE_FIELDS,
+        )
+
+    # 构建历史基准线：有上次的基准状态时只对新增、变化和消失的记录做增量更新
+    incremental = bool(BASELINE_STATE_FILE) and agent.load_baseline_state(
+        BASELINE_STATE_FILE
+    )
+    # 镜像同步已自行处理读取中断；直接从飞书读取时按 last_error 判断是否读完
+    finished = agent.build_history_baseline(
+        baseline_records,
+        incremental=incremental,
+        complete=None if mirror is not None else lambda: fs.last_error is None,
+    )
+    # 基准记录没有读完时 Z Score 不可信，终止本次运行，也不保存基准状态
+    if not finished:
+        print(f"读取历史基准记录失败 ({fs.last_error})，本次运行终止")
+        return
+    if BASELINE_STATE_FILE:
+        agent.save_baseline_state(BASELINE_STATE_FILE)
+
+    # 流水线模式：待分析记录边读取边打分、分析和写回
+    if ANALYSIS_PIPELINE and ANALYSIS_MODE == "online":
+        journal = RunJournal(JOURNAL_FILE) if JOURNAL_FILE else None
+        if mirror is not None:
+            records = mirror.records("待分析")
+        else:
+            # 边分页读取边分析
+            records = fs.iter_records(
+                FS_APP_TOKEN,
+                FS_TABLE_ID,
+                filter_formula=fs.status_filter("待分析"),
+                field_names=PENDING_FIELDS,
             )
+        writer = WriteBackBuffer(fs, FS_APP_TOKEN, FS_TABLE_ID)
+        stats, failed_analysis = run_pipelined(
+            agent, records, writer, max_workers=ANALYSIS_CONCURRENCY, journal=journal
+        )
+        report_pipeline(stats)
+        if mirror is None and fs.last_error is not None:
+            print(f"读取待分析记录中断 ({fs.last_error})，未读取的记录留给下次运行")
+        finish_write_back(writer, mirror, journal)
+        if failed_analysis:
+            print(f"{failed_analysis} 条记录分析失败，保留为待分析")
+        processed_count = sum(1 for ok in writer.results.values() if ok)
+        print(f"处理完成，共分析 {processed_count} 条记录")
+        return
+
+    # 获取待分析记录
+    if mirror is not None:
+        pending_records = mirror.records("待分析")
+    else:
+        pending_records = fs.get_records(
+            FS_APP_TOKEN,
+            FS_TABLE_ID,
+            filter_formula=fs.status_filter("待分析"),
+            field_names=PENDING_FIELDS,
+        )
+        if fs.last_error is not None:
+            print(f"读取待分析记录失败 ({fs.last_error})")
+            if pending_records:
+                print(f"只处理已读取的 {len(pending_records)} 条记录")
+            else:
+                return
+    if not pending_records:
+        print("未获取到任何待分析记录")
+        return
+
+    posts = [post_from_record(item) for item in pending_records]
+    if ANALYSIS_MODE == "submit":
+        # 规则引擎能明确判断的记录直接写回，其余提交离线批处理任务
+        decided = agent.rule_decisions(posts) if agent.rule_engine else {}
+        if decided:
+            with WriteBackBuffer(fs, FS_APP_TOKEN, FS_TABLE_ID) as writer:
+                for i, (result, h_score, z_score) in decided.items():
+                    writer.add(
+                        posts[i]["record_id"],
+                        json.dumps(result, ensure_ascii=False, indent=2),
+                    )
+            writer.retry_failed()
+            mark_written(mirror, writer)
+            print(f"规则引擎直接处理 {len(decided)} 条记录")
+
+        posts = [post for i, post in enumerate(posts) if i not in decided]
+        if posts:
+            backend = build_batch_backend(agent, BATCH_JOB_DIR)
+            submit_batch_job(agent, backend, posts, BATCH_JOB_DIR)
+        return
+
+    # 上次运行中断时已分析但未写回 (或写回后未确认) 的记录直接复用结果，不再调用 LLM
+    journal = RunJournal(JOURNAL_FILE) if JOURNAL_FILE else None
+    replayed = {}
+    if journal is not None:
+        replayed = {
+            i: (journal.analyzed[post["record_id"]], None, None)
+            for i, post in enumerate(posts)
+            if post["record_id"] in journal.analyzed
+        }
+        if replayed:
+            print(f"从运行日志恢复 {len(replayed)} 条已分析记录")
+
+    # MA 在完整的待分析序列上计算，复用的记录仍计入后续笔记的 MA
+    posts = agent.with_ma_ratios(posts)
+    todo = [i for i in range(len(posts)) if i not in replayed]
+    todo_posts = [posts[i] for i in todo]
+
+    def journal_result(i, result):
+        # 分析结果落盘后才算完成，失败的结果留给下次重新分析
+        if journal is not None and not agent.is_failed_result(result[0]):
+            journal.record_analyzed(todo_posts[i]["record_id"], result[0])
+
+    # 并发分析待分析记录，结果按原顺序进入回写缓冲区，批量写回
+    if ANALYSIS_TOKEN_BUDGET:
+        agent.estimator = load_token_estimator(TOKEN_ESTIMATOR_FILE, agent, todo_posts)
+    results = dict(replayed)
+    todo_results = agent.analyze_many(
+        todo_posts,
+        max_workers=ANALYSIS_CONCURRENCY,
+        batch_size=ANALYSIS_BATCH_SIZE,
+        token_budget=ANALYSIS_TOKEN_BUDGET,
+        on_result=journal_result,
+    )
+    results.update(zip(todo, todo_results))
+
+    writer = WriteBackBuffer(fs, FS_APP_TOKEN, FS_TABLE_ID)
+    failed_analysis = 0
+    for i, item in enumerate(pending_records):
+        analysis_result, h_score, z_score = results[i]
+        # 分析失败的记录保持"待分析"，留给下一次运行
+        if agent.is_failed_result(analysis_result):
+            failed_analysis += 1
+            continue
+
+        # 转换为JSON字符串
+        ai_suggestion_text = json.dumps(analysis_result, ensure_ascii=False, indent=2)
+
+        writer.add(item["record_id"], ai_suggestion_text)
+
+    writer.flush()
+    finish_write_back(writer, mirror, journal)
+
+    if failed_analysis:
+        print(f"{failed_analysis} 条记录分析失败，保留为待分析")
 
-            if success:
-                processed_count += 1
+    cache_stats = agent.cache.stats()
+    print(f"LLM 缓存命中 {cache_stats['hits']} 次，未命中 {cache_stats['misses']} 次")
 
+    processed_count = sum(1 for ok in writer.results.values() if ok)
     print(f"处理完成，共分析 {processed_count} 条记录")
 
 
@@ -0,0 +1,246 @@
+"""
+量化因子引擎 - 干货热度指数 (H Score) 的列式实现
+"""
+
+import numpy as np
+
+from lazy_import import lazy_import
+
+# pandas 只在输入为 DataFrame 时用到，云端路径 (dict 记录) 不需要加载
+pd = lazy_import("pandas")
+
+# 因子列与权重 (Factor Weights)，两者顺序一一对应
+# H = (Like * 1) + (Comment * 4) + (Save * 5) + (Share * 10)
+FACTOR_COLUMNS = ["like", "comment", "save", "share"]
+FACTOR_WEIGHTS = np.array([1.0, 4.0, 5.0, 10.0])
+
+
+def factor_matrix(df, columns=FACTOR_COLUMNS):
+    """
+    把 DataFrame 中的因子列整理成 (N x 4) 的浮点矩阵
+    缺失的列按 0 处理，非数字的单元格视为 NaN
+    """
+    matrix = np.zeros((len(df), len(columns)), dtype=np.float64)
+    for i, col in enumerate(columns):
+        if col in df:
+            matrix[:, i] = pd.to_numeric(df[col], errors="coerce").to_numpy(
+                dtype=np.float64
+            )
+    return matrix
+
+
+def compute_h_scores(df, columns=FACTOR_COLUMNS):
+    """
+    对整张表一次性计算 H Score：因子矩阵与权重向量做一次点积
+    """
+    return factor_matrix(df, columns) @ FACTOR_WEIGHTS
+
+
+def score_stats(scores):
+    """
+    计算 H Score 分布的均值和标准差 (样本标准差，与 pandas 默认一致)
+    NaN 会被忽略
+    """
+    valid = scores[~np.isnan(scores)]
+    if len(valid) == 0:
+        return float("nan"), float("nan")
+    mean = float(valid.mean())
+    std = float(valid.std(ddof=1)) if len(valid) > 1 else float("nan")
+    return mean, std
+
+
+# 决策矩阵的策略标签，空字符串表示规则无法确定，需要交给 LLM 判断
+STRATEGY_CHASE = "追涨"
+STRATEGY_STOP = "止损"
+STRATEGY_ENGAGE = "互动"
+
+
+def factor_shares(matrix):
+    """
+    各因子对 H Score 的贡献占比 (N x 4)，每行之和为 1
+    H Score 为 0 或含 NaN 的行全部为 0
+    """
+    contributions = matrix * FACTOR_WEIGHTS
+    h_scores = contributions.sum(axis=1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shares = np.where(h_scores > 0, contributions / h_scores, 0.0)
+    return np.nan_to_num(shares)
+
+
+def classify_strategies(matrix, z_scores, high_z=1.0, low_z=-0.5, dominance=0.6):
+    """
+    按决策矩阵对整批帖子打策略标签：
+    - Z < low_z -> 止损
+    - Z > high_z 且收藏+分享的贡献占比 >= dominance -> 追涨
+    - Z > high_z 且评论的贡献占比 >= dominance -> 互动
+    其余 (Z 处于中间地带、没有明显主导因子或数据缺失) 为空字符串
+    """
+    shares = factor_shares(matrix)
+    z_scores = np.asarray(z_scores, dtype=np.float64)
+    high = z_scores > high_z
+    return np.select(
+        [
+            z_scores < low_z,
+            high & (shares[:, 2] + shares[:, 3] >= dominance),
+            high & (shares[:, 1] >= dominance),
+        ],
+        [STRATEGY_STOP, STRATEGY_CHASE, STRATEGY_ENGAGE],
+        default="",
+    )
+
+
+# H/MA_k 相对表现因子：每篇笔记的 H 与其之前最近 k 篇笔记 H 均值之比
+MA_WINDOW = 5
+# 可用于确定发布顺序的时间列 (按先后排序)，都不存在时按数据原有顺序
+PUBLISH_TIME_COLUMNS = ["publish_time", "发布时间"]
+
+
+def publication_order(df):
+    """返回按发布时间排序的行位置；没有时间列时为原顺序"""
+    for col in PUBLISH_TIME_COLUMNS:
+        if col in df:
+            times = pd.to_datetime(df[col], errors="coerce")
+            return np.argsort(times.to_numpy(), kind="stable")
+    return np.arange(len(df))
+
+
+def rolling_ma_ratios(h_scores, window=MA_WINDOW):
+    """
+    按发布顺序一次性计算每篇笔记的 MA_k 和 H/MA_k (前缀和实现，O(N))
+    MA_k 取该笔记之前最近 k 篇 (不足 k 篇时取已有的)，不包含笔记本身；
+    第一篇或 MA_k <= 0 时比值为 NaN
+    """
+    h_scores = np.asarray(h_scores, dtype=np.float64)
+    prefix = np.concatenate([[0.0], np.cumsum(np.nan_to_num(h_scores))])
+    positions = np.arange(len(h_scores))
+    starts = np.maximum(positions - window, 0)
+    counts = positions - starts
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ma = (prefix[positions] - prefix[starts]) / counts
+        ratios = np.where(ma > 0, h_scores / ma, np.nan)
+    return ma, ratios
+
+
+def format_ratio(ratio):
+    """写入 Prompt 的 H/MA 比值，无法计算时为 "暂无" """
+    return "暂无" if ratio is None or np.isnan(ratio) else f"{ratio:.2f}"
+
+
+class RollingWindow:
+    """
+    最近 k 篇笔记 H Score 的环形缓冲区，新笔记到达时 O(1) 更新窗口均值
+    """
+
+    def __init__(self, window=MA_WINDOW, values=()):
+        self.window = window
+        self._buffer = np.zeros(window, dtype=np.float64)
+        self._next = 0
+        self._count = 0
+        self._sum = 0.0
+        for value in list(values)[-window:]:
+            self.push(value)
+
+    def push(self, h_score):
+        """追加一篇笔记，窗口满时挤出最早的一篇"""
+        h_score = float(np.nan_to_num(h_score))
+        if self._count == self.window:
+            self._sum -= self._buffer[self._next]
+        else:
+            self._count += 1
+        self._buffer[self._next] = h_score
+        self._sum += h_score
+        self._next = (self._next + 1) % self.window
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def mean(self):
+        """当前窗口的 MA_k，窗口为空时为 NaN"""
+        return self._sum / self._count if self._count else float("nan")
+
+    def ratio(self, h_score):
+        """新笔记相对当前窗口的 H/MA_k"""
+        mean = self.mean
+        return h_score / mean if mean > 0 else float("nan")
+
+    def values(self):
+        """按发布先后返回窗口内的 H Score"""
+        start = (self._next - self._count) % self.window
+        return np.roll(self._buffer, -start)[: self._count]
+
+
+class RunningStats:
+    """
+    H Score 分布的增量统计 (Welford 算法)：count / mean / M2，附带最小值和最大值
+    支持逐条加入、移除、替换，合并多个分片的统计量，并可序列化到状态文件
+    移除记录后 min/max 不会收缩，表示曾经出现过的极值
+    """
+
+    def __init__(self, count=0, mean=0.0, m2=0.0, min=None, max=None):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.min = min
+        self.max = max
+
+    def push(self, value):
+        value = float(value)
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def remove(self, value):
+        """移除一条之前加入过的记录"""
+        value = float(value)
+        if self.count <= 1:
+            self.count, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        mean = (self.count * self.mean - value) / (self.count - 1)
+        self.m2 = max(self.m2 - (value - self.mean) * (value - mean), 0.0)
+        self.mean = mean
+        self.count -= 1
+
+    def replace(self, old_value, new_value):
+        """记录的指标变化时修正统计量"""
+        self.remove(old_value)
+        self.push(new_value)
+
+    def merge(self, other):
+        """合并另一个分片的统计量 (Chan 并行算法)，返回 self"""
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta**2 * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def std(self, ddof=0):
+        """标准差，默认为总体标准差 (与 np.std 一致)"""
+        if self.count - ddof <= 0:
+            return float("nan")
+        return float(np.sqrt(self.m2 / (self.count - ddof)))
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "m2": self.m2,
+            "min": self.min,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
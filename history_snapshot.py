@@ -0,0 +1,104 @@
+"""
+历史基准快照 - 把历史 CSV 的 H Score 向量 (按发布顺序) 和统计量保存为
+NumPy 二进制文件 + JSON 元数据，放在 CSV 旁边；CSV 未变化时直接内存映射读取，
+短时运行不必再解析整个 CSV，大规模历史也不需要整张载入 DataFrame
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from atomic_write import write_atomic
+
+# 快照格式版本，格式变化时旧快照自动失效
+SNAPSHOT_VERSION = 1
+
+
+class HistorySnapshot:
+    """
+    rows: 历史帖子条数
+    mean / std: 历史 H Score 的均值和样本标准差 (与 factors.score_stats 一致)
+    scores: 按发布顺序排列的 H Score (只读内存映射数组)
+    """
+
+    def __init__(self, rows, mean, std, scores):
+        self.rows = rows
+        self.mean = mean
+        self.std = std
+        self.scores = scores
+
+
+def snapshot_paths(history_file):
+    """快照文件路径：(H Score 数组, 元数据)"""
+    return history_file + ".hscore.npy", history_file + ".hscore.json"
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def save_snapshot(history_file, scores, mean, std):
+    """
+    为 history_file 写出快照，scores 需按发布顺序排列；
+    先写数组再写元数据，两者都经临时文件替换，元数据即提交标记。
+    写入失败 (如目录只读) 时返回 False
+    """
+    scores_path, meta_path = snapshot_paths(history_file)
+    try:
+        stat = os.stat(history_file)
+        meta = {
+            "version": SNAPSHOT_VERSION,
+            "source": {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": file_digest(history_file),
+            },
+            "rows": len(scores),
+            "mean": mean,
+            "std": std,
+        }
+        temp_path = scores_path + ".tmp"
+        with open(temp_path, "wb") as f:
+            np.save(f, np.asarray(scores, dtype=np.float64))
+        os.replace(temp_path, scores_path)
+        write_atomic(meta_path, json.dumps(meta))
+    except OSError as e:
+        return False
+    return True
+
+
+def load_snapshot(history_file):
+    """
+    读取 history_file 的快照，CSV 与快照记录的大小和修改时间一致时有效；
+    修改时间变化但大小不变时 (如重新检出) 比对内容哈希，一致则更新元数据后继续使用。
+    快照不存在、已过期或损坏时返回 None
+    """
+    scores_path, meta_path = snapshot_paths(history_file)
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        stat = os.stat(history_file)
+        source = meta["source"]
+        if meta["version"] != SNAPSHOT_VERSION or source["size"] != stat.st_size:
+            return None
+        if source["mtime_ns"] != stat.st_mtime_ns:
+            if file_digest(history_file) != source["sha256"]:
+                return None
+            source["mtime_ns"] = stat.st_mtime_ns
+            write_atomic(meta_path, json.dumps(meta))
+
+        rows = meta["rows"]
+        # 空数组无法内存映射
+        scores = np.load(scores_path, mmap_mode="r" if rows else None)
+        if scores.shape != (rows,):
+            return None
+        return HistorySnapshot(rows, meta["mean"], meta["std"], scores)
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
@@ -0,0 +1,113 @@
+"""
+运行日志 - 只追加的 JSONL 日志，记录每条记录的分析结果和写回状态，
+运行中断后下次运行直接复用已付费的分析结果，只对剩余记录调用 LLM
+"""
+
+import json
+import os
+import threading
+
+# 日志事件类型
+EVENT_ANALYZED = "analyzed"
+EVENT_WRITTEN = "written"
+
+
+class RunJournal:
+    """
+    每个事件一行 JSON，写入后立即 fsync，进程被杀死时最多丢失正在写的一行
+    (读取时忽略不完整的行)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        # {record_id: 分析结果}，以及已成功写回的 record_id
+        self.analyzed = {}
+        self.written = set()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._replay()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _replay(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                    self._apply(event)
+                except (ValueError, KeyError, TypeError):
+                    # 崩溃时写了一半的行
+                    continue
+
+    def _apply(self, event):
+        record_id = event["record_id"]
+        if event["event"] == EVENT_ANALYZED:
+            self.analyzed[record_id] = event["result"]
+            self.written.discard(record_id)
+        elif event["event"] == EVENT_WRITTEN:
+            self.written.add(record_id)
+
+    def _append(self, events):
+        lines = "".join(
+            json.dumps(event, ensure_ascii=False) + "\n" for event in events
+        )
+        with self._lock:
+            self._file.write(lines)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            for event in events:
+                self._apply(event)
+
+    def record_analyzed(self, record_id, result):
+        """记录一条分析结果 (可在分析线程中调用)"""
+        self._append(
+            [{"event": EVENT_ANALYZED, "record_id": record_id, "result": result}]
+        )
+
+    def record_written(self, record_ids):
+        """记录一批写回成功的记录"""
+        events = [
+            {"event": EVENT_WRITTEN, "record_id": record_id} for record_id in record_ids
+        ]
+        if events:
+            self._append(events)
+
+    def unwritten(self):
+        """已分析但尚未写回的 {record_id: 分析结果}"""
+        with self._lock:
+            return {
+                record_id: result
+                for record_id, result in self.analyzed.items()
+                if record_id not in self.written
+            }
+
+    def compact(self):
+        """
+        运行结束时重写日志，只保留尚未写回的结果；全部写回后日志为空，
+        之后被重新标记为"待分析"的记录会重新分析
+        """
+        remaining = self.unwritten()
+        with self._lock:
+            self._file.close()
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                for record_id, result in remaining.items():
+                    event = {
+                        "event": EVENT_ANALYZED,
+                        "record_id": record_id,
+                        "result": result,
+                    }
+                    f.write(json.dumps(event, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+            self.analyzed, self.written = remaining, set()
+            self._file = open(self.path, "a", encoding="utf-8")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,60 @@
+"""
+延迟导入 - 模块在第一次访问属性时才真正执行，
+让不调用 LLM 的运行 (如没有待分析记录的定时任务) 和命令行工具快速启动
+"""
+
+import importlib.util
+import sys
+import threading
+import types
+
+# 串行化延迟模块的首次加载：Python 3.11 的 LazyLoader 在开始执行模块时就换回
+# 普通模块类型，并发的工作线程可能看到尚未执行完的空模块
+_lock = threading.RLock()
+# 正在执行的延迟模块 (id)，执行期间模块自身的属性访问直接放行
+_loading = set()
+
+
+class _LockedLazyModule(types.ModuleType):
+    def __getattribute__(self, attr):
+        with _lock:
+            if type(self) is _LockedLazyModule and id(self) not in _loading:
+                _loading.add(id(self))
+                try:
+                    spec = types.ModuleType.__getattribute__(self, "__spec__")
+                    # LazyLoader 已把 spec.loader 换回真正的加载器
+                    spec.loader.exec_module(self)
+                    self.__class__ = types.ModuleType
+                finally:
+                    _loading.discard(id(self))
+        return types.ModuleType.__getattribute__(self, attr)
+
+
+class _LockedLazyLoader(importlib.util.LazyLoader):
+    def exec_module(self, module):
+        super().exec_module(module)
+        module.__class__ = _LockedLazyModule
+
+
+def lazy_import(name):
+    """
+    返回模块 name 的延迟加载版本 (importlib.util.LazyLoader)：
+    导入时只查找模块文件，第一次访问属性时才执行模块代码；已导入的模块直接返回
+
+    name 为子模块时父包会被正常导入，所以只对包本身使用，
+    子模块通过包的属性访问 (如 genai.types)
+    """
+    with _lock:
+        module = sys.modules.get(name)
+        if module is not None:
+            return module
+
+        spec = importlib.util.find_spec(name)
+        if spec is None:
+            raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+        loader = _LockedLazyLoader(spec.loader)
+        spec.loader = loader
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        loader.exec_module(module)
+        return module
@@ -0,0 +1,137 @@
+"""
+运行指标 - 各阶段计时 (span) 与延迟分位数 (p50/p95/p99)、请求/错误/重试计数、
+LLM 的 prompt/响应 token 用量，运行结束时导出为 JSON 和 Prometheus textfile 格式
+"""
+
+import json
+import math
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from atomic_write import write_atomic
+
+# 导出的延迟分位数
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Metrics:
+    """线程安全的计数器和计时样本集合，两个 agent 和飞书连接器共用 default_metrics"""
+
+    def __init__(self, prefix="rednote"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.timings = {}
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.timings = {}
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            self.timings.setdefault(name, []).append(seconds)
+
+    @contextmanager
+    def span(self, name):
+        """计时一个阶段；阶段内抛出异常时计入 {name}_errors 后继续抛出"""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc(f"{name}_errors")
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def record_usage(self, response, name="llm"):
+        """
+        累计 Gemini 响应 usage_metadata 中的 prompt / 响应 token 数，
+        取不到整数 (如离线或被 mock) 时忽略
+        """
+        usage = getattr(response, "usage_metadata", None)
+        for field, counter in (
+            ("prompt_token_count", "prompt_tokens"),
+            ("candidates_token_count", "response_tokens"),
+        ):
+            value = getattr(usage, field, None)
+            if isinstance(value, int):
+                self.inc(f"{name}_{counter}", value)
+
+    def summary(self, name):
+        """某个阶段的次数、总耗时、最大值和各分位数 (秒)"""
+        with self._lock:
+            samples = sorted(self.timings.get(name, ()))
+        result = {
+            "count": len(samples),
+            "sum": sum(samples),
+            "max": samples[-1] if samples else 0.0,
+        }
+        for q in QUANTILES:
+            result[f"p{round(q * 100)}"] = _quantile(samples, q)
+        return result
+
+    def snapshot(self):
+        """{"counters": {...}, "timings": {阶段: summary}}"""
+        with self._lock:
+            counters = dict(self.counters)
+            names = list(self.timings)
+        return {
+            "counters": counters,
+            "timings": {name: self.summary(name) for name in names},
+        }
+
+    def to_prometheus(self):
+        """Prometheus textfile 格式：计数器为 counter，阶段耗时为 summary"""
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot["counters"].items()):
+            metric = f"{self.prefix}_{_metric_name(name)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        for name, summary in sorted(snapshot["timings"].items()):
+            metric = f"{self.prefix}_{_metric_name(name)}_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for q in QUANTILES:
+                value = summary[f"p{round(q * 100)}"]
+                lines.append(f'{metric}{{quantile="{q}"}} {value:.6f}')
+            lines.append(f"{metric}_sum {summary['sum']:.6f}")
+            lines.append(f"{metric}_count {summary['count']}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, directory):
+        """
+        写出 metrics.json 和 {prefix}.prom，先写临时文件再替换，
+        避免 node_exporter 读到写了一半的文件；返回两个文件路径
+        """
+        os.makedirs(directory, exist_ok=True)
+        json_path = os.path.join(directory, "metrics.json")
+        prom_path = os.path.join(directory, f"{self.prefix}.prom")
+        write_atomic(
+            json_path, json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+        )
+        write_atomic(prom_path, self.to_prometheus())
+        return json_path, prom_path
+
+
+def _quantile(samples, q):
+    """已排序样本的最近秩分位数，没有样本时为 0"""
+    if not samples:
+        return 0.0
+    rank = max(math.ceil(q * len(samples)), 1)
+    return samples[rank - 1]
+
+
+def _metric_name(name):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+# 进程内共用的指标集合
+default_metrics = Metrics()
@@ -0,0 +1,211 @@
+"""
+多维表格本地镜像 - 以 record_id 为键的 SQLite 副本，按最后修改时间增量同步，
+历史基准和待分析记录都从本地带索引的副本读取
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# 定期做一次全量同步，用来发现表格中被删除的记录
+FULL_SYNC_INTERVAL = 7 * 24 * 3600
+# 增量同步时向前多取一天，抵消筛选公式只能精确到天和时区差异
+SYNC_OVERLAP = 24 * 3600
+
+
+class BitableMirror:
+    """多维表格的本地 SQLite 镜像"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            "record_id TEXT PRIMARY KEY, status TEXT, fields TEXT NOT NULL, "
+            "created_time INTEGER, last_modified INTEGER)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_status ON records (status, created_time)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self._conn.commit()
+
+    def get_meta(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM meta WHERE key = ?", (key,)
+            ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_meta(self, key, value):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, json.dumps(value))
+            )
+            self._conn.commit()
+
+    def upsert(self, items):
+        """
+        写入多维表格返回的记录 (需带 automatic_fields)，
+        最后修改时间没有变化的记录跳过，返回实际变化的记录
+        """
+        changed = []
+        with self._lock:
+            for item in items:
+                record_id = item["record_id"]
+                last_modified = item.get("last_modified_time")
+                row = self._conn.execute(
+                    "SELECT last_modified FROM records WHERE record_id = ?",
+                    (record_id,),
+                ).fetchone()
+                if row and last_modified is not None and row[0] == last_modified:
+                    continue
+                fields = item.get("fields") or {}
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?)",
+                    (
+                        record_id,
+                        fields.get("状态", ""),
+                        json.dumps(fields, ensure_ascii=False),
+                        item.get("created_time"),
+                        last_modified,
+                    ),
+                )
+                changed.append(item)
+            self._conn.commit()
+        return changed
+
+    def delete(self, record_ids):
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM records WHERE record_id = ?",
+                [(record_id,) for record_id in record_ids],
+            )
+            self._conn.commit()
+
+    def record_ids(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT record_id FROM records").fetchall()
+        return {row[0] for row in rows}
+
+    def update_fields(self, record_id, fields):
+        """本地回写后同步更新镜像 (例如状态改为"已分析")"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fields FROM records WHERE record_id = ?", (record_id,)
+            ).fetchone()
+            if row is None:
+                return
+            merged = dict(json.loads(row[0]), **fields)
+            self._conn.execute(
+                "UPDATE records SET fields = ?, status = ? WHERE record_id = ?",
+                (
+                    json.dumps(merged, ensure_ascii=False),
+                    merged.get("状态", ""),
+                    record_id,
+                ),
+            )
+            self._conn.commit()
+
+    def records(self, status=None):
+        """按创建顺序返回 {"record_id", "fields"} 格式的记录，可按状态筛选"""
+        query = "SELECT record_id, fields FROM records"
+        params = ()
+        if status is not None:
+            query += " WHERE status = ?"
+            params = (status,)
+        query += " ORDER BY created_time, rowid"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [
+            {"record_id": record_id, "fields": json.loads(fields)}
+            for record_id, fields in rows
+        ]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def sync(
+        self,
+        connector,
+        app_token,
+        table_id,
+        field_names=None,
+        modified_field="最后更新时间",
+        full_sync_interval=FULL_SYNC_INTERVAL,
+        on_progress=None,
+    ):
+        """
+        从多维表格同步到本地：有检查点时只拉取检查点之后修改过的记录，
+        没有检查点、距上次全量同步超过 full_sync_interval，
+        或增量拉取失败 (例如表格没有修改时间字段) 时全量同步并删除本地多余的记录
+        返回 {"mode", "fetched", "changed", "deleted"}
+        """
+        started = time.time()
+        checkpoint = self.get_meta("checkpoint")
+        last_full_sync = self.get_meta("last_full_sync")
+
+        if (
+            checkpoint is not None
+            and last_full_sync is not None
+            and started - last_full_sync < full_sync_interval
+        ):
+            items = list(
+                connector.iter_records(
+                    app_token,
+                    table_id,
+                    on_progress=on_progress,
+                    filter_formula=connector.modified_since_filter(
+                        modified_field, checkpoint - SYNC_OVERLAP
+                    ),
+                    field_names=field_names,
+                    automatic_fields=True,
+                )
+            )
+            if connector.last_error is None:
+                changed = self.upsert(items)
+                self.set_meta("checkpoint", started)
+                return {
+                    "mode": "incremental",
+                    "fetched": len(items),
+                    "changed": len(changed),
+                    "deleted": 0,
+                }
+
+        items = list(
+            connector.iter_records(
+                app_token,
+                table_id,
+                on_progress=on_progress,
+                field_names=field_names,
+                automatic_fields=True,
+            )
+        )
+        changed = self.upsert(items)
+        deleted = []
+        # 只有完整读完整张表时才能判断哪些记录已被删除，并推进检查点
+        if connector.last_error is None:
+            deleted = self.record_ids() - {item["record_id"] for item in items}
+            self.delete(deleted)
+            self.set_meta("checkpoint", started)
+            self.set_meta("last_full_sync", started)
+        return {
+            "mode": "full",
+            "fetched": len(items),
+            "changed": len(changed),
+            "deleted": len(deleted),
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,141 @@
+"""
+分阶段流水线 - 读取、打分、LLM 分析、批量写回各阶段在独立线程中并发运行，
+阶段之间用有界队列连接 (队列满时上游阻塞，形成背压)，
+整体耗时接近最慢的阶段而不是各阶段之和
+"""
+
+import queue
+import threading
+import time
+
+# 阶段之间的队列长度上限
+DEFAULT_QUEUE_SIZE = 64
+
+# 队列结束标记
+_DONE = object()
+
+
+class Stage:
+    """
+    流水线的一个阶段：fn(item) 的返回值交给下一阶段，返回 None 表示丢弃
+    workers 个线程共享输入队列；全部线程结束后调用一次 close()
+    """
+
+    def __init__(self, name, fn, workers=1, close=None):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.close = close
+
+        self.processed = 0
+        self.errors = 0
+        self.busy = 0.0
+        self._finished = 0
+        self._lock = threading.Lock()
+
+    def _record(self, elapsed, ok):
+        with self._lock:
+            self.processed += 1
+            self.busy += elapsed
+            if not ok:
+                self.errors += 1
+
+    def stats(self, wall_time):
+        """阶段计数器：处理条数、出错条数、忙碌时间和吞吐量 (条/秒)"""
+        return {
+            "items": self.processed,
+            "errors": self.errors,
+            "busy": self.busy,
+            "rate": self.processed / wall_time if wall_time > 0 else 0.0,
+        }
+
+
+class Pipeline:
+    """由数据源和若干阶段组成的流水线"""
+
+    def __init__(self, stages, maxsize=DEFAULT_QUEUE_SIZE):
+        self.stages = stages
+        self.maxsize = maxsize
+        self.source_stats = {"items": 0, "errors": 0}
+        self.wall_time = 0.0
+
+    def run(self, source):
+        """
+        从 source (可迭代对象) 读取数据流经各阶段，全部处理完后返回各阶段计数器
+        单条数据在某阶段出错时记为错误并丢弃，不影响其他数据
+        """
+        started = time.monotonic()
+        queues = [queue.Queue(maxsize=self.maxsize) for _ in self.stages]
+        threads = [threading.Thread(target=self._read, args=(source, queues[0]))]
+        for i, stage in enumerate(self.stages):
+            output = queues[i + 1] if i + 1 < len(queues) else None
+            for _ in range(stage.workers):
+                threads.append(
+                    threading.Thread(target=self._work, args=(stage, queues[i], output))
+                )
+
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.wall_time = time.monotonic() - started
+        return self.stats()
+
+    def _read(self, source, output):
+        try:
+            for item in source:
+                output.put(item)
+                self.source_stats["items"] += 1
+        except Exception as e:
+            # 读取中断时已读到的数据照常处理
+            self.source_stats["errors"] += 1
+        output.put(_DONE)
+
+    def _work(self, stage, input_queue, output):
+        while True:
+            item = input_queue.get()
+            if item is _DONE:
+                # 让同一阶段的其他线程也能看到结束标记
+                input_queue.put(_DONE)
+                break
+
+            started = time.monotonic()
+            try:
+                result = stage.fn(item)
+                ok = True
+            except Exception as e:
+                result, ok = None, False
+            stage._record(time.monotonic() - started, ok)
+            if result is not None and output is not None:
+                output.put(result)
+
+        with stage._lock:
+            stage._finished += 1
+            last = stage._finished == stage.workers
+        if last:
+            if stage.close is not None:
+                try:
+                    stage.close()
+                except Exception as e:
+                    stage.errors += 1
+            if output is not None:
+                output.put(_DONE)
+
+    def stats(self):
+        """{"source": {...}, 阶段名: {...}, "wall_time": 秒}"""
+        result = {
+            "source": dict(
+                self.source_stats,
+                rate=(
+                    self.source_stats["items"] / self.wall_time
+                    if self.wall_time > 0
+                    else 0.0
+                ),
+            )
+        }
+        for stage in self.stages:
+            result[stage.name] = stage.stats(self.wall_time)
+        result["wall_time"] = self.wall_time
+        return result
@@ -0,0 +1,174 @@
+"""
+Gemini 调用的客户端限流 - 每分钟请求数 (RPM) 与每分钟 token 数 (TPM) 双令牌桶
+"""
+
+import os
+import threading
+import time
+
+from lazy_import import lazy_import
+from metrics import default_metrics
+from token_budget import default_estimator
+
+genai = lazy_import("google.genai")
+
+
+def estimate_tokens(text):
+    """粗略估算一段文本的 token 数，用于 TPM 预算 (见 token_budget.TokenEstimator)"""
+    return default_estimator.estimate(text)
+
+
+def is_rate_limit_error(error):
+    """判断异常是否为 429 / RESOURCE_EXHAUSTED 配额错误"""
+    if (
+        getattr(error, "code", None) == 429
+        or getattr(error, "status_code", None) == 429
+    ):
+        return True
+    message = str(error)
+    return "429" in message or "RESOURCE_EXHAUSTED" in message
+
+
+class TokenBucket:
+    """按每分钟速率匀速补充的令牌桶，容量默认等于一分钟的额度"""
+
+    def __init__(self, per_minute, capacity=None):
+        self.per_minute = per_minute
+        self.capacity = capacity or per_minute
+        self.level = float(self.capacity)
+        self._rate = per_minute / 60.0
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def wait_time(self, amount):
+        """还需要等待多少秒才能取出 amount 个令牌"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self._rate
+
+    def consume(self, amount):
+        self._refill()
+        # 允许为负：实际用量超出估算时，后续调用会相应等待更久
+        self.level -= amount
+
+
+class RateLimiter:
+    """
+    RPM + TPM 双预算限流器，线程安全
+
+    预算不足时调用方排队等待，而不是直接失败；
+    CloudQuantAgent 和 QuantContentAgent 默认共用 get_default_limiter()
+    """
+
+    def __init__(self, rpm, tpm):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.total_requests = 0
+        self.total_tokens = 0
+        self.total_wait_seconds = 0.0
+        self.rate_limited_retries = 0
+
+    def acquire(self, tokens=0):
+        """阻塞直到一次请求和 tokens 个 token 的预算都可用，返回等待的秒数"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                if wait <= 0:
+                    self.requests.consume(1)
+                    self.tokens.consume(tokens)
+                    self.total_requests += 1
+                    self.total_tokens += tokens
+                    self.total_wait_seconds += waited
+                    return waited
+            time.sleep(wait)
+            waited += wait
+
+    def settle(self, estimated, actual):
+        """响应返回后用实际 token 用量修正预估值"""
+        with self._lock:
+            self.tokens.consume(actual - estimated)
+            self.total_tokens += actual - estimated
+
+    def call(self, fn, tokens=0, max_retries=5, backoff=2.0):
+        """
+        在限流下执行一次 LLM 调用 fn()；遇到 429 时指数退避后重新排队，
+        超过 max_retries 次仍被限流则抛出最后一次异常，其他异常直接抛出
+        """
+        for attempt in range(max_retries + 1):
+            self.acquire(tokens)
+            try:
+                response = fn()
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == max_retries:
+                    raise
+                with self._lock:
+                    self.rate_limited_retries += 1
+                default_metrics.inc("llm_retries")
+                time.sleep(backoff * (2**attempt))
+                continue
+
+            actual = _total_token_count(response)
+            if actual is not None:
+                self.settle(tokens, actual)
+            return response
+
+    def utilization(self):
+        """当前预算占用率 (0~1) 及累计统计，用于监控"""
+        with self._lock:
+            self.requests._refill()
+            self.tokens._refill()
+            return {
+                "rpm_utilization": 1 - self.requests.level / self.requests.capacity,
+                "tpm_utilization": 1 - self.tokens.level / self.tokens.capacity,
+                "total_requests": self.total_requests,
+                "total_tokens": self.total_tokens,
+                "total_wait_seconds": self.total_wait_seconds,
+                "rate_limited_retries": self.rate_limited_retries,
+            }
+
+
+def _total_token_count(response):
+    """从 Gemini 响应中取实际 token 用量，取不到时返回 None"""
+    usage = getattr(response, "usage_metadata", None)
+    total = getattr(usage, "total_token_count", None)
+    return total if isinstance(total, int) else None
+
+
+_default_limiter = None
+_default_lock = threading.Lock()
+
+
+def get_default_limiter():
+    """
+    两个 agent 共用的默认限流器，首次使用时按环境变量
+    GEMINI_RPM / GEMINI_TPM 创建 (默认 1000 RPM, 1,000,000 TPM)
+    """
+    global _default_limiter
+    with _default_lock:
+        if _default_limiter is None:
+            _default_limiter = RateLimiter(
+                rpm=int(os.environ.get("GEMINI_RPM", "1000")),
+                tpm=int(os.environ.get("GEMINI_TPM", "1000000")),
+            )
+        return _default_limiter
+
+
+def gemini_http_options():
+    """
+    两个 agent 创建 Gemini 客户端时使用的 http_options：
+    设置 GEMINI_BASE_URL 时请求发往该地址 (如本地压测替身服务)，否则为 None
+    """
+    base_url = os.environ.get("GEMINI_BASE_URL")
+    if not base_url:
+        return None
+    return genai.types.HttpOptions(base_url=base_url)
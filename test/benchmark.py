@@ -0,0 +1,519 @@
+#!/usr/bin/env python3
+"""
+离线压测 - 在本地启动飞书多维表格记录接口和 Gemini generateContent 接口的替身服务
+(可配置延迟、抖动、错误率和 429 注入)，生成合成数据表，
+端到端测量 cloud_agent_runner.main 和 QuantContentAgent 的吞吐量、耗时和峰值内存
+
+用法:
+    python test/benchmark.py --records 100000 --pending 2000 --latency 0.05
+    python test/run_tests.py bench
+
+替身服务与被测代码在同一进程中运行；合成数据在开始计量内存之前生成，
+计入峰值内存的只有替身服务处理请求时的临时对象
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from workload import WorkloadGenerator
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    替身服务基类：每个请求先等待 latency ± jitter 秒，
+    再按 rate_limit_rate 返回 429、按 error_rate 返回 500
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self, handler, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit_rate=0.0
+    ):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.requests = 0
+        self.injected = {429: 0, 500: 0}
+        self._random = random.Random(0)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def inject(self):
+        """等待模拟延迟，返回要注入的错误状态码，不注入时返回 None"""
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + self._random.uniform(-self.jitter, self.jitter)
+            roll = self._random.random()
+        if delay > 0:
+            time.sleep(delay)
+        status = None
+        if roll < self.rate_limit_rate:
+            status = 429
+        elif roll < self.rate_limit_rate + self.error_rate:
+            status = 500
+        if status is not None:
+            with self._lock:
+                self.injected[status] += 1
+        return status
+
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 响应头和响应体分两次写出，关闭 Nagle 避免与客户端延迟确认叠加出 40ms 停顿
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FeishuStandIn(StandInServer):
+    """
+    多维表格替身：租户令牌、分页读取 (支持状态筛选、修改时间筛选、
+    field_names、automatic_fields)、单条更新和批量更新
+    """
+
+    def __init__(self, records, **kwargs):
+        super().__init__(_FeishuHandler, **kwargs)
+        self.order = [item["record_id"] for item in records]
+        self.records = {item["record_id"]: item for item in records}
+        self.updated = 0
+
+    def matches(self, item, formula):
+        if not formula:
+            return True
+        status = re.fullmatch(r'CurrentValue\.\[状态\]="(.*)"', formula)
+        if status:
+            return item["fields"].get("状态") == status.group(1)
+        since = re.fullmatch(r'CurrentValue\.\[.*\]>=TODATE\("(.*)"\)', formula)
+        if since:
+            day = time.mktime(time.strptime(since.group(1), "%Y-%m-%d")) * 1000
+            return item.get("last_modified_time", 0) >= day
+        return True
+
+    def page(self, params):
+        """从 page_token 位置向后扫描，凑满一页符合筛选条件的记录"""
+        formula = params.get("filter")
+        page_size = int(params.get("page_size", 500))
+        field_names = (
+            json.loads(params["field_names"]) if "field_names" in params else None
+        )
+        automatic = params.get("automatic_fields") == "true"
+
+        position = int(params.get("page_token") or 0)
+        items = []
+        while position < len(self.order) and len(items) < page_size:
+            item = self.records[self.order[position]]
+            position += 1
+            if not self.matches(item, formula):
+                continue
+            fields = item["fields"]
+            if field_names is not None:
+                fields = {k: v for k, v in fields.items() if k in field_names}
+            record = {"record_id": item["record_id"], "fields": fields}
+            if automatic:
+                record["created_time"] = item.get("created_time")
+                record["last_modified_time"] = item.get("last_modified_time")
+            items.append(record)
+
+        has_more = position < len(self.order)
+        return {
+            "items": items,
+            "has_more": has_more,
+            "page_token": str(position) if has_more else None,
+            "total": len(self.order),
+        }
+
+    def update(self, record_id, fields):
+        item = self.records.get(record_id)
+        if item is None:
+            return False
+        item["fields"] = dict(item["fields"], **fields)
+        item["last_modified_time"] = int(time.time() * 1000)
+        with self._lock:
+            self.updated += 1
+        return True
+
+
+class _FeishuHandler(_JSONHandler):
+    def do_POST(self):
+        server = self.server
+        body = self.read_json()
+        status = server.inject()
+        if status is not None:
+            return self.send_json(status, {"code": 1, "msg": "injected"})
+
+        path = urlparse(self.path).path
+        if path.endswith("/tenant_access_token/internal"):
+            return self.send_json(
+                200, {"code": 0, "tenant_access_token": "bench-token", "expire": 7200}
+            )
+        if path.endswith("/records/batch_update"):
+            records = [
+                {"record_id": r["record_id"], "fields": r["fields"]}
+                for r in body.get("records", [])
+                if server.update(r["record_id"], r["fields"])
+            ]
+            return self.send_json(200, {"code": 0, "data": {"records": records}})
+        self.send_json(404, {"code": 404})
+
+    def do_PUT(self):
+        server = self.server
+        body = self.read_json()
+        status = server.inject()
+        if status is not None:
+            return self.send_json(status, {"code": 1, "msg": "injected"})
+        record_id = urlparse(self.path).path.rsplit("/", 1)[-1]
+        if server.update(record_id, body.get("fields", {})):
+            return self.send_json(200, {"code": 0, "data": {}})
+        self.send_json(200, {"code": 1254043, "msg": "RecordIdNotFound"})
+
+    def do_GET(self):
+        server = self.server
+        status = server.inject()
+        if status is not None:
+            return self.send_json(status, {"code": 1, "msg": "injected"})
+        parsed = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        if parsed.path.endswith("/records"):
+            return self.send_json(200, {"code": 0, "data": server.page(params)})
+        self.send_json(404, {"code": 404})
+
+
+class GeminiStandIn(StandInServer):
+    """
+    Gemini generateContent / countTokens 替身：按 Prompt 类型返回
+    单篇分析、打包分析 (按 record_id 的 JSON 数组) 或本地复盘决策，并附带 usageMetadata
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(_GeminiHandler, **kwargs)
+
+    @staticmethod
+    def respond(prompt):
+        if "【笔记列表】" in prompt:
+            result = []
+            for line in prompt.splitlines():
+                line = line.strip()
+                if line.startswith('{"record_id"'):
+                    entry = json.loads(line)
+                    result.append(
+                        {
+                            "record_id": entry["record_id"],
+                            "analysis": "表现平稳",
+                            "action": "回复评论",
+                            "next_title": f"{entry['标题']} 进阶篇",
+                        }
+                    )
+        elif "小红书量化运营专家" in prompt:
+            result = {
+                "analysis": "收藏主导，干货属性明显",
+                "strategy": "追涨",
+                "next_title_suggestions": ["进阶篇", "避坑篇"],
+                "cover_prompt": "大字标题",
+            }
+        else:
+            result = {
+                "analysis": "表现平稳",
+                "action": "回复评论",
+                "next_title": "下期标题",
+            }
+        return json.dumps(result, ensure_ascii=False)
+
+
+class _GeminiHandler(_JSONHandler):
+    def do_POST(self):
+        server = self.server
+        body = self.read_json()
+        status = server.inject()
+        if status == 429:
+            return self.send_json(
+                429,
+                {
+                    "error": {
+                        "code": 429,
+                        "message": "Resource has been exhausted",
+                        "status": "RESOURCE_EXHAUSTED",
+                    }
+                },
+            )
+        if status == 500:
+            return self.send_json(
+                500,
+                {"error": {"code": 500, "message": "injected", "status": "INTERNAL"}},
+            )
+
+        prompt = "".join(
+            part.get("text", "")
+            for content in body.get("contents", [])
+            for part in content.get("parts", [])
+        )
+        prompt_tokens = max(len(prompt) // 2, 1)
+        if self.path.split("?")[0].endswith(":countTokens"):
+            return self.send_json(200, {"totalTokens": prompt_tokens})
+
+        text = server.respond(prompt)
+        response_tokens = max(len(text) // 2, 1)
+        self.send_json(
+            200,
+            {
+                "candidates": [
+                    {
+                        "content": {"role": "model", "parts": [{"text": text}]},
+                        "finishReason": "STOP",
+                    }
+                ],
+                "usageMetadata": {
+                    "promptTokenCount": prompt_tokens,
+                    "candidatesTokenCount": response_tokens,
+                    "totalTokenCount": prompt_tokens + response_tokens,
+                },
+            },
+        )
+
+
+def synthetic_records(analyzed, pending, seed=0):
+    """多维表格格式的合成记录：analyzed 条"已分析"在前，pending 条"待分析"在后"""
+    generator = WorkloadGenerator(analyzed + pending, seed=seed)
+    return list(generator.bitable_records(pending=pending))
+
+
+def synthetic_frame(rows, seed=0):
+    """QuantContentAgent 使用的本地 CSV 格式合成数据"""
+    return WorkloadGenerator(rows, seed=seed).frame()
+
+
+def measure(fn, trace_memory=True):
+    """运行 fn()，返回 (结果, 耗时秒数, tracemalloc 峰值字节数或 None)"""
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        result = fn()
+    finally:
+        elapsed = time.perf_counter() - started
+        peak = None
+        if trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def server_options(args):
+    return {
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "error_rate": args.error_rate,
+        "rate_limit_rate": args.rate_limit_rate,
+    }
+
+
+def bench_runner(args):
+    """端到端运行 cloud_agent_runner.main：读取基准和待分析记录、分析、写回"""
+    import cloud_agent_runner
+    from metrics import default_metrics
+
+    records = synthetic_records(args.records, args.pending, seed=args.seed)
+    feishu = FeishuStandIn(records, **server_options(args)).start()
+    gemini = GeminiStandIn(**server_options(args)).start()
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            env = {
+                "FS_APP_ID": "bench",
+                "FS_APP_SECRET": "bench",
+                "FS_APP_TOKEN": "app",
+                "FS_TABLE_ID": "table",
+                "FS_BASE_URL": f"{feishu.url}/open-apis",
+                "GEMINI_API_KEY": "bench",
+                "GEMINI_BASE_URL": gemini.url,
+                "GEMINI_RPM": "1000000",
+                "GEMINI_TPM": "1000000000",
+                "ANALYSIS_CONCURRENCY": str(args.concurrency),
+                "ANALYSIS_BATCH_SIZE": str(args.batch_size),
+                "ANALYSIS_PIPELINE": "1" if args.pipeline else "0",
+                "RULE_ENGINE": "1" if args.rule_engine else "0",
+                "LLM_CACHE_PATH": "",
+                "MIRROR_PATH": "",
+                "JOURNAL_FILE": "",
+                "BASELINE_STATE_FILE": "",
+                "TOKEN_ESTIMATOR_FILE": os.path.join(temp_dir, "estimator.json"),
+                "METRICS_DIR": os.path.join(temp_dir, "metrics"),
+            }
+            with patch.dict(os.environ, env), patch("builtins.print"):
+                _, elapsed, peak = measure(
+                    cloud_agent_runner.main, trace_memory=args.trace_memory
+                )
+            snapshot = default_metrics.snapshot()
+    finally:
+        feishu.stop()
+        gemini.stop()
+
+    llm = snapshot["timings"].get("llm", {})
+    return {
+        "scenario": "cloud_agent_runner.main",
+        "records": args.records + args.pending,
+        "processed": feishu.updated,
+        "wall_time": elapsed,
+        "records_per_sec": (args.records + args.pending) / elapsed,
+        "processed_per_sec": feishu.updated / elapsed,
+        "peak_memory": peak,
+        "llm_requests": snapshot["counters"].get("llm_requests", 0),
+        "llm_p95": llm.get("p95", 0.0),
+        "feishu_requests": feishu.requests,
+        "injected": {"feishu": feishu.injected, "gemini": gemini.injected},
+    }
+
+
+def bench_local_agent(args):
+    """端到端运行 QuantContentAgent：读取历史 CSV，批量复盘 pending 篇新帖子"""
+    from agent import QuantContentAgent
+
+    gemini = GeminiStandIn(**server_options(args)).start()
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            history_file = os.path.join(temp_dir, "post_data.csv")
+            synthetic_frame(args.records, seed=args.seed).to_csv(
+                history_file, index=False
+            )
+            new_posts = synthetic_frame(args.pending, seed=args.seed + 1)
+            env = {
+                "GEMINI_API_KEY": "bench",
+                "GEMINI_BASE_URL": gemini.url,
+                "GEMINI_RPM": "1000000",
+                "GEMINI_TPM": "1000000000",
+            }
+
+            def run():
+                agent = QuantContentAgent(
+                    history_file=history_file, rule_engine=args.rule_engine
+                )
+                return list(
+                    agent.run_review_many(new_posts, max_workers=args.concurrency)
+                )
+
+            with patch.dict(os.environ, env):
+                results, elapsed, peak = measure(run, trace_memory=args.trace_memory)
+    finally:
+        gemini.stop()
+
+    decided = sum(1 for *_, decision in results if decision is not None)
+    return {
+        "scenario": "QuantContentAgent.run_review_many",
+        "records": args.records + args.pending,
+        "processed": decided,
+        "wall_time": elapsed,
+        "records_per_sec": (args.records + args.pending) / elapsed,
+        "processed_per_sec": decided / elapsed,
+        "peak_memory": peak,
+        "llm_requests": gemini.requests,
+        "injected": {"gemini": gemini.injected},
+    }
+
+
+SCENARIOS = {"runner": bench_runner, "agent": bench_local_agent}
+
+
+def format_report(result):
+    peak = result["peak_memory"]
+    lines = [
+        f"== {result['scenario']}",
+        f"   记录数: {result['records']}，处理: {result['processed']}",
+        f"   总耗时: {result['wall_time']:.2f} 秒",
+        f"   吞吐量: {result['records_per_sec']:.1f} 条/秒 (读取)，"
+        f"{result['processed_per_sec']:.1f} 条/秒 (分析)",
+        f"   峰值内存: "
+        + (f"{peak / 1024 / 1024:.1f} MiB" if peak is not None else "未计量"),
+        f"   LLM 请求: {result['llm_requests']}，注入错误: {result['injected']}",
+    ]
+    return "\n".join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="RedNote 离线压测")
+    parser.add_argument(
+        "--scenario", choices=["all", *SCENARIOS], default="all", help="压测场景"
+    )
+    parser.add_argument("--records", type=int, default=1000, help="历史记录条数")
+    parser.add_argument("--pending", type=int, default=100, help="待分析记录条数")
+    parser.add_argument("--latency", type=float, default=0.01, help="替身服务延迟 (秒)")
+    parser.add_argument("--jitter", type=float, default=0.005, help="延迟抖动 (秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="500 错误比例")
+    parser.add_argument(
+        "--rate-limit-rate", type=float, default=0.0, help="429 限流比例"
+    )
+    parser.add_argument("--concurrency", type=int, default=4, help="LLM 并发数")
+    parser.add_argument("--batch-size", type=int, default=1, help="每个请求打包篇数")
+    parser.add_argument("--pipeline", action="store_true", help="使用流水线模式")
+    parser.add_argument("--rule-engine", action="store_true", help="开启规则引擎")
+    parser.add_argument(
+        "--no-trace-memory",
+        dest="trace_memory",
+        action="store_false",
+        help="不用 tracemalloc 计量峰值内存 (大数据量时更快)",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="合成数据随机种子")
+    parser.add_argument("--json", help="把结果另存为 JSON 文件")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    names = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    results = []
+    for name in names:
+        result = SCENARIOS[name](args)
+        results.append(result)
+        print(format_report(result))
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"进程峰值 RSS: {max_rss / 1024:.1f} MiB")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -75,19 +75,83 @@ def run_specific_test(test_name):
 
         suite = unittest.TestLoader().loadTestsFromTestCase(TestIntegration)
     elif test_name == "cloud_agent":
-        from test_cloud_agent import TestCloudQuantAgent, TestFeishuConnector
+        from test_cloud_agent import (
+            TestCloudQuantAgent,
+            TestFeishuConnector,
+            TestTenantTokenManager,
+            TestWriteBackBuffer,
+        )
 
         suite = unittest.TestSuite()
         suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestCloudQuantAgent))
         suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestFeishuConnector))
+        suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestWriteBackBuffer))
+        suite.addTests(
+            unittest.TestLoader().loadTestsFromTestCase(TestTenantTokenManager)
+        )
     elif test_name == "cloud_integration":
         from test_cloud_agent_integration import TestCloudAgentIntegration
 
         suite = unittest.TestLoader().loadTestsFromTestCase(TestCloudAgentIntegration)
+    elif test_name == "runner":
+        from test_cloud_agent_runner import TestCloudAgentRunner
+
+        suite = unittest.TestLoader().loadTestsFromTestCase(TestCloudAgentRunner)
+    elif test_name == "rate_limiter":
+        from test_rate_limiter import TestRateLimiter
+
+        suite = unittest.TestLoader().loadTestsFromTestCase(TestRateLimiter)
+    elif test_name == "llm_cache":
+        from test_llm_cache import TestLLMCache
+
+        suite = unittest.TestLoader().loadTestsFromTestCase(TestLLMCache)
+    elif test_name == "token_budget":
+        from test_token_budget import TestTokenBudget
+
+        suite = unittest.TestLoader().loadTestsFromTestCase(TestTokenBudget)
+    elif test_name == "batch_jobs":
+        from test_batch_jobs import TestBatchJobs
+
+        suite = unittest.TestLoader().loadTestsFromTestCase(TestBatchJobs)
+    elif test_name == "mirror":
+        from test_mirror import TestBitableMirror
+
+        suite = unittest.TestLoader().loadTestsFromTestCase(TestBitableMirror)
+    elif test_name == "journal":
+        from test_journal import TestRunJournal
+
+        suite = unittest.TestLoader().loadTestsFromTestCase(TestRunJournal)
+    elif test_name == "pipeline":
+        from test_pipeline import TestPipeline
+
+        suite = unittest.TestLoader().loadTestsFromTestCase(TestPipeline)
+    elif test_name == "metrics":
+        from test_metrics import TestMetrics
+
+        suite = unittest.TestLoader().loadTestsFromTestCase(TestMetrics)
+    elif test_name == "benchmark":
+        from test_benchmark import TestBenchmark
+
+        suite = unittest.TestLoader().loadTestsFromTestCase(TestBenchmark)
+    elif test_name == "workload":
+        from test_workload import TestWorkload
+
+        suite = unittest.TestLoader().loadTestsFromTestCase(TestWorkload)
+    elif test_name == "microbench":
+        from test_microbench import TestMicrobench
+
+        suite = unittest.TestLoader().loadTestsFromTestCase(TestMicrobench)
+    elif test_name == "history_snapshot":
+        from test_history_snapshot import TestHistorySnapshot
+
+        suite = unittest.TestLoader().loadTestsFromTestCase(TestHistorySnapshot)
     else:
         print(f"未知的测试名称: {test_name}")
         print(
-            "可用的测试: agent, formulas, integration, cloud_agent, cloud_integration"
+            "可用的测试: agent, formulas, integration, cloud_agent, "
+            "cloud_integration, runner, rate_limiter, llm_cache, token_budget, "
+            "batch_jobs, mirror, journal, pipeline, metrics, benchmark, "
+            "workload, microbench, history_snapshot"
         )
         return 1
 
@@ -98,6 +162,17 @@ def run_specific_test(test_name):
 
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        # 离线压测，其余参数传给 benchmark.py
+        from benchmark import main as run_benchmark
+
+        run_benchmark(sys.argv[2:])
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == "perf":
+        # 性能预算检查，超出预算时返回非零退出码
+        from microbench import main as run_microbench
+
+        sys.exit(run_microbench(["--check"] + sys.argv[2:]))
     if len(sys.argv) > 1:
         # 运行特定测试
         exit_code = run_specific_test(sys.argv[1])
@@ -3,6 +3,8 @@ import pandas as pd
 import json
 import os
 import tempfile
+import threading
+import time
 from unittest.mock import patch, MagicMock
 import sys
 
@@ -10,6 +12,9 @@ import sys
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
 from agent import QuantContentAgent
+from factors import compute_h_scores
+from history_snapshot import snapshot_paths
+from llm_cache import ResponseCache
 
 
 class TestQuantContentAgent(unittest.TestCase):
@@ -38,8 +43,10 @@ class TestQuantContentAgent(unittest.TestCase):
 
     def tearDown(self):
         """测试后清理"""
-        if os.path.exists(self.temp_file.name):
-            os.unlink(self.temp_file.name)
+        # 历史 CSV 及 agent 在其旁边写出的快照文件
+        for path in (self.temp_file.name, *snapshot_paths(self.temp_file.name)):
+            if os.path.exists(path):
+                os.unlink(path)
 
     @patch("agent.genai.Client")
     def test_init_with_existing_file(self, mock_client):
@@ -52,7 +59,10 @@ class TestQuantContentAgent(unittest.TestCase):
         self.assertIn("title", agent.history.columns)
         self.assertIn("like", agent.history.columns)
 
-        # 验证客户端初始化
+        # 验证客户端在第一次使用时才创建，且只创建一次
+        mock_client.assert_not_called()
+        self.assertIs(agent.client, mock_client.return_value)
+        self.assertIs(agent.client, mock_client.return_value)
         mock_client.assert_called_once()
 
     @patch("agent.genai.Client")
@@ -328,6 +338,289 @@ class TestQuantContentAgent(unittest.TestCase):
                 f"权重测试失败: {post_data} 应得分 {expected_score}, 实际得分 {actual_score}",
             )
 
+    def test_history_scores_vectorized_match_row_formula(self):
+        """测试列式H Score与逐行公式结果一致"""
+        with patch("agent.genai.Client"):
+            agent = QuantContentAgent(history_file=self.temp_file.name)
+
+        agent.get_market_metrics({"like": 1})
+        expected = [
+            agent._calculate_h_score(row) for _, row in self.test_data.iterrows()
+        ]
+
+        self.assertEqual(list(agent._history_scores), expected)
+
+    def test_history_stats_cached_between_calls(self):
+        """测试历史统计量在多次调用间被缓存"""
+        with patch("agent.genai.Client"):
+            agent = QuantContentAgent(history_file=self.temp_file.name)
+
+        with patch("agent.compute_h_scores", wraps=compute_h_scores) as mock_compute:
+            agent.get_market_metrics({"like": 100})
+            agent.get_market_metrics({"like": 200})
+            agent.get_market_metrics({"like": 300})
+
+        # 历史数据未变化，只应计算一次
+        self.assertEqual(mock_compute.call_count, 1)
+
+    def test_history_cache_invalidated_on_change(self):
+        """测试历史数据变化后缓存失效"""
+        with patch("agent.genai.Client"):
+            agent = QuantContentAgent(history_file=self.temp_file.name)
+
+        _, z_before = agent.get_market_metrics({"like": 300})
+
+        # 追加一行后重新赋值，触发重新计算
+        history = agent.history
+        history.loc[len(history)] = ["新帖子", 5000, 500, 2000, 300]
+        agent.history = history
+        _, z_appended = agent.get_market_metrics({"like": 300})
+        self.assertNotEqual(z_before, z_appended)
+
+        # 整体替换 history 同样触发重新计算
+        agent.history = self.test_data.copy()
+        _, z_replaced = agent.get_market_metrics({"like": 300})
+        self.assertAlmostEqual(z_before, z_replaced)
+
+    def test_history_edit_then_reassign(self):
+        """测试读取 history 不复制，修改后重新赋值得到新的 Z Score"""
+        with patch("agent.genai.Client"):
+            agent = QuantContentAgent(history_file=self.temp_file.name)
+            expected_agent = QuantContentAgent(history_file=self.temp_file.name)
+        _, z_before = agent.get_market_metrics({"like": 300})
+        self.assertIs(agent.history, agent.history)
+
+        # 修改数值后重新赋值，缓存的统计量失效
+        history = agent.history
+        history.loc[0, "like"] = 1000
+        self.assertEqual(agent.history.loc[0, "like"], 1000)
+        agent.history = history
+        expected_agent.history = history.copy()
+        _, z_edited = agent.get_market_metrics({"like": 300})
+        _, z_expected = expected_agent.get_market_metrics({"like": 300})
+        self.assertNotAlmostEqual(z_before, z_edited)
+        self.assertAlmostEqual(z_edited, z_expected)
+
+        # 赋值时保存副本，之后再修改传入的 DataFrame 不影响 agent
+        history.loc[1, "like"] = 0
+        self.assertIsNot(agent.history, history)
+        _, z_after = agent.get_market_metrics({"like": 300})
+        self.assertEqual(z_after, z_edited)
+
+    @patch("agent.genai.Client")
+    def test_ai_strategic_decision_cached(self, mock_client):
+        """测试AI策略决策 - 相同prompt命中响应缓存"""
+        mock_response = MagicMock()
+        mock_response.text = json.dumps({"analysis": "缓存", "strategy": "追涨"})
+        generate = mock_client.return_value.models.generate_content
+        generate.return_value = mock_response
+
+        agent = QuantContentAgent(
+            history_file=self.temp_file.name, cache=ResponseCache()
+        )
+        new_post = {"title": "测试帖子", "like": 100}
+
+        first = agent.ai_strategic_decision(new_post, 100, 0.5, "评论")
+        second = agent.ai_strategic_decision(new_post, 100, 0.5, "评论")
+        other = agent.ai_strategic_decision(new_post, 100, 0.5, "另一条评论")
+
+        self.assertEqual(first, second)
+        self.assertIsNotNone(other)
+        self.assertEqual(generate.call_count, 2)
+
+    @patch("agent.genai.Client")
+    def test_run_review_many_dataframe(self, mock_client):
+        """测试批量复盘 - DataFrame输入"""
+        mock_response = MagicMock()
+        mock_response.text = json.dumps({"analysis": "批量分析", "strategy": "追涨"})
+        mock_client.return_value.models.generate_content.return_value = mock_response
+
+        agent = QuantContentAgent(history_file=self.temp_file.name)
+
+        posts = pd.DataFrame(
+            {
+                "title": ["帖子A", "帖子B", "帖子C"],
+                "like": [100, 200, 300],
+                "comment": [20, 30, 40],
+                "save": [50, 80, 100],
+                "share": [5, 10, 15],
+                "comment_extracted": ["评论A", None, "评论C"],
+            },
+            index=["a", "b", "c"],
+        )
+
+        results = {
+            index: (h_score, z_score, decision)
+            for index, h_score, z_score, decision in agent.run_review_many(posts)
+        }
+
+        # 每条帖子都应有结果，且与单条计算一致
+        self.assertEqual(set(results), {"a", "b", "c"})
+        for index, row in posts.iterrows():
+            h_score, z_score = agent.get_market_metrics(row.to_dict())
+            self.assertEqual(results[index][0], h_score)
+            self.assertAlmostEqual(results[index][1], z_score)
+            self.assertEqual(results[index][2]["strategy"], "追涨")
+
+        self.assertEqual(mock_client.return_value.models.generate_content.call_count, 3)
+
+    @patch("agent.genai.Client")
+    def test_run_review_many_with_rule_engine(self, mock_client):
+        """测试规则引擎 - 明确的帖子套用模板，只有模糊的帖子调用LLM"""
+        mock_response = MagicMock()
+        mock_response.text = json.dumps({"analysis": "LLM分析", "strategy": "修正"})
+        generate = mock_client.return_value.models.generate_content
+        generate.return_value = mock_response
+
+        agent = QuantContentAgent(history_file=self.temp_file.name, rule_engine=True)
+
+        posts = pd.DataFrame(
+            {
+                "title": ["干货", "冷门", "争议", "普通"],
+                "like": [10, 10, 0, 150],
+                "comment": [0, 0, 300, 25],
+                "save": [200, 0, 0, 60],
+                "share": [50, 0, 0, 8],
+            }
+        )
+
+        results = list(agent.run_review_many(posts))
+        decisions = {index: decision for index, _, _, decision in results}
+
+        self.assertEqual(decisions[0]["strategy"], "追涨")
+        self.assertEqual(decisions[1]["strategy"], "止损")
+        self.assertEqual(decisions[2]["strategy"], "互动")
+        self.assertEqual(decisions[3]["analysis"], "LLM分析")
+        self.assertEqual(
+            decisions[0]["next_title_suggestions"], ["干货（进阶版）", "干货：第二弹"]
+        )
+        # 规则判断的帖子最先产出，只有 1 条调用 LLM
+        self.assertEqual([index for index, _, _, _ in results][-1], 3)
+        self.assertEqual(generate.call_count, 1)
+
+        # 单条复盘同样走规则引擎
+        decision = agent.run_review(posts.iloc[1].to_dict(), "")
+        self.assertEqual(decision["strategy"], "止损")
+        self.assertEqual(generate.call_count, 1)
+
+    @patch("agent.genai.Client")
+    def test_ma_ratio_in_prompt(self, mock_client):
+        """测试H/MA5：按发布顺序计算，写入Prompt，新帖子可增量更新窗口"""
+        mock_response = MagicMock()
+        mock_response.text = json.dumps({"analysis": "ok"})
+        generate = mock_client.return_value.models.generate_content
+        generate.return_value = mock_response
+
+        # 历史 H Score: 480, 820, 630
+        agent = QuantContentAgent(history_file=self.temp_file.name)
+        self.assertAlmostEqual(agent.get_ma_ratio(644), 1.0, places=2)
+
+        posts = pd.DataFrame(
+            {
+                "title": ["后发", "先发"],
+                "like": [1000, 644],
+                "comment": [0, 0],
+                "save": [0, 0],
+                "share": [0, 0],
+                "发布时间": ["2024-05-02", "2024-05-01"],
+            }
+        )
+        list(agent.run_review_many(posts, max_workers=1))
+
+        prompts = {}
+        for call in generate.call_args_list:
+            contents = call.kwargs["contents"]
+            prompts[contents.split('帖子标题: "')[1].split('"')[0]] = contents
+        # 先发的帖子以 3 篇历史为参照，后发的帖子把先发的帖子计入 MA
+        self.assertIn("H/MA5 (近期表现): 1.00", prompts["先发"])
+        self.assertIn("H/MA5 (近期表现): 1.55", prompts["后发"])
+
+        agent.record_post({"like": 644})
+        self.assertAlmostEqual(agent.get_ma_ratio(644), 1.0, places=2)
+        self.assertEqual(len(agent._get_history_window()), 4)
+
+    @patch("agent.genai.Client")
+    def test_run_review_many_pairs_with_failure(self, mock_client):
+        """测试批量复盘 - (帖子, 评论) 输入，单条失败不影响其他帖子"""
+
+        def mock_generate_content(*args, **kwargs):
+            if "失败帖子" in kwargs.get("contents", ""):
+                raise Exception("API Error")
+            response = MagicMock()
+            response.text = '{"analysis": "ok", "strategy": "互动"}'
+            return response
+
+        mock_client.return_value.models.generate_content.side_effect = (
+            mock_generate_content
+        )
+
+        agent = QuantContentAgent(history_file=self.temp_file.name)
+
+        pairs = [
+            (
+                {
+                    "title": "正常帖子",
+                    "like": 100,
+                    "comment": 20,
+                    "save": 50,
+                    "share": 5,
+                },
+                "评论",
+            ),
+            (
+                {"title": "失败帖子", "like": 10, "comment": 2, "save": 5, "share": 0},
+                "评论",
+            ),
+        ]
+
+        results = {
+            index: decision for index, _, _, decision in agent.run_review_many(pairs)
+        }
+
+        self.assertEqual(results[0]["strategy"], "互动")
+        self.assertIsNone(results[1])
+
+    @patch("agent.genai.Client")
+    def test_run_review_many_abandoned_cancels_pending(self, mock_client):
+        """测试提前放弃批量复盘生成器时取消未开始的 LLM 调用，不等待全部完成"""
+        gate = threading.Event()
+        calls = []
+
+        def mock_generate_content(*args, **kwargs):
+            calls.append(kwargs.get("contents"))
+            # 第一次调用立即返回，之后的调用阻塞到测试放行
+            if len(calls) > 1:
+                gate.wait(timeout=5)
+            response = MagicMock()
+            response.text = '{"analysis": "ok"}'
+            return response
+
+        mock_client.return_value.models.generate_content.side_effect = (
+            mock_generate_content
+        )
+        agent = QuantContentAgent(history_file=self.temp_file.name)
+        posts = pd.DataFrame(
+            {
+                "title": [f"帖子{i}" for i in range(5)],
+                "like": [100 * (i + 1) for i in range(5)],
+                "comment": [0] * 5,
+                "save": [0] * 5,
+                "share": [0] * 5,
+            }
+        )
+
+        results = agent.run_review_many(posts, max_workers=1)
+        next(results)
+        started = time.perf_counter()
+        results.close()
+        elapsed = time.perf_counter() - started
+        gate.set()
+
+        self.assertLess(elapsed, 1.0)
+        # 正在执行的调用最多一个，其余已被取消
+        time.sleep(0.05)
+        self.assertLessEqual(len(calls), 2)
+
     def test_edge_cases(self):
         """测试边缘情况"""
         with patch("agent.genai.Client"):
@@ -0,0 +1,126 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+from unittest.mock import MagicMock
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from batch_jobs import (
+    JOB_FAILED,
+    JOB_PENDING,
+    JOB_SUCCEEDED,
+    GeminiBatchBackend,
+    LocalBatchBackend,
+    parse_results,
+    read_prompts,
+    write_job_file,
+)
+
+
+class TestBatchJobs(unittest.TestCase):
+    """测试离线批处理任务"""
+
+    def setUp(self):
+        """测试前设置"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.job_file = os.path.join(self.temp_dir.name, "jobs", "job.jsonl")
+        self.prompts = {"rec1": "标题: 帖子1", "rec2": "标题: 帖子2"}
+
+    def tearDown(self):
+        """测试后清理"""
+        self.temp_dir.cleanup()
+
+    def test_write_and_read_job_file(self):
+        """测试任务文件每行一个请求，可原样读回Prompt"""
+        self.assertEqual(write_job_file(self.job_file, self.prompts), 2)
+
+        with open(self.job_file, encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f]
+
+        self.assertEqual([line["key"] for line in lines], ["rec1", "rec2"])
+        self.assertEqual(
+            lines[0]["request"]["generation_config"],
+            {"response_mime_type": "application/json"},
+        )
+        self.assertEqual(read_prompts(self.job_file), self.prompts)
+
+    def test_parse_results_skips_errors(self):
+        """测试解析结果时跳过出错和格式不对的条目"""
+
+        def response_line(key, text):
+            content = {"parts": [{"text": text}]}
+            return json.dumps(
+                {"key": key, "response": {"candidates": [{"content": content}]}}
+            )
+
+        lines = [
+            response_line("rec1", '{"analysis": "好"}'),
+            response_line("rec2", "不是 JSON"),
+            response_line("rec3", '["list"]'),
+            json.dumps({"key": "rec4", "error": {"message": "quota"}}),
+            "",
+        ]
+
+        self.assertEqual(parse_results(lines), {"rec1": {"analysis": "好"}})
+
+    def test_local_backend(self):
+        """测试本地后端：无执行函数时等待，有执行函数时逐条执行"""
+        write_job_file(self.job_file, self.prompts)
+        directory = os.path.join(self.temp_dir.name, "local")
+
+        waiting = LocalBatchBackend(directory)
+        job_name = waiting.submit(self.job_file, display_name="nightly")
+        self.assertEqual(waiting.poll(job_name), JOB_PENDING)
+        self.assertEqual(waiting.poll("missing"), JOB_FAILED)
+
+        def respond(prompt):
+            if "帖子2" in prompt:
+                raise Exception("API Error")
+            return json.dumps({"analysis": prompt})
+
+        backend = LocalBatchBackend(directory, respond=respond)
+        self.assertEqual(backend.poll(job_name), JOB_SUCCEEDED)
+        self.assertEqual(
+            parse_results(backend.fetch(job_name)),
+            {"rec1": {"analysis": "标题: 帖子1"}},
+        )
+        # 已完成的任务不会重复执行
+        self.assertEqual(waiting.poll(job_name), JOB_SUCCEEDED)
+
+    def test_gemini_backend(self):
+        """测试Gemini后端：上传任务文件、创建任务、按状态轮询、下载结果"""
+        write_job_file(self.job_file, self.prompts)
+        client = MagicMock()
+        client.files.upload.return_value.name = "files/abc"
+        client.batches.create.return_value.name = "batches/123"
+        client.files.download.return_value = b'{"key": "rec1"}\n{"key": "rec2"}\n'
+
+        backend = GeminiBatchBackend(client, "gemini-2.5-flash")
+        job_name = backend.submit(self.job_file)
+
+        self.assertEqual(job_name, "batches/123")
+        self.assertEqual(client.files.upload.call_args.kwargs["file"], self.job_file)
+        create_kwargs = client.batches.create.call_args.kwargs
+        self.assertEqual(create_kwargs["model"], "gemini-2.5-flash")
+        self.assertEqual(create_kwargs["src"], "files/abc")
+
+        states = {
+            "JOB_STATE_RUNNING": JOB_PENDING,
+            "JOB_STATE_SUCCEEDED": JOB_SUCCEEDED,
+            "JOB_STATE_EXPIRED": JOB_FAILED,
+        }
+        for state, expected in states.items():
+            with self.subTest(state=state):
+                client.batches.get.return_value.state.name = state
+                self.assertEqual(backend.poll(job_name), expected)
+
+        self.assertEqual(
+            backend.fetch(job_name), ['{"key": "rec1"}', '{"key": "rec2"}']
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+import os
+import sys
+
+import requests
+
+# 添加项目根目录和测试目录 (benchmark.py) 到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from benchmark import (
+    FeishuStandIn,
+    GeminiStandIn,
+    bench_local_agent,
+    bench_runner,
+    parse_args,
+    synthetic_records,
+)
+
+
+class TestBenchmark(unittest.TestCase):
+    """测试压测替身服务和压测场景 (小数据量冒烟测试)"""
+
+    def setUp(self):
+        """测试前设置"""
+        self.args = parse_args(
+            [
+                "--records",
+                "50",
+                "--pending",
+                "5",
+                "--latency",
+                "0",
+                "--jitter",
+                "0",
+                "--no-trace-memory",
+            ]
+        )
+
+    def test_feishu_stand_in_pages_and_filters(self):
+        """测试多维表格替身分页、按状态筛选和字段筛选"""
+        server = FeishuStandIn(synthetic_records(7, 3)).start()
+        self.addCleanup(server.stop)
+        url = f"{server.url}/open-apis/bitable/v1/apps/app/tables/table/records"
+
+        items, page_token = [], None
+        while True:
+            params = {
+                "page_size": 2,
+                "filter": 'CurrentValue.[状态]="待分析"',
+                "field_names": '["状态"]',
+            }
+            if page_token:
+                params["page_token"] = page_token
+            data = requests.get(url, params=params).json()["data"]
+            items.extend(data["items"])
+            page_token = data["page_token"]
+            if not data["has_more"]:
+                break
+
+        self.assertEqual(len(items), 3)
+        self.assertEqual(items[0]["fields"], {"状态": "待分析"})
+
+    def test_rate_limit_injection(self):
+        """测试按比例注入 429"""
+        server = GeminiStandIn(rate_limit_rate=1.0).start()
+        self.addCleanup(server.stop)
+
+        response = requests.post(
+            f"{server.url}/v1beta/models/m:generateContent", json={}
+        )
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json()["error"]["status"], "RESOURCE_EXHAUSTED")
+        self.assertEqual(server.injected[429], 1)
+
+    def test_runner_scenario(self):
+        """测试 cloud_agent_runner.main 端到端压测场景"""
+        result = bench_runner(self.args)
+
+        self.assertEqual(result["processed"], 5)
+        self.assertEqual(result["llm_requests"], 5)
+        self.assertGreater(result["records_per_sec"], 0)
+
+    def test_local_agent_scenario(self):
+        """测试 QuantContentAgent 端到端压测场景"""
+        result = bench_local_agent(self.args)
+
+        self.assertEqual(result["processed"], 5)
+        self.assertEqual(result["llm_requests"], 5)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -2,13 +2,24 @@ import unittest
 import json
 import os
 import sys
+import tempfile
+import time
 import numpy as np
 from unittest.mock import patch, MagicMock
 
 # 添加项目根目录到Python路径
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
-from cloud_agent import CloudQuantAgent, FeishuConnector
+from cloud_agent import (
+    BASELINE_FIELDS,
+    CloudQuantAgent,
+    FeishuConnector,
+    TenantTokenManager,
+    WriteBackBuffer,
+)
+from llm_cache import ResponseCache
+from metrics import default_metrics
+from rate_limiter import RateLimiter
 
 
 class TestCloudQuantAgent(unittest.TestCase):
@@ -28,8 +39,12 @@ class TestCloudQuantAgent(unittest.TestCase):
         self.assertEqual(agent.history_std, 1.0)
         self.assertFalse(agent.has_history)
 
-        # 验证客户端初始化
+        # 验证客户端在第一次使用时才创建，且只创建一次
+        mock_client.assert_not_called()
+        self.assertIs(agent.client, mock_client.return_value)
+        self.assertIs(agent.client, mock_client.return_value)
         mock_client.assert_called_once()
+        self.assertEqual(mock_client.call_args.kwargs["api_key"], "test_api_key")
 
     def test_calc_h_score_formula(self):
         """测试H Score计算公式"""
@@ -183,6 +198,59 @@ class TestCloudQuantAgent(unittest.TestCase):
         # 验证标准差被设置为最小值
         self.assertEqual(agent.history_std, 1e-5)
 
+    @patch("cloud_agent.genai.Client")
+    def test_update_history_baseline_incremental(self, mock_client):
+        """测试增量基准：新增、修正、移除记录，并通过状态文件跨运行恢复"""
+
+        def record(record_id, like, status="已分析"):
+            return {"record_id": record_id, "fields": {"状态": status, "点赞": like}}
+
+        agent = CloudQuantAgent()
+        agent.build_history_baseline([record(f"r{i}", 100 * i) for i in range(1, 5)])
+        self.assertAlmostEqual(agent.history_mean, 250)
+
+        # r1 指标变化，r2 改回待分析，r3 被删除，新增 r5
+        agent.update_history_baseline(
+            [record("r1", 500), record("r2", 200, "待分析"), record("r5", 600)],
+            removed=["r3"],
+        )
+        expected = [500, 400, 600]
+        self.assertEqual(agent.baseline_scores, {"r1": 500, "r4": 400, "r5": 600})
+        self.assertAlmostEqual(agent.history_mean, np.mean(expected))
+        self.assertAlmostEqual(agent.history_std, np.std(expected))
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "state", "baseline.json")
+            agent.save_baseline_state(path)
+
+            restored = CloudQuantAgent()
+            self.assertTrue(restored.load_baseline_state(path))
+            self.assertFalse(restored.load_baseline_state(path + ".missing"))
+
+        self.assertTrue(restored.has_history)
+        self.assertAlmostEqual(restored.history_std, agent.history_std)
+        self.assertEqual(
+            list(restored.history_window.values()), [100, 200, 300, 400, 600]
+        )
+
+        # 读取中断：没读到的记录不视为已消失
+        self.assertFalse(
+            restored.build_history_baseline(
+                [record("r4", 400)], incremental=True, complete=lambda: False
+            )
+        )
+        self.assertEqual(restored.baseline.count, 3)
+        self.assertAlmostEqual(restored.history_mean, np.mean(expected))
+
+        # 全量对账：只出现 r4、r5，其余记录从统计中移除
+        self.assertTrue(
+            restored.build_history_baseline(
+                [record("r4", 400), record("r5", 600)], incremental=True
+            )
+        )
+        self.assertEqual(restored.baseline.count, 2)
+        self.assertFalse(restored.has_history)
+
     @patch("cloud_agent.genai.Client")
     def test_analyze_without_history(self, mock_client):
         """测试分析功能 - 无历史数据"""
@@ -307,6 +375,401 @@ class TestCloudQuantAgent(unittest.TestCase):
         self.assertIn("Error", result["analysis"])
         self.assertEqual(result["action"], "Retry")
 
+    @patch("cloud_agent.genai.Client")
+    def test_analyze_records_metrics(self, mock_client):
+        """测试分析时记录 LLM 请求数、延迟、错误和 token 用量"""
+        default_metrics.reset()
+        mock_response = MagicMock()
+        mock_response.text = '{"analysis": "ok"}'
+        mock_response.usage_metadata.prompt_token_count = 200
+        mock_response.usage_metadata.candidates_token_count = 50
+        generate = mock_client.return_value.models.generate_content
+        generate.side_effect = [mock_response, Exception("API Error")]
+
+        agent = CloudQuantAgent()
+        post_data = {
+            "title": "测试帖子",
+            "like": 100,
+            "comment": 20,
+            "save": 50,
+            "share": 5,
+        }
+        agent.analyze(post_data)
+        agent.analyze(dict(post_data, title="另一篇"))
+
+        snapshot = default_metrics.snapshot()
+        self.assertEqual(snapshot["counters"]["llm_requests"], 2)
+        self.assertEqual(snapshot["counters"]["llm_errors"], 1)
+        self.assertEqual(snapshot["counters"]["llm_prompt_tokens"], 200)
+        self.assertEqual(snapshot["counters"]["llm_response_tokens"], 50)
+        self.assertEqual(snapshot["timings"]["llm"]["count"], 2)
+        self.assertEqual(snapshot["timings"]["prompt_build"]["count"], 2)
+        self.assertEqual(snapshot["timings"]["parse"]["count"], 1)
+
+    @patch("cloud_agent.genai.Client")
+    def test_analyze_uses_response_cache(self, mock_client):
+        """测试分析功能 - 相同prompt命中缓存，失败结果不缓存"""
+        mock_response = MagicMock()
+        mock_response.text = '{"analysis": "缓存结果", "action": "追涨"}'
+        generate = mock_client.return_value.models.generate_content
+        generate.side_effect = [Exception("API Error"), mock_response]
+
+        agent = CloudQuantAgent(cache=ResponseCache())
+        post_data = {"title": "帖子", "like": 1, "comment": 0, "save": 0, "share": 0}
+
+        failed, _, _ = agent.analyze(post_data)
+        first, _, _ = agent.analyze(post_data)
+        second, _, _ = agent.analyze(post_data)
+
+        self.assertEqual(failed["action"], "Retry")
+        self.assertEqual(first, second)
+        self.assertEqual(generate.call_count, 2)
+        self.assertEqual(agent.cache.stats()["hits"], 1)
+
+    @patch("cloud_agent.genai.Client")
+    def test_analyze_batch_single_request(self, mock_client):
+        """测试打包分析 - 多篇笔记只发送一次请求并按record_id拆分"""
+        mock_response = MagicMock()
+        mock_response.text = json.dumps(
+            [
+                {
+                    "record_id": f"rec{i}",
+                    "analysis": f"分析{i}",
+                    "action": "追涨",
+                    "next_title": f"标题{i}",
+                }
+                for i in (2, 0, 1)
+            ]
+        )
+        generate = mock_client.return_value.models.generate_content
+        generate.return_value = mock_response
+
+        agent = CloudQuantAgent()
+        posts = [
+            {
+                "record_id": f"rec{i}",
+                "title": f"帖子{i}",
+                "like": i,
+                "comment": 0,
+                "save": 0,
+                "share": 0,
+            }
+            for i in range(3)
+        ]
+
+        results = agent.analyze_batch(posts)
+
+        generate.assert_called_once()
+        prompt = generate.call_args.kwargs["contents"]
+        self.assertEqual(prompt.count("【判断标准】"), 1)
+        self.assertIsNotNone(generate.call_args.kwargs["config"].response_schema)
+        for i, (result, h_score, _) in enumerate(results):
+            self.assertEqual(result["analysis"], f"分析{i}")
+            self.assertNotIn("record_id", result)
+            self.assertEqual(h_score, i)
+
+    @patch("cloud_agent.genai.Client")
+    def test_analyze_batch_falls_back_for_invalid_items(self, mock_client):
+        """测试打包分析 - 缺失或校验失败的笔记回退为单篇调用"""
+        batch_response = MagicMock()
+        batch_response.text = json.dumps(
+            [
+                {
+                    "record_id": "rec0",
+                    "analysis": "分析0",
+                    "action": "追涨",
+                    "next_title": "标题0",
+                },
+                {"record_id": "rec1", "analysis": "缺少字段"},
+                {
+                    "record_id": "unknown",
+                    "analysis": "a",
+                    "action": "b",
+                    "next_title": "c",
+                },
+            ]
+        )
+        single_response = MagicMock()
+        single_response.text = (
+            '{"analysis": "单篇", "action": "互动", "next_title": "x"}'
+        )
+        generate = mock_client.return_value.models.generate_content
+        generate.side_effect = [batch_response, single_response, single_response]
+
+        agent = CloudQuantAgent()
+        posts = [
+            {
+                "record_id": f"rec{i}",
+                "title": f"帖子{i}",
+                "like": i,
+                "comment": 0,
+                "save": 0,
+                "share": 0,
+            }
+            for i in range(3)
+        ]
+
+        results = agent.analyze_batch(posts)
+
+        self.assertEqual(generate.call_count, 3)
+        self.assertEqual(results[0][0]["analysis"], "分析0")
+        self.assertEqual(results[1][0]["analysis"], "单篇")
+        self.assertEqual(results[2][0]["analysis"], "单篇")
+
+    @patch("cloud_agent.genai.Client")
+    def test_analyze_many_with_batches(self, mock_client):
+        """测试并发分析 - 按batch_size打包"""
+
+        def mock_generate_content(*args, **kwargs):
+            records = [
+                json.loads(line)
+                for line in kwargs["contents"].splitlines()
+                if line.strip().startswith('{"record_id"')
+            ]
+            response = MagicMock()
+            response.text = json.dumps(
+                [
+                    {
+                        "record_id": r["record_id"],
+                        "analysis": r["标题"],
+                        "action": "a",
+                        "next_title": "t",
+                    }
+                    for r in records
+                ]
+            )
+            return response
+
+        generate = mock_client.return_value.models.generate_content
+        generate.side_effect = mock_generate_content
+
+        agent = CloudQuantAgent()
+        posts = [
+            {
+                "record_id": f"rec{i}",
+                "title": f"帖子{i}",
+                "like": i,
+                "comment": 0,
+                "save": 0,
+                "share": 0,
+            }
+            for i in range(6)
+        ]
+
+        results = agent.analyze_many(posts, max_workers=2, batch_size=3)
+
+        self.assertEqual(generate.call_count, 2)
+        self.assertEqual(
+            [r[0]["analysis"] for r in results], [f"帖子{i}" for i in range(6)]
+        )
+
+    @patch("cloud_agent.genai.Client")
+    def test_analyze_many_with_rule_engine(self, mock_client):
+        """测试规则引擎 - 明确的笔记套用模板，只有模糊的笔记调用LLM"""
+        mock_response = MagicMock()
+        mock_response.text = '{"analysis": "LLM分析", "action": "a", "next_title": "t"}'
+        generate = mock_client.return_value.models.generate_content
+        generate.return_value = mock_response
+
+        agent = CloudQuantAgent(rule_engine=True)
+        agent.has_history = True
+        agent.history_mean = 500
+        agent.history_std = 200
+
+        def post(record_id, like, comment, save, share):
+            return {
+                "record_id": record_id,
+                "title": record_id,
+                "like": like,
+                "comment": comment,
+                "save": save,
+                "share": share,
+            }
+
+        posts = [
+            post("干货", 10, 0, 200, 50),  # Z = 5.05, 收藏+分享主导
+            post("冷门", 10, 0, 0, 0),  # Z = -2.45
+            post("争议", 0, 300, 0, 0),  # Z = 3.5, 评论主导
+            post("普通", 450, 5, 0, 1),  # Z = 0.4
+        ]
+
+        results = agent.analyze_many(posts, max_workers=2)
+
+        self.assertIn("追涨", results[0][0]["action"])
+        self.assertEqual(results[0][0]["next_title"], "干货（进阶版）")
+        self.assertIn("止损", results[1][0]["action"])
+        self.assertIn("互动", results[2][0]["action"])
+        self.assertEqual(results[3][0]["analysis"], "LLM分析")
+        self.assertEqual([r[1] for r in results], [1510, 10, 1200, 480])
+        self.assertEqual(generate.call_count, 1)
+
+        # 单篇分析同样走规则引擎；没有历史基准时全部交给LLM
+        self.assertIn("止损", agent.analyze(posts[1])[0]["action"])
+        agent.has_history = False
+        self.assertEqual(agent.analyze(posts[1])[0]["analysis"], "LLM分析")
+        self.assertEqual(generate.call_count, 2)
+
+    @patch("cloud_agent.genai.Client")
+    def test_ma_ratio_in_prompts(self, mock_client):
+        """测试H/MA5：基准线保留最近5篇，批内按顺序计算并写入Prompt"""
+        agent = CloudQuantAgent()
+        records = [
+            {"fields": {"状态": "已分析", "点赞": like}}
+            for like in range(100, 800, 100)
+        ]
+        agent.build_history_baseline(records)
+
+        # MA 窗口只保留最近 5 篇: 300..700，均值 500
+        self.assertEqual(list(agent.history_window.values()), [300, 400, 500, 600, 700])
+
+        posts = [
+            {
+                "record_id": "a",
+                "title": "a",
+                "like": 1000,
+                "comment": 0,
+                "save": 0,
+                "share": 0,
+            },
+            {
+                "record_id": "b",
+                "title": "b",
+                "like": 580,
+                "comment": 0,
+                "save": 0,
+                "share": 0,
+            },
+        ]
+        posts = agent.with_ma_ratios(posts)
+
+        self.assertAlmostEqual(posts[0]["ma_ratio"], 2.0)
+        # 第二篇的窗口: 400, 500, 600, 700, 1000 -> 均值 640
+        self.assertAlmostEqual(posts[1]["ma_ratio"], 580 / 640)
+        prompt = agent.build_prompt(posts[0], *agent._score(posts[0]))
+        self.assertIn("H/MA5 (近期表现): 2.00", prompt)
+        self.assertIn(
+            '"H/MA5": 2.0', agent.build_batch_prompt([("a", posts[0], 1000, 1.0)])
+        )
+
+        # 没有历史时显示暂无
+        empty = CloudQuantAgent()
+        raw_post = {"title": "a", "like": 1000, "comment": 0, "save": 0, "share": 0}
+        self.assertIn("H/MA5 (近期表现): 暂无", empty.build_prompt(raw_post, 1000, 0.0))
+
+    @patch("cloud_agent.genai.Client")
+    def test_analyze_many_with_token_budget(self, mock_client):
+        """测试并发分析 - 按token预算装箱，结果保持原顺序"""
+
+        def mock_generate_content(*args, **kwargs):
+            records = [
+                json.loads(line)
+                for line in kwargs["contents"].splitlines()
+                if line.strip().startswith('{"record_id"')
+            ]
+            response = MagicMock()
+            if not records:
+                # 单独成批的笔记走单篇 Prompt
+                title = kwargs["contents"].split("标题: ")[1].split("\n")[0]
+                response.text = json.dumps({"analysis": title})
+                return response
+            response.text = json.dumps(
+                [
+                    {
+                        "record_id": r["record_id"],
+                        "analysis": r["标题"],
+                        "action": "a",
+                        "next_title": "t",
+                    }
+                    for r in records
+                ]
+            )
+            return response
+
+        generate = mock_client.return_value.models.generate_content
+        generate.side_effect = mock_generate_content
+
+        agent = CloudQuantAgent()
+        posts = [
+            {
+                "record_id": f"rec{i}",
+                "title": ("长标题" * 100) if i == 2 else f"帖子{i}",
+                "like": i,
+                "comment": 0,
+                "save": 0,
+                "share": 0,
+            }
+            for i in range(6)
+        ]
+        overhead = agent.estimator.estimate(agent.build_batch_prompt([]))
+        budget = overhead + 3 * 200
+
+        batches = agent.plan_batches(posts, budget)
+        results = agent.analyze_many(posts, max_workers=2, token_budget=budget)
+
+        # 超长标题的笔记独占一批，其余笔记按预算装箱
+        self.assertIn([2], batches)
+        self.assertEqual(len(batches), 3)
+        self.assertEqual(generate.call_count, 3)
+        self.assertEqual(
+            [r[0]["analysis"] for r in results], [p["title"] for p in posts]
+        )
+
+    @patch("rate_limiter.time.sleep")
+    @patch("cloud_agent.genai.Client")
+    def test_analyze_retries_rate_limited_call(self, mock_client, mock_sleep):
+        """测试分析功能 - 429限流时排队重试而不是返回错误结果"""
+        mock_response = MagicMock()
+        mock_response.text = '{"analysis": "重试成功", "action": "追涨"}'
+        mock_client.return_value.models.generate_content.side_effect = [
+            Exception("429 RESOURCE_EXHAUSTED"),
+            mock_response,
+        ]
+
+        agent = CloudQuantAgent(rate_limiter=RateLimiter(rpm=100, tpm=100000))
+        post_data = {"title": "帖子", "like": 1, "comment": 0, "save": 0, "share": 0}
+
+        result, _, _ = agent.analyze(post_data)
+
+        self.assertEqual(result["analysis"], "重试成功")
+        self.assertFalse(agent.is_failed_result(result))
+        self.assertEqual(agent.rate_limiter.rate_limited_retries, 1)
+
+    @patch("cloud_agent.genai.Client")
+    def test_analyze_many_preserves_order(self, mock_client):
+        """测试并发分析 - 结果顺序与输入一致且单条错误隔离"""
+
+        def mock_generate_content(*args, **kwargs):
+            prompt = kwargs["contents"]
+            # 前面的帖子响应更慢，完成顺序与输入顺序相反
+            for i in range(5):
+                if f"帖子{i}" in prompt:
+                    time.sleep((5 - i) * 0.01)
+                    if i == 2:
+                        raise Exception("API Error")
+                    response = MagicMock()
+                    response.text = json.dumps({"analysis": f"分析{i}"})
+                    return response
+
+        mock_client.return_value.models.generate_content.side_effect = (
+            mock_generate_content
+        )
+
+        agent = CloudQuantAgent()
+        posts = [
+            {"title": f"帖子{i}", "like": i, "comment": 0, "save": 0, "share": 0}
+            for i in range(5)
+        ]
+
+        results = agent.analyze_many(posts, max_workers=5)
+
+        self.assertEqual(len(results), 5)
+        for i, (result, h_score, z_score) in enumerate(results):
+            self.assertEqual(h_score, i)
+            if i == 2:
+                self.assertEqual(result["action"], "Retry")
+            else:
+                self.assertEqual(result["analysis"], f"分析{i}")
+
 
 class TestFeishuConnector(unittest.TestCase):
     """测试FeishuConnector类"""
@@ -316,7 +779,7 @@ class TestFeishuConnector(unittest.TestCase):
         self.app_id = "test_app_id"
         self.app_secret = "test_app_secret"
 
-    @patch("cloud_agent.requests.post")
+    @patch("cloud_agent.requests.Session.post")
     def test_get_tenant_access_token_success(self, mock_post):
         """测试获取租户访问令牌 - 成功"""
         # 模拟成功响应
@@ -339,9 +802,10 @@ class TestFeishuConnector(unittest.TestCase):
         mock_post.assert_called_once_with(
             "https://open.feishu.cn/open-apis/auth/v3/tenant_access_token/internal",
             json={"app_id": self.app_id, "app_secret": self.app_secret},
+            timeout=connector.timeout,
         )
 
-    @patch("cloud_agent.requests.post")
+    @patch("cloud_agent.requests.Session.post")
     def test_get_tenant_access_token_failure(self, mock_post):
         """测试获取租户访问令牌 - 失败"""
         # 模拟失败响应
@@ -355,6 +819,42 @@ class TestFeishuConnector(unittest.TestCase):
         # 验证token为None
         self.assertIsNone(connector.token)
 
+    def test_session_pool_and_retry_config(self):
+        """测试连接池、超时和重试配置"""
+        connector = FeishuConnector(
+            self.app_id,
+            self.app_secret,
+            "user_token",
+            pool_size=4,
+            connect_timeout=2,
+            read_timeout=10,
+            max_retries=5,
+        )
+
+        self.assertEqual(connector.timeout, (2, 10))
+        adapter = connector.session.get_adapter("https://open.feishu.cn")
+        self.assertEqual(adapter._pool_maxsize, 4)
+        self.assertEqual(adapter.max_retries.total, 5)
+        self.assertIn(429, adapter.max_retries.status_forcelist)
+        self.assertIn(503, adapter.max_retries.status_forcelist)
+        self.assertTrue(adapter.max_retries.respect_retry_after_header)
+
+    @patch("cloud_agent.requests.Session.get")
+    def test_requests_share_session_with_timeout(self, mock_get):
+        """测试请求复用同一个Session并带超时"""
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"code": 0, "data": {"items": []}}
+        mock_get.return_value = mock_response
+
+        connector = FeishuConnector(self.app_id, self.app_secret, "user_token")
+        connector.get_records("app_token", "table_id")
+        connector.get_records("app_token", "table_id")
+
+        self.assertEqual(mock_get.call_count, 2)
+        for call in mock_get.call_args_list:
+            self.assertEqual(call.kwargs["timeout"], connector.timeout)
+
     def test_init_with_user_token(self):
         """测试使用用户令牌初始化"""
         user_token = "user_token_123"
@@ -364,7 +864,7 @@ class TestFeishuConnector(unittest.TestCase):
         # 验证使用用户令牌
         self.assertEqual(connector.token, user_token)
 
-    @patch("cloud_agent.requests.get")
+    @patch("cloud_agent.requests.Session.get")
     def test_get_records_success(self, mock_get):
         """测试获取记录 - 成功"""
         # 模拟成功响应
@@ -382,7 +882,7 @@ class TestFeishuConnector(unittest.TestCase):
         }
         mock_get.return_value = mock_response
 
-        with patch("cloud_agent.requests.post") as mock_post:
+        with patch("cloud_agent.requests.Session.post") as mock_post:
             # 模拟token获取成功
             mock_token_response = MagicMock()
             mock_token_response.json.return_value = {
@@ -400,9 +900,100 @@ class TestFeishuConnector(unittest.TestCase):
         self.assertEqual(len(records), 2)
         self.assertEqual(records[0]["record_id"], "rec123")
 
+    @patch("cloud_agent.requests.Session.get")
+    def test_iter_records_pagination(self, mock_get):
+        """测试分页读取记录 - 自动翻页并报告进度"""
+        page_1 = MagicMock()
+        page_1.status_code = 200
+        page_1.json.return_value = {
+            "code": 0,
+            "data": {
+                "items": [{"fields": {}, "record_id": "rec1"}],
+                "has_more": True,
+                "page_token": "token_page_2",
+                "total": 2,
+            },
+        }
+        page_2 = MagicMock()
+        page_2.status_code = 200
+        page_2.json.return_value = {
+            "code": 0,
+            "data": {
+                "items": [{"fields": {}, "record_id": "rec2"}],
+                "has_more": False,
+                "total": 2,
+            },
+        }
+        mock_get.side_effect = [page_1, page_2]
+
+        connector = FeishuConnector(self.app_id, self.app_secret, "user_token")
+        progress = []
+        records = connector.iter_records(
+            "app_token",
+            "table_id",
+            on_progress=lambda fetched, total: progress.append((fetched, total)),
+        )
+
+        # 生成器在第一页到达后即可产出记录
+        self.assertEqual(next(records)["record_id"], "rec1")
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(next(records)["record_id"], "rec2")
+        self.assertEqual(list(records), [])
+
+        self.assertEqual(progress, [(1, 2), (2, 2)])
+        first_params = mock_get.call_args_list[0].kwargs["params"]
+        self.assertEqual(first_params["page_size"], 500)
+        self.assertEqual(
+            mock_get.call_args_list[1].kwargs["params"]["page_token"], "token_page_2"
+        )
+
+    @patch("cloud_agent.requests.Session.get")
+    def test_get_records_collects_all_pages(self, mock_get):
+        """测试get_records汇总所有分页"""
+        pages = []
+        for i in range(3):
+            page = MagicMock()
+            page.status_code = 200
+            page.json.return_value = {
+                "code": 0,
+                "data": {
+                    "items": [{"fields": {}, "record_id": f"rec{i}"}],
+                    "has_more": i < 2,
+                    "page_token": f"page{i + 1}",
+                },
+            }
+            pages.append(page)
+        mock_get.side_effect = pages
+
+        connector = FeishuConnector(self.app_id, self.app_secret, "user_token")
+        records = connector.get_records("app_token", "table_id")
+
+        self.assertEqual([r["record_id"] for r in records], ["rec0", "rec1", "rec2"])
+
+    @patch("cloud_agent.requests.Session.get")
+    def test_get_records_filter_and_projection(self, mock_get):
+        """测试获取记录 - 服务端筛选和字段投影参数"""
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"code": 0, "data": {"items": []}}
+        mock_get.return_value = mock_response
+
+        connector = FeishuConnector(self.app_id, self.app_secret, "user_token")
+        connector.get_records(
+            "app_token",
+            "table_id",
+            filter_formula=connector.status_filter("待分析"),
+            field_names=BASELINE_FIELDS,
+        )
+
+        params = mock_get.call_args.kwargs["params"]
+        self.assertEqual(params["filter"], 'CurrentValue.[状态]="待分析"')
+        self.assertEqual(json.loads(params["field_names"]), BASELINE_FIELDS)
+        self.assertNotIn("AI建议", json.loads(params["field_names"]))
+
     def test_get_records_no_token(self):
         """测试获取记录 - 无令牌"""
-        with patch("cloud_agent.requests.post") as mock_post:
+        with patch("cloud_agent.requests.Session.post") as mock_post:
             # 模拟token获取失败
             mock_response = MagicMock()
             mock_response.json.return_value = {"code": 1, "msg": "error"}
@@ -416,13 +1007,13 @@ class TestFeishuConnector(unittest.TestCase):
         # 应该返回空列表
         self.assertEqual(records, [])
 
-    @patch("cloud_agent.requests.get")
+    @patch("cloud_agent.requests.Session.get")
     def test_get_records_api_error(self, mock_get):
         """测试获取记录 - API错误"""
         # 模拟API错误
         mock_get.side_effect = Exception("Network Error")
 
-        with patch("cloud_agent.requests.post") as mock_post:
+        with patch("cloud_agent.requests.Session.post") as mock_post:
             mock_token_response = MagicMock()
             mock_token_response.json.return_value = {
                 "code": 0,
@@ -438,7 +1029,7 @@ class TestFeishuConnector(unittest.TestCase):
         # 应该返回空列表
         self.assertEqual(records, [])
 
-    @patch("cloud_agent.requests.put")
+    @patch("cloud_agent.requests.Session.put")
     def test_update_record_success(self, mock_put):
         """测试更新记录 - 成功"""
         # 模拟成功响应
@@ -448,7 +1039,7 @@ class TestFeishuConnector(unittest.TestCase):
         mock_response.text = '{"code": 0, "msg": "success"}'
         mock_put.return_value = mock_response
 
-        with patch("cloud_agent.requests.post") as mock_post:
+        with patch("cloud_agent.requests.Session.post") as mock_post:
             mock_token_response = MagicMock()
             mock_token_response.json.return_value = {
                 "code": 0,
@@ -466,7 +1057,7 @@ class TestFeishuConnector(unittest.TestCase):
         # 验证更新成功
         self.assertTrue(success)
 
-    @patch("cloud_agent.requests.put")
+    @patch("cloud_agent.requests.Session.put")
     def test_update_record_403_error(self, mock_put):
         """测试更新记录 - 403权限错误"""
         # 模拟403响应
@@ -475,7 +1066,7 @@ class TestFeishuConnector(unittest.TestCase):
         mock_response.text = '{"code": 91403, "msg": "Forbidden"}'
         mock_put.return_value = mock_response
 
-        with patch("cloud_agent.requests.post") as mock_post:
+        with patch("cloud_agent.requests.Session.post") as mock_post:
             mock_token_response = MagicMock()
             mock_token_response.json.return_value = {
                 "code": 0,
@@ -493,13 +1084,13 @@ class TestFeishuConnector(unittest.TestCase):
         # 验证更新失败
         self.assertFalse(success)
 
-    @patch("cloud_agent.requests.put")
+    @patch("cloud_agent.requests.Session.put")
     def test_update_record_api_error(self, mock_put):
         """测试更新记录 - API异常"""
         # 模拟API异常
         mock_put.side_effect = Exception("Network Error")
 
-        with patch("cloud_agent.requests.post") as mock_post:
+        with patch("cloud_agent.requests.Session.post") as mock_post:
             mock_token_response = MagicMock()
             mock_token_response.json.return_value = {
                 "code": 0,
@@ -517,6 +1108,182 @@ class TestFeishuConnector(unittest.TestCase):
         # 验证更新失败
         self.assertFalse(success)
 
+    @patch("cloud_agent.requests.Session.post")
+    def test_batch_update_records_chunks(self, mock_post):
+        """测试批量更新记录 - 按500条分块并返回逐条结果"""
+
+        def mock_batch_update(url, headers, json, timeout):
+            response = MagicMock()
+            response.status_code = 200
+            # 只确认每块中除 rec_0 外的记录
+            response.json.return_value = {
+                "code": 0,
+                "data": {
+                    "records": [
+                        {"record_id": r["record_id"]}
+                        for r in json["records"]
+                        if r["record_id"] != "rec_0"
+                    ]
+                },
+            }
+            return response
+
+        mock_post.side_effect = mock_batch_update
+
+        connector = FeishuConnector(self.app_id, self.app_secret, "user_token")
+        updates = [
+            {"record_id": f"rec_{i}", "fields": {"状态": "已分析"}} for i in range(1200)
+        ]
+        results = connector.batch_update_records("app_token", "table_id", updates)
+
+        self.assertEqual(mock_post.call_count, 3)
+        self.assertTrue(mock_post.call_args.args[0].endswith("/records/batch_update"))
+        self.assertEqual(len(results), 1200)
+        self.assertFalse(results["rec_0"])
+        self.assertTrue(results["rec_1199"])
+
+
+class TestWriteBackBuffer(unittest.TestCase):
+    """测试回写缓冲区"""
+
+    def setUp(self):
+        self.connector = MagicMock()
+        self.connector.batch_update_records.side_effect = lambda a, t, updates, **kw: {
+            item["record_id"]: item["record_id"] != "rec_bad" for item in updates
+        }
+
+    def test_flush_when_batch_full(self):
+        """测试攒满批次后自动写回"""
+        buffer = WriteBackBuffer(self.connector, "app", "table", max_batch_size=2)
+
+        buffer.add("rec_1", "建议1")
+        self.connector.batch_update_records.assert_not_called()
+        buffer.add("rec_2", "建议2")
+
+        self.connector.batch_update_records.assert_called_once()
+        updates = self.connector.batch_update_records.call_args.args[2]
+        self.assertEqual([u["record_id"] for u in updates], ["rec_1", "rec_2"])
+        self.assertEqual(updates[0]["fields"], {"AI建议": "建议1", "状态": "已分析"})
+        self.assertEqual(buffer.pending, {})
+
+    def test_flush_after_interval(self):
+        """测试超过时间间隔后自动写回"""
+        buffer = WriteBackBuffer(self.connector, "app", "table", flush_interval=0)
+        buffer.add("rec_1", "建议1")
+
+        self.connector.batch_update_records.assert_called_once()
+
+    def test_retry_failed_individually(self):
+        """测试批量写回失败的记录逐条重试"""
+        self.connector.update_record.return_value = True
+
+        with WriteBackBuffer(self.connector, "app", "table") as buffer:
+            buffer.add("rec_ok", "建议1")
+            buffer.add("rec_bad", "建议2")
+
+        self.assertEqual(buffer.failed, ["rec_bad"])
+        self.assertEqual(buffer.retry_failed(), [])
+
+        self.connector.update_record.assert_called_once_with(
+            "app", "table", "rec_bad", "建议2"
+        )
+        self.assertEqual(buffer.results, {"rec_ok": True, "rec_bad": True})
+
+
+class TestTenantTokenManager(unittest.TestCase):
+    """测试租户令牌管理"""
+
+    def setUp(self):
+        self.fetch_token = MagicMock(return_value=("token_1", 7200))
+
+    def test_token_reused_until_refresh_margin(self):
+        """测试令牌在有效期内复用，临近过期时提前刷新"""
+        manager = TenantTokenManager(
+            self.fetch_token, "app_id", "secret", refresh_margin=300
+        )
+
+        with patch("cloud_agent.time.time", return_value=1000.0):
+            self.assertEqual(manager.get(), "token_1")
+            self.assertEqual(manager.get(), "token_1")
+        self.assertEqual(self.fetch_token.call_count, 1)
+        self.assertEqual(manager.expires_at, 1000.0 + 7200)
+
+        # 距过期不足 300 秒时刷新
+        self.fetch_token.return_value = ("token_2", 7200)
+        with patch("cloud_agent.time.time", return_value=1000.0 + 7000):
+            self.assertEqual(manager.get(), "token_2")
+        self.assertEqual(self.fetch_token.call_count, 2)
+
+    def test_failed_fetch_not_retried_immediately(self):
+        """测试获取失败后不会立即重复请求"""
+        self.fetch_token.return_value = (None, 0)
+        manager = TenantTokenManager(self.fetch_token, "app_id", "secret")
+
+        self.assertIsNone(manager.get())
+        self.assertIsNone(manager.get())
+        self.assertEqual(self.fetch_token.call_count, 1)
+
+    def test_encrypted_cache_file_roundtrip(self):
+        """测试令牌加密缓存到本地文件并被下一次运行复用"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache_file = os.path.join(tmp_dir, "token.cache")
+
+            TenantTokenManager(
+                self.fetch_token, "app_id", "secret", cache_file=cache_file
+            ).get()
+
+            # 文件内容不应包含明文令牌
+            with open(cache_file, "rb") as f:
+                self.assertNotIn(b"token_1", f.read())
+
+            fetch_again = MagicMock(return_value=("token_new", 7200))
+            reused = TenantTokenManager(
+                fetch_again, "app_id", "secret", cache_file=cache_file
+            )
+            self.assertEqual(reused.get(), "token_1")
+            fetch_again.assert_not_called()
+
+            # 密钥不同 (app_secret 变化) 时缓存不可用
+            other = TenantTokenManager(
+                fetch_again, "app_id", "other_secret", cache_file=cache_file
+            )
+            self.assertEqual(other.get(), "token_new")
+
+    @patch("cloud_agent.requests.Session.get")
+    @patch("cloud_agent.requests.Session.post")
+    def test_invalid_token_refreshed_and_retried(self, mock_post, mock_get):
+        """测试令牌失效时自动刷新并重试请求"""
+        token_responses = []
+        for token in ("stale_token", "fresh_token"):
+            response = MagicMock()
+            response.json.return_value = {
+                "code": 0,
+                "tenant_access_token": token,
+                "expire": 7200,
+            }
+            token_responses.append(response)
+        mock_post.side_effect = token_responses
+
+        invalid = MagicMock()
+        invalid.status_code = 400
+        invalid.json.return_value = {"code": 99991663, "msg": "invalid token"}
+        ok = MagicMock()
+        ok.status_code = 200
+        ok.json.return_value = {
+            "code": 0,
+            "data": {"items": [{"fields": {}, "record_id": "rec1"}]},
+        }
+        mock_get.side_effect = [invalid, ok]
+
+        connector = FeishuConnector("app_id", "app_secret")
+        records = connector.get_records("app_token", "table_id")
+
+        self.assertEqual([r["record_id"] for r in records], ["rec1"])
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertEqual(
+            mock_get.call_args.kwargs["headers"]["Authorization"], "Bearer fresh_token"
+        )
+
 
 if __name__ == "__main__":
     unittest.main(verbosity=2)
@@ -68,9 +68,9 @@ class TestCloudAgentIntegration(unittest.TestCase):
             }
         ]
 
-    @patch('cloud_agent.requests.post')
-    @patch('cloud_agent.requests.get')
-    @patch('cloud_agent.requests.put')
+    @patch('cloud_agent.requests.Session.post')
+    @patch('cloud_agent.requests.Session.get')
+    @patch('cloud_agent.requests.Session.put')
     @patch('cloud_agent.genai.Client')
     def test_complete_cloud_workflow(self, mock_genai, mock_put, mock_get, mock_post):
         """测试完整的云端分析工作流程"""
@@ -170,7 +170,7 @@ class TestCloudAgentIntegration(unittest.TestCase):
             # 验证更新成功
             self.assertTrue(success)
 
-    @patch('cloud_agent.requests.post')
+    @patch('cloud_agent.requests.Session.post')
     def test_feishu_token_error_handling(self, mock_post):
         """测试飞书token获取错误处理"""
         # 模拟token获取失败
@@ -251,8 +251,8 @@ class TestCloudAgentIntegration(unittest.TestCase):
                 
                 self.assertEqual(h_score, expected)
 
-    @patch('cloud_agent.requests.post')
-    @patch('cloud_agent.requests.get')
+    @patch('cloud_agent.requests.Session.post')
+    @patch('cloud_agent.requests.Session.get')
     @patch('cloud_agent.genai.Client')
     def test_error_resilience(self, mock_genai, mock_get, mock_post):
         """测试错误恢复能力"""
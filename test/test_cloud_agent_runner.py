@@ -0,0 +1,602 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+import time
+from unittest.mock import patch, MagicMock
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import cloud_agent_runner
+
+
+class TestCloudAgentRunner(unittest.TestCase):
+    """测试云端运行入口 cloud_agent_runner.main"""
+
+    def setUp(self):
+        """测试前设置"""
+        self.env = patch.dict(
+            os.environ,
+            {
+                "GEMINI_API_KEY": "test_gemini_key",
+                "FS_APP_ID": "app_id",
+                "FS_APP_SECRET": "app_secret",
+                "FS_APP_TOKEN": "app_token",
+                "FS_TABLE_ID": "table_id",
+                "ANALYSIS_CONCURRENCY": "3",
+                "LLM_CACHE_PATH": "",
+                "RULE_ENGINE": "0",
+                "BASELINE_STATE_FILE": "",
+                "MIRROR_PATH": "",
+                "JOURNAL_FILE": "",
+                "METRICS_DIR": "",
+            },
+        )
+        self.env.start()
+        self.addCleanup(self.env.stop)
+
+        self.baseline_records = [
+            {
+                "fields": {
+                    "状态": "已分析",
+                    "点赞": like,
+                    "评论": 0,
+                    "收藏": 0,
+                    "分享": 0,
+                },
+                "record_id": f"old{like}",
+            }
+            for like in (100, 200, 300)
+        ]
+        self.pending_records = [
+            {
+                "fields": {
+                    "标题": f"待分析{i}",
+                    "状态": "待分析",
+                    "点赞": 100 * i,
+                    "评论": 10,
+                    "收藏": 20,
+                    "分享": 1,
+                },
+                "record_id": f"rec{i}",
+            }
+            for i in range(4)
+        ]
+
+    def _mock_feishu(self, mock_connector_cls):
+        fs = mock_connector_cls.return_value
+        fs.last_error = None
+        fs.status_filter.side_effect = lambda status: status
+        fs.iter_records.return_value = iter(self.baseline_records)
+        fs.get_records.return_value = self.pending_records
+        fs.batch_update_records.side_effect = lambda a, t, updates, **kw: {
+            u["record_id"]: True for u in updates
+        }
+        return fs
+
+    @patch("cloud_agent.genai.Client")
+    @patch("cloud_agent_runner.FeishuConnector")
+    def test_main_analyzes_and_writes_back_in_order(self, mock_connector, mock_genai):
+        """测试主流程：并发分析后按记录顺序批量写回"""
+        fs = self._mock_feishu(mock_connector)
+
+        def mock_generate_content(*args, **kwargs):
+            response = MagicMock()
+            title = kwargs["contents"].split("标题: ")[1].split("\n")[0]
+            response.text = json.dumps({"analysis": title})
+            return response
+
+        mock_genai.return_value.models.generate_content.side_effect = (
+            mock_generate_content
+        )
+
+        with patch("builtins.print") as mock_print:
+            cloud_agent_runner.main()
+
+        updates = fs.batch_update_records.call_args.args[2]
+        self.assertEqual(
+            [u["record_id"] for u in updates], ["rec0", "rec1", "rec2", "rec3"]
+        )
+        for i, update in enumerate(updates):
+            suggestion = json.loads(update["fields"]["AI建议"])
+            self.assertEqual(suggestion["analysis"], f"待分析{i}")
+            self.assertEqual(update["fields"]["状态"], "已分析")
+
+        mock_print.assert_any_call("处理完成，共分析 4 条记录")
+
+    @patch("cloud_agent.genai.Client")
+    @patch("cloud_agent_runner.FeishuConnector")
+    def test_main_skips_failed_analysis(self, mock_connector, mock_genai):
+        """测试分析失败的记录不写回，保留为待分析"""
+        fs = self._mock_feishu(mock_connector)
+
+        def mock_generate_content(*args, **kwargs):
+            if "待分析1" in kwargs["contents"]:
+                raise Exception("API Error")
+            response = MagicMock()
+            response.text = '{"analysis": "ok"}'
+            return response
+
+        mock_genai.return_value.models.generate_content.side_effect = (
+            mock_generate_content
+        )
+
+        with patch("builtins.print"):
+            cloud_agent_runner.main()
+
+        updates = fs.batch_update_records.call_args.args[2]
+        self.assertEqual([u["record_id"] for u in updates], ["rec0", "rec2", "rec3"])
+
+    @patch("cloud_agent.genai.Client")
+    @patch("cloud_agent_runner.FeishuConnector")
+    def test_main_without_pending_records(self, mock_connector, mock_genai):
+        """测试没有待分析记录时直接返回"""
+        fs = self._mock_feishu(mock_connector)
+        fs.get_records.return_value = []
+
+        with patch("builtins.print"):
+            cloud_agent_runner.main()
+
+        # 没有待分析记录时不创建 Gemini 客户端
+        mock_genai.assert_not_called()
+        fs.batch_update_records.assert_not_called()
+
+    @patch("cloud_agent.genai.Client")
+    @patch("cloud_agent_runner.FeishuConnector")
+    def test_main_with_token_budget(self, mock_connector, mock_genai):
+        """测试按token预算装箱：首次运行用count_tokens校准并保存估算器"""
+        fs = self._mock_feishu(mock_connector)
+        client = mock_genai.return_value
+        client.models.count_tokens.return_value = MagicMock(total_tokens=400)
+
+        def mock_generate_content(*args, **kwargs):
+            records = [
+                json.loads(line)
+                for line in kwargs["contents"].splitlines()
+                if line.strip().startswith('{"record_id"')
+            ]
+            response = MagicMock()
+            response.text = json.dumps(
+                [
+                    {
+                        "record_id": r["record_id"],
+                        "analysis": r["标题"],
+                        "action": "a",
+                        "next_title": "t",
+                    }
+                    for r in records
+                ]
+            )
+            return response
+
+        client.models.generate_content.side_effect = mock_generate_content
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            estimator_file = os.path.join(temp_dir, "cache", "estimator.json")
+            env = {
+                "ANALYSIS_TOKEN_BUDGET": "100000",
+                "TOKEN_ESTIMATOR_FILE": estimator_file,
+            }
+            with patch.dict(os.environ, env), patch("builtins.print"):
+                cloud_agent_runner.main()
+
+            self.assertTrue(os.path.exists(estimator_file))
+
+        # 4 篇笔记在预算内打包成一次请求
+        self.assertEqual(client.models.generate_content.call_count, 1)
+        self.assertEqual(client.models.count_tokens.call_count, 4)
+        updates = fs.batch_update_records.call_args.args[2]
+        self.assertEqual(
+            [u["record_id"] for u in updates], ["rec0", "rec1", "rec2", "rec3"]
+        )
+
+    @patch("cloud_agent.genai.Client")
+    @patch("cloud_agent_runner.FeishuConnector")
+    def test_batch_submit_then_collect(self, mock_connector, mock_genai):
+        """测试离线模式：submit 写任务文件并提交，collect 取回结果后批量写回"""
+        fs = self._mock_feishu(mock_connector)
+        generate = mock_genai.return_value.models.generate_content
+
+        def mock_generate_content(*args, **kwargs):
+            response = MagicMock()
+            title = kwargs["contents"].split("标题: ")[1].split("\n")[0]
+            response.text = json.dumps({"analysis": title})
+            return response
+
+        generate.side_effect = mock_generate_content
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            env = {"BATCH_BACKEND": "local", "BATCH_JOB_DIR": temp_dir}
+
+            with patch.dict(os.environ, dict(env, ANALYSIS_MODE="submit")):
+                with patch("builtins.print") as mock_print:
+                    cloud_agent_runner.main()
+                # 任务进行中时不会重复提交
+                with patch("builtins.print") as mock_print_again:
+                    cloud_agent_runner.main()
+
+            generate.assert_not_called()
+            fs.batch_update_records.assert_not_called()
+            self.assertTrue(os.path.exists(os.path.join(temp_dir, "state.json")))
+            # 运行指标汇总打印在最后
+            submitted = [call.args[0] for call in mock_print.call_args_list]
+            skipped = [call.args[0] for call in mock_print_again.call_args_list]
+            self.assertTrue(any("共 4 条记录" in line for line in submitted))
+            self.assertTrue(any("跳过提交" in line for line in skipped))
+
+            with patch.dict(os.environ, dict(env, ANALYSIS_MODE="collect")):
+                with patch("builtins.print") as mock_print:
+                    cloud_agent_runner.main()
+
+            self.assertFalse(os.path.exists(os.path.join(temp_dir, "state.json")))
+
+        # collect 不需要重新读取表格
+        fs.get_records.assert_called_once()
+        updates = fs.batch_update_records.call_args.args[2]
+        self.assertEqual(
+            [u["record_id"] for u in updates], ["rec0", "rec1", "rec2", "rec3"]
+        )
+        for i, update in enumerate(updates):
+            suggestion = json.loads(update["fields"]["AI建议"])
+            self.assertEqual(suggestion["analysis"], f"待分析{i}")
+        mock_print.assert_any_call("处理完成，共分析 4 条记录")
+
+    @patch("cloud_agent.genai.Client")
+    @patch("cloud_agent_runner.FeishuConnector")
+    def test_batch_collect_pending_job(self, mock_connector, mock_genai):
+        """测试 Gemini 批处理任务未完成时保留任务状态，不写回"""
+        fs = self._mock_feishu(mock_connector)
+        client = mock_genai.return_value
+        client.batches.create.return_value.name = "batches/123"
+        client.batches.get.return_value.state.name = "JOB_STATE_RUNNING"
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            env = {"BATCH_JOB_DIR": temp_dir}
+            with patch.dict(os.environ, dict(env, ANALYSIS_MODE="submit")):
+                with patch("builtins.print"):
+                    cloud_agent_runner.main()
+            with patch.dict(os.environ, dict(env, ANALYSIS_MODE="collect")):
+                with patch("builtins.print") as mock_print:
+                    cloud_agent_runner.main()
+
+            self.assertTrue(os.path.exists(os.path.join(temp_dir, "state.json")))
+
+        client.files.upload.assert_called_once()
+        client.batches.get.assert_called_with(name="batches/123")
+        client.models.generate_content.assert_not_called()
+        fs.batch_update_records.assert_not_called()
+        mock_print.assert_any_call("批处理任务 batches/123 尚未完成")
+
+    @patch("cloud_agent.genai.Client")
+    @patch("cloud_agent_runner.FeishuConnector")
+    def test_main_with_rule_engine(self, mock_connector, mock_genai):
+        """测试规则引擎：跑输大盘的记录直接套用模板，其余调用LLM"""
+        fs = self._mock_feishu(mock_connector)
+        generate = mock_genai.return_value.models.generate_content
+        generate.return_value = MagicMock(text='{"analysis": "LLM分析"}')
+
+        with patch.dict(os.environ, {"RULE_ENGINE": "1"}):
+            with patch("builtins.print") as mock_print:
+                cloud_agent_runner.main()
+
+        # 基准 H: 100/200/300，rec0 的 H = 150，Z = -0.61 -> 止损
+        updates = fs.batch_update_records.call_args.args[2]
+        suggestions = {
+            u["record_id"]: json.loads(u["fields"]["AI建议"]) for u in updates
+        }
+        self.assertIn("止损", suggestions["rec0"]["action"])
+        for record_id in ("rec1", "rec2", "rec3"):
+            self.assertEqual(suggestions[record_id]["analysis"], "LLM分析")
+        self.assertEqual(generate.call_count, 3)
+        mock_print.assert_any_call("处理完成，共分析 4 条记录")
+
+    @patch("cloud_agent.genai.Client")
+    @patch("cloud_agent_runner.FeishuConnector")
+    def test_main_stops_when_baseline_read_fails(self, mock_connector, mock_genai):
+        """测试历史基准记录读取中断时终止运行，不分析也不写回"""
+        fs = self._mock_feishu(mock_connector)
+
+        def iter_records(*args, **kwargs):
+            yield self.baseline_records[0]
+            fs.last_error = "HTTP 500"
+
+        fs.iter_records.side_effect = iter_records
+        generate = mock_genai.return_value.models.generate_content
+
+        with patch("builtins.print") as mock_print:
+            cloud_agent_runner.main()
+
+        fs.get_records.assert_not_called()
+        fs.batch_update_records.assert_not_called()
+        generate.assert_not_called()
+        mock_print.assert_any_call("读取历史基准记录失败 (HTTP 500)，本次运行终止")
+
+    @patch("cloud_agent.genai.Client")
+    @patch("cloud_agent_runner.FeishuConnector")
+    def test_main_reports_pending_read_failure(self, mock_connector, mock_genai):
+        """测试待分析记录读取失败时报告错误，只处理已读取的记录"""
+        fs = self._mock_feishu(mock_connector)
+        generate = mock_genai.return_value.models.generate_content
+        generate.return_value = MagicMock(text='{"analysis": "ok"}')
+
+        def get_records(*args, **kwargs):
+            fs.last_error = "code 1254607"
+            return self.pending_records[:2]
+
+        fs.get_records.side_effect = get_records
+        with patch("builtins.print") as mock_print:
+            cloud_agent_runner.main()
+
+        updates = fs.batch_update_records.call_args.args[2]
+        self.assertEqual([u["record_id"] for u in updates], ["rec0", "rec1"])
+        mock_print.assert_any_call("读取待分析记录失败 (code 1254607)")
+        mock_print.assert_any_call("只处理已读取的 2 条记录")
+
+        # 一条也没有读到时直接结束
+        fs.batch_update_records.reset_mock()
+        fs.last_error = None
+        fs.iter_records.return_value = iter(self.baseline_records)
+        fs.get_records.side_effect = lambda *args, **kwargs: get_records()[:0]
+        with patch("builtins.print") as mock_print:
+            cloud_agent_runner.main()
+        fs.batch_update_records.assert_not_called()
+        mock_print.assert_any_call("读取待分析记录失败 (code 1254607)")
+
+    @patch("cloud_agent.genai.Client")
+    @patch("cloud_agent_runner.FeishuConnector")
+    def test_main_persists_baseline_state(self, mock_connector, mock_genai):
+        """测试基准状态跨运行保存，下次运行按变化增量更新"""
+        fs = self._mock_feishu(mock_connector)
+        generate = mock_genai.return_value.models.generate_content
+        generate.return_value = MagicMock(text='{"analysis": "ok"}')
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            state_file = os.path.join(temp_dir, "baseline.json")
+            with patch.dict(os.environ, {"BASELINE_STATE_FILE": state_file}):
+                with patch("builtins.print"):
+                    cloud_agent_runner.main()
+
+                with open(state_file, encoding="utf-8") as f:
+                    state = json.load(f)
+                self.assertEqual(
+                    state["scores"], {"old100": 100, "old200": 200, "old300": 300}
+                )
+
+                # 第二次运行：old100 的点赞变为 400，old300 不再是"已分析"，新增 old500
+                self.baseline_records[0]["fields"]["点赞"] = 400
+                records = self.baseline_records[:2] + [
+                    {"fields": {"状态": "已分析", "点赞": 500}, "record_id": "old500"}
+                ]
+                fs.iter_records.return_value = iter(records)
+                with patch("builtins.print"):
+                    cloud_agent_runner.main()
+
+                with open(state_file, encoding="utf-8") as f:
+                    state = json.load(f)
+
+        self.assertEqual(state["scores"], {"old100": 400, "old200": 200, "old500": 500})
+        self.assertEqual(state["stats"]["count"], 3)
+        self.assertAlmostEqual(state["stats"]["mean"], 1100 / 3)
+
+    @patch("cloud_agent.genai.Client")
+    @patch("cloud_agent_runner.FeishuConnector")
+    def test_main_keeps_baseline_state_on_partial_scan(
+        self, mock_connector, mock_genai
+    ):
+        """测试基准记录读取中断时不移除没读到的记录，也不覆盖保存的基准状态"""
+        fs = self._mock_feishu(mock_connector)
+        generate = mock_genai.return_value.models.generate_content
+        generate.return_value = MagicMock(text='{"analysis": "ok"}')
+        records = [
+            {"fields": {"状态": "已分析", "点赞": 10 * i}, "record_id": f"old{i}"}
+            for i in range(1, 11)
+        ]
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            state_file = os.path.join(temp_dir, "baseline.json")
+            with patch.dict(os.environ, {"BASELINE_STATE_FILE": state_file}):
+                fs.iter_records.return_value = iter(records)
+                with patch("builtins.print"):
+                    cloud_agent_runner.main()
+                with open(state_file, encoding="utf-8") as f:
+                    saved = json.load(f)
+                self.assertEqual(saved["stats"]["count"], 10)
+                self.assertAlmostEqual(saved["stats"]["mean"], 55)
+
+                # 第二次运行只读到前 3 条就出错
+                def partial_scan(*args, **kwargs):
+                    yield from records[:3]
+                    fs.last_error = "HTTP 502"
+
+                fs.iter_records.side_effect = partial_scan
+                fs.batch_update_records.reset_mock()
+                with patch("builtins.print") as mock_print:
+                    cloud_agent_runner.main()
+                with open(state_file, encoding="utf-8") as f:
+                    state = json.load(f)
+
+        self.assertEqual(state, saved)
+        fs.batch_update_records.assert_not_called()
+        mock_print.assert_any_call("读取历史基准记录失败 (HTTP 502)，本次运行终止")
+
+    @patch("cloud_agent.genai.Client")
+    @patch("cloud_agent_runner.FeishuConnector")
+    def test_main_reads_from_mirror(self, mock_connector, mock_genai):
+        """测试启用本地镜像时从镜像读取基准和待分析记录，写回后更新镜像状态"""
+        fs = self._mock_feishu(mock_connector)
+        fs.iter_records.side_effect = lambda *args, **kwargs: iter(
+            self.baseline_records + self.pending_records
+        )
+        generate = mock_genai.return_value.models.generate_content
+        generate.return_value = MagicMock(text='{"analysis": "ok"}')
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            mirror_path = os.path.join(temp_dir, "mirror.sqlite")
+            with patch.dict(os.environ, {"MIRROR_PATH": mirror_path}):
+                with patch("builtins.print") as mock_print:
+                    cloud_agent_runner.main()
+
+            mirror = cloud_agent_runner.BitableMirror(mirror_path)
+            analyzed = {r["record_id"] for r in mirror.records("已分析")}
+            pending = mirror.records("待分析")
+            mirror.close()
+
+        fs.get_records.assert_not_called()
+        self.assertEqual(fs.iter_records.call_count, 1)
+        self.assertTrue(fs.iter_records.call_args.kwargs["automatic_fields"])
+        updates = fs.batch_update_records.call_args.args[2]
+        self.assertEqual(
+            [u["record_id"] for u in updates], ["rec0", "rec1", "rec2", "rec3"]
+        )
+        self.assertEqual(pending, [])
+        self.assertIn("rec3", analyzed)
+        mock_print.assert_any_call("镜像同步 (full)：拉取 7 条，变化 7 条，删除 0 条")
+
+    @patch("cloud_agent.genai.Client")
+    @patch("cloud_agent_runner.FeishuConnector")
+    def test_main_resumes_from_journal(self, mock_connector, mock_genai):
+        """测试中断后重跑：已分析的记录直接写回，只对剩余记录调用 LLM"""
+        fs = self._mock_feishu(mock_connector)
+        generate = mock_genai.return_value.models.generate_content
+        generate.return_value = MagicMock(text='{"analysis": "new"}')
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            journal_file = os.path.join(temp_dir, "journal.jsonl")
+            journal = cloud_agent_runner.RunJournal(journal_file)
+            journal.record_analyzed("rec0", {"analysis": "saved0"})
+            journal.record_analyzed("rec2", {"analysis": "saved2"})
+            journal.close()
+
+            with patch.dict(os.environ, {"JOURNAL_FILE": journal_file}):
+                with patch("builtins.print") as mock_print:
+                    cloud_agent_runner.main()
+
+            journal_size = os.path.getsize(journal_file)
+
+        self.assertEqual(generate.call_count, 2)
+        updates = fs.batch_update_records.call_args.args[2]
+        analyses = [json.loads(u["fields"]["AI建议"])["analysis"] for u in updates]
+        self.assertEqual(analyses, ["saved0", "new", "saved2", "new"])
+        mock_print.assert_any_call("从运行日志恢复 2 条已分析记录")
+        # 全部写回后日志被清空
+        self.assertEqual(journal_size, 0)
+
+    @patch("cloud_agent.genai.Client")
+    @patch("cloud_agent_runner.FeishuConnector")
+    def test_main_journals_unwritten_results(self, mock_connector, mock_genai):
+        """测试写回失败时分析结果保留在日志中，下次运行不再调用 LLM"""
+        fs = self._mock_feishu(mock_connector)
+        fs.batch_update_records.side_effect = lambda a, t, updates, **kw: {
+            u["record_id"]: u["record_id"] != "rec1" for u in updates
+        }
+        fs.update_record.return_value = False
+        generate = mock_genai.return_value.models.generate_content
+        generate.return_value = MagicMock(text='{"analysis": "ok"}')
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            journal_file = os.path.join(temp_dir, "journal.jsonl")
+            with patch.dict(os.environ, {"JOURNAL_FILE": journal_file}):
+                with patch("builtins.print"):
+                    cloud_agent_runner.main()
+            journal = cloud_agent_runner.RunJournal(journal_file)
+            unwritten = journal.unwritten()
+            journal.close()
+
+        self.assertEqual(generate.call_count, 4)
+        self.assertEqual(unwritten, {"rec1": {"analysis": "ok"}})
+
+    @patch("cloud_agent.genai.Client")
+    @patch("cloud_agent_runner.FeishuConnector")
+    def test_main_pipeline_mode(self, mock_connector, mock_genai):
+        """测试流水线模式：边分页读取边分析，分析失败的记录不写回"""
+        fs = self._mock_feishu(mock_connector)
+        fs.iter_records.side_effect = [
+            iter(self.baseline_records),
+            iter(self.pending_records),
+        ]
+
+        def mock_generate_content(*args, **kwargs):
+            if "待分析1" in kwargs["contents"]:
+                raise Exception("API Error")
+            response = MagicMock()
+            response.text = '{"analysis": "ok"}'
+            return response
+
+        mock_genai.return_value.models.generate_content.side_effect = (
+            mock_generate_content
+        )
+
+        with patch.dict(os.environ, {"ANALYSIS_PIPELINE": "1"}):
+            with patch("builtins.print") as mock_print:
+                cloud_agent_runner.main()
+
+        fs.get_records.assert_not_called()
+        self.assertEqual(fs.iter_records.call_args.kwargs["filter_formula"], "待分析")
+        written = sorted(
+            u["record_id"]
+            for call in fs.batch_update_records.call_args_list
+            for u in call.args[2]
+        )
+        self.assertEqual(written, ["rec0", "rec2", "rec3"])
+        mock_print.assert_any_call("1 条记录分析失败，保留为待分析")
+        mock_print.assert_any_call("处理完成，共分析 3 条记录")
+
+    @patch("cloud_agent.genai.Client")
+    def test_pipeline_writes_after_reader_finishes(self, mock_genai):
+        """测试流水线在读取结束后才写回，写回不会让"待分析"分页查询漏读记录"""
+        generate = mock_genai.return_value.models.generate_content
+        generate.return_value = MagicMock(text='{"analysis": "ok"}')
+        fs = MagicMock()
+        fs.batch_update_records.side_effect = lambda a, t, updates, **kw: {
+            u["record_id"]: True for u in updates
+        }
+        agent = cloud_agent_runner.CloudQuantAgent(rule_engine=False)
+        writer = cloud_agent_runner.WriteBackBuffer(
+            fs, "app_token", "table_id", max_batch_size=1
+        )
+        written_while_reading = []
+
+        def paged_records():
+            for item in self.pending_records:
+                written_while_reading.append(fs.batch_update_records.called)
+                yield item
+                # 给下游阶段处理已读取记录的时间
+                time.sleep(0.02)
+
+        stats, failed = cloud_agent_runner.run_pipelined(
+            agent, paged_records(), writer, max_workers=2
+        )
+
+        self.assertEqual(written_while_reading, [False] * 4)
+        self.assertEqual(failed, 0)
+        self.assertEqual(stats["write"]["items"], 4)
+        self.assertEqual(sorted(writer.results), ["rec0", "rec1", "rec2", "rec3"])
+
+    @patch("cloud_agent.genai.Client")
+    @patch("cloud_agent_runner.FeishuConnector")
+    def test_main_exports_metrics(self, mock_connector, mock_genai):
+        """测试运行结束时导出 JSON 和 Prometheus 格式的运行指标"""
+        self._mock_feishu(mock_connector)
+        generate = mock_genai.return_value.models.generate_content
+        generate.return_value = MagicMock(text='{"analysis": "ok"}')
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with patch.dict(os.environ, {"METRICS_DIR": temp_dir}):
+                with patch("builtins.print"):
+                    cloud_agent_runner.main()
+
+            with open(os.path.join(temp_dir, "metrics.json"), encoding="utf-8") as f:
+                data = json.load(f)
+            with open(os.path.join(temp_dir, "rednote.prom"), encoding="utf-8") as f:
+                text = f.read()
+
+        self.assertEqual(data["counters"]["llm_requests"], 4)
+        self.assertEqual(data["timings"]["run"]["count"], 1)
+        self.assertIn("baseline", data["timings"])
+        self.assertIn("rednote_llm_seconds_count 4", text)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -6,6 +6,14 @@ import os
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
 from agent import QuantContentAgent
+from factors import (
+    RollingWindow,
+    RunningStats,
+    classify_strategies,
+    factor_shares,
+    publication_order,
+    rolling_ma_ratios,
+)
 
 
 class TestHScoreFormula(unittest.TestCase):
@@ -128,6 +136,127 @@ class TestPerformanceMetrics(unittest.TestCase):
         self.assertAlmostEqual(z_score, 0.0, places=1)
 
 
+class TestStrategyRules(unittest.TestCase):
+    """测试决策矩阵规则引擎"""
+
+    def test_factor_shares(self):
+        """测试因子贡献占比：每行之和为1，H Score为0的行全为0"""
+        import numpy as np
+
+        matrix = np.array([[100, 20, 50, 5], [0, 0, 0, 0]], dtype=float)
+
+        shares = factor_shares(matrix)
+
+        # H = 100 + 80 + 250 + 50 = 480
+        np.testing.assert_allclose(
+            shares[0], [100 / 480, 80 / 480, 250 / 480, 50 / 480]
+        )
+        np.testing.assert_allclose(shares[1], [0, 0, 0, 0])
+
+    def test_classify_strategies(self):
+        """测试追涨/止损/互动判断，模糊的帖子留给LLM"""
+        import numpy as np
+
+        matrix = np.array(
+            [
+                [10, 0, 200, 50],  # 收藏+分享主导
+                [10, 0, 200, 50],  # 收藏+分享主导但Z不高
+                [0, 300, 0, 0],  # 评论主导
+                [500, 10, 10, 1],  # 点赞主导
+                [10, 0, 0, 0],
+                [np.nan, 1, 1, 1],
+            ]
+        )
+        z_scores = [2.0, 0.5, 1.5, 3.0, -1.0, np.nan]
+
+        labels = classify_strategies(matrix, z_scores)
+
+        self.assertEqual(list(labels), ["追涨", "", "互动", "", "止损", ""])
+
+
+class TestMovingAverage(unittest.TestCase):
+    """测试H/MA5相对表现因子"""
+
+    def test_rolling_ma_ratios(self):
+        """测试MA取此前最近k篇 (不含本篇)，第一篇比值为NaN"""
+        import numpy as np
+
+        ma, ratios = rolling_ma_ratios([100, 200, 300, 400, 500, 600, 700], window=3)
+
+        np.testing.assert_allclose(ma[1:], [100, 150, 200, 300, 400, 500])
+        self.assertTrue(np.isnan(ma[0]) and np.isnan(ratios[0]))
+        np.testing.assert_allclose(ratios[1:], [2, 2, 2, 500 / 300, 1.5, 1.4])
+
+    def test_ring_buffer_matches_vectorized(self):
+        """测试环形缓冲区逐篇更新与一次性计算结果一致"""
+        import numpy as np
+
+        h_scores = np.random.default_rng(0).integers(0, 2000, size=50)
+        _, expected = rolling_ma_ratios(h_scores)
+
+        window = RollingWindow()
+        incremental = []
+        for h in h_scores:
+            incremental.append(window.ratio(h))
+            window.push(h)
+
+        np.testing.assert_allclose(incremental, expected)
+        np.testing.assert_allclose(window.values(), h_scores[-5:])
+        self.assertEqual(len(window), 5)
+
+    def test_publication_order(self):
+        """测试有发布时间列时按时间排序，否则保持原顺序"""
+        import pandas as pd
+
+        df = pd.DataFrame({"发布时间": ["2024-03-02", "2024-03-01", "2024-03-03"]})
+
+        self.assertEqual(list(publication_order(df)), [1, 0, 2])
+        self.assertEqual(list(publication_order(pd.DataFrame({"a": [3, 1]}))), [0, 1])
+
+
+class TestRunningStats(unittest.TestCase):
+    """测试增量统计量 (Welford)"""
+
+    def test_push_merge_remove_match_numpy(self):
+        """测试逐条加入、分片合并、移除和替换后与一次性计算一致"""
+        import numpy as np
+
+        values = np.random.default_rng(1).normal(500, 200, size=200)
+        left, right = RunningStats(), RunningStats()
+        for value in values[:120]:
+            left.push(value)
+        for value in values[120:]:
+            right.push(value)
+
+        stats = left.merge(right)
+        self.assertEqual(stats.count, 200)
+        self.assertAlmostEqual(stats.mean, values.mean())
+        self.assertAlmostEqual(stats.std(), values.std())
+        self.assertAlmostEqual(stats.std(ddof=1), values.std(ddof=1))
+        self.assertEqual((stats.min, stats.max), (values.min(), values.max()))
+
+        stats.remove(values[0])
+        stats.replace(values[1], 42.0)
+        expected = np.concatenate([[42.0], values[2:]])
+        self.assertEqual(stats.count, 199)
+        self.assertAlmostEqual(stats.mean, expected.mean())
+        self.assertAlmostEqual(stats.std(), expected.std())
+
+    def test_serialization_and_empty(self):
+        """测试序列化往返，以及移除到空时重置"""
+        stats = RunningStats()
+        for value in (480, 960, 1440):
+            stats.push(value)
+
+        restored = RunningStats.from_dict(stats.to_dict())
+        self.assertEqual(restored.to_dict(), stats.to_dict())
+
+        for value in (480, 960, 1440):
+            restored.remove(value)
+        self.assertEqual((restored.count, restored.mean, restored.m2), (0, 0.0, 0.0))
+        self.assertNotEqual(restored.std(), restored.std())  # 空统计量的标准差为 NaN
+
+
 if __name__ == "__main__":
     # 创建测试套件
     loader = unittest.TestLoader()
@@ -137,6 +266,9 @@ if __name__ == "__main__":
     suite.addTests(loader.loadTestsFromTestCase(TestHScoreFormula))
     suite.addTests(loader.loadTestsFromTestCase(TestDataTypes))
     suite.addTests(loader.loadTestsFromTestCase(TestPerformanceMetrics))
+    suite.addTests(loader.loadTestsFromTestCase(TestStrategyRules))
+    suite.addTests(loader.loadTestsFromTestCase(TestMovingAverage))
+    suite.addTests(loader.loadTestsFromTestCase(TestRunningStats))
 
     # 运行测试
     runner = unittest.TextTestRunner(verbosity=2)
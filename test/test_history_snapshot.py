@@ -0,0 +1,159 @@
+import unittest
+import os
+import sys
+import tempfile
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from agent import QuantContentAgent
+from history_snapshot import load_snapshot, save_snapshot, snapshot_paths
+
+
+class TestHistorySnapshot(unittest.TestCase):
+    """测试历史基准快照"""
+
+    def setUp(self):
+        """测试前设置"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.history_file = os.path.join(self.temp_dir.name, "post_data.csv")
+        pd.DataFrame(
+            {
+                "title": ["A", "B", "C", "D", "E", "F", "G"],
+                "like": [100, 200, 150, 80, 300, 120, 90],
+                "comment": [20, 30, 25, 5, 40, 10, 12],
+                "save": [50, 80, 60, 20, 100, 30, 25],
+                "share": [5, 10, 8, 1, 20, 3, 2],
+                "publish_time": [
+                    "2024-01-07",
+                    "2024-01-01",
+                    "2024-01-03",
+                    "2024-01-02",
+                    "2024-01-05",
+                    "2024-01-04",
+                    "2024-01-06",
+                ],
+            }
+        ).to_csv(self.history_file, index=False)
+        os.environ["GEMINI_API_KEY"] = "test_api_key"
+
+    def tearDown(self):
+        """测试后清理"""
+        self.temp_dir.cleanup()
+
+    def _agent(self, **kwargs):
+        with patch("agent.genai.Client"):
+            return QuantContentAgent(history_file=self.history_file, **kwargs)
+
+    def test_save_and_load(self):
+        """测试快照的写入和内存映射读取"""
+        self.assertTrue(save_snapshot(self.history_file, [1.0, 2.0, 3.0], 2.0, 1.0))
+
+        snapshot = load_snapshot(self.history_file)
+        self.assertIsNotNone(snapshot)
+        self.assertEqual(snapshot.rows, 3)
+        self.assertEqual((snapshot.mean, snapshot.std), (2.0, 1.0))
+        self.assertIsInstance(snapshot.scores, np.memmap)
+        self.assertEqual(snapshot.scores.tolist(), [1.0, 2.0, 3.0])
+
+    def test_missing_or_corrupt_snapshot(self):
+        """测试快照不存在或损坏时返回 None"""
+        self.assertIsNone(load_snapshot(self.history_file))
+
+        save_snapshot(self.history_file, [1.0, 2.0, 3.0], 2.0, 1.0)
+        scores_path, meta_path = snapshot_paths(self.history_file)
+        with open(scores_path, "wb") as f:
+            f.write(b"not a npy file")
+        self.assertIsNone(load_snapshot(self.history_file))
+
+        save_snapshot(self.history_file, [1.0, 2.0, 3.0], 2.0, 1.0)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            f.write("{")
+        self.assertIsNone(load_snapshot(self.history_file))
+
+    def test_invalidated_when_csv_changes(self):
+        """测试 CSV 内容变化 (大小不变也一样) 后快照失效"""
+        save_snapshot(self.history_file, [1.0, 2.0, 3.0], 2.0, 1.0)
+        stat = os.stat(self.history_file)
+
+        with open(self.history_file, encoding="utf-8") as f:
+            text = f.read()
+        with open(self.history_file, "w", encoding="utf-8") as f:
+            f.write(text.replace("100,20", "900,20"))
+        os.utime(self.history_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        self.assertEqual(os.stat(self.history_file).st_size, stat.st_size)
+        self.assertIsNone(load_snapshot(self.history_file))
+
+    def test_touched_csv_revalidated_by_hash(self):
+        """测试只有修改时间变化 (如重新检出) 时按内容哈希确认快照仍然有效"""
+        save_snapshot(self.history_file, [1.0, 2.0, 3.0], 2.0, 1.0)
+        stat = os.stat(self.history_file)
+        touched = stat.st_mtime_ns + 10**9
+        os.utime(self.history_file, ns=(stat.st_atime_ns, touched))
+
+        self.assertIsNotNone(load_snapshot(self.history_file))
+        # 元数据已更新为新的修改时间，之后不再计算哈希
+        with patch("history_snapshot.file_digest") as mock_digest:
+            self.assertIsNotNone(load_snapshot(self.history_file))
+        mock_digest.assert_not_called()
+
+    def test_agent_skips_csv_with_snapshot(self):
+        """测试有效快照存在时 agent 不解析 CSV，结果与读取 CSV 一致"""
+        first = self._agent()
+        expected_h, expected_z = first.get_market_metrics({"like": 300})
+        expected_ratio = first.get_ma_ratio(expected_h)
+        for path in snapshot_paths(self.history_file):
+            self.assertTrue(os.path.exists(path))
+
+        with patch("agent.pd.read_csv") as mock_read:
+            second = self._agent()
+            h_score, z_score = second.get_market_metrics({"like": 300})
+            ratio = second.get_ma_ratio(h_score)
+        mock_read.assert_not_called()
+        self.assertEqual(h_score, expected_h)
+        self.assertAlmostEqual(z_score, expected_z)
+        self.assertAlmostEqual(ratio, expected_ratio)
+
+        # 需要完整历史时才读取 CSV
+        self.assertEqual(len(second.history), 7)
+
+    def test_recorded_posts_survive_loading_csv(self):
+        """测试从快照启动后读取 history 不会丢弃 record_post 追加的新帖子"""
+        self._agent().get_market_metrics({"like": 300})
+
+        agent = self._agent()
+        expected = self._agent(snapshot=False)
+        for current in (agent, expected):
+            current.record_post({"like": 100000})
+        ratio = expected.get_ma_ratio(1000)
+        self.assertAlmostEqual(agent.get_ma_ratio(1000), ratio)
+
+        # 读取完整历史 (解析 CSV) 后 MA 窗口保持不变
+        self.assertEqual(len(agent.history), 7)
+        self.assertAlmostEqual(agent.get_ma_ratio(1000), ratio)
+
+    def test_agent_history_replacement_ignores_snapshot(self):
+        """测试替换 history 后不再使用快照"""
+        self._agent().get_market_metrics({"like": 300})
+
+        agent = self._agent()
+        agent.history = pd.DataFrame(
+            {"like": [1, 2, 3], "comment": [0] * 3, "save": [0] * 3, "share": [0] * 3}
+        )
+        _, z_score = agent.get_market_metrics({"like": 3})
+        self.assertAlmostEqual(z_score, 1.0)
+
+    def test_agent_without_snapshot(self):
+        """测试 snapshot=False 时不写出也不读取快照"""
+        agent = self._agent(snapshot=False)
+        agent.get_market_metrics({"like": 300})
+        for path in snapshot_paths(self.history_file):
+            self.assertFalse(os.path.exists(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -9,6 +9,7 @@ from unittest.mock import patch, MagicMock
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
 from agent import QuantContentAgent
+from history_snapshot import snapshot_paths
 
 
 class TestIntegration(unittest.TestCase):
@@ -42,8 +43,10 @@ class TestIntegration(unittest.TestCase):
 
     def tearDown(self):
         """测试后清理"""
-        if os.path.exists(self.temp_file.name):
-            os.unlink(self.temp_file.name)
+        # 历史 CSV 及 agent 在其旁边写出的快照文件
+        for path in (self.temp_file.name, *snapshot_paths(self.temp_file.name)):
+            if os.path.exists(path):
+                os.unlink(path)
 
     @patch("agent.genai.Client")
     def test_complete_analysis_workflow(self, mock_client):
@@ -0,0 +1,82 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from journal import RunJournal
+
+
+class TestRunJournal(unittest.TestCase):
+    """测试运行日志"""
+
+    def setUp(self):
+        """测试前设置"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "cache", "journal.jsonl")
+
+    def tearDown(self):
+        """测试后清理"""
+        self.temp_dir.cleanup()
+
+    def test_replay_after_restart(self):
+        """测试重新打开日志后恢复分析结果和写回状态"""
+        journal = RunJournal(self.path)
+        journal.record_analyzed("rec1", {"analysis": "一"})
+        journal.record_analyzed("rec2", {"analysis": "二"})
+        journal.record_written(["rec1"])
+        journal.close()
+
+        journal = RunJournal(self.path)
+        self.assertEqual(journal.analyzed["rec1"], {"analysis": "一"})
+        self.assertEqual(journal.written, {"rec1"})
+        self.assertEqual(journal.unwritten(), {"rec2": {"analysis": "二"}})
+        journal.close()
+
+    def test_truncated_line_is_ignored(self):
+        """测试崩溃时写了一半的最后一行被忽略"""
+        journal = RunJournal(self.path)
+        journal.record_analyzed("rec1", {"analysis": "一"})
+        journal.close()
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write('{"event": "analyzed", "record_id": "rec2", "res')
+
+        journal = RunJournal(self.path)
+        self.assertEqual(list(journal.analyzed), ["rec1"])
+        journal.close()
+
+    def test_reanalysis_resets_written(self):
+        """测试同一记录重新分析后需要重新写回"""
+        journal = RunJournal(self.path)
+        journal.record_analyzed("rec1", {"analysis": "旧"})
+        journal.record_written(["rec1"])
+        journal.record_analyzed("rec1", {"analysis": "新"})
+
+        self.assertEqual(journal.unwritten(), {"rec1": {"analysis": "新"}})
+        journal.close()
+
+    def test_compact_keeps_only_unwritten(self):
+        """测试压缩后只保留未写回的结果"""
+        journal = RunJournal(self.path)
+        journal.record_analyzed("rec1", {"analysis": "一"})
+        journal.record_analyzed("rec2", {"analysis": "二"})
+        journal.record_written(["rec1"])
+        journal.compact()
+        journal.close()
+
+        with open(self.path, encoding="utf-8") as f:
+            events = [json.loads(line) for line in f]
+        self.assertEqual([e["record_id"] for e in events], ["rec2"])
+
+        journal = RunJournal(self.path)
+        journal.record_written(["rec2"])
+        journal.compact()
+        journal.close()
+        self.assertEqual(os.path.getsize(self.path), 0)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
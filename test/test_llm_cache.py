@@ -0,0 +1,103 @@
+import unittest
+import os
+import sys
+import tempfile
+from unittest.mock import patch
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from llm_cache import (
+    MemoryCache,
+    ResponseCache,
+    SQLiteCache,
+    make_cache_key,
+    normalize_prompt,
+)
+
+
+class TestLLMCache(unittest.TestCase):
+    """测试LLM响应缓存"""
+
+    def setUp(self):
+        """测试前设置"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.temp_dir.name, "cache", "responses.sqlite")
+
+    def tearDown(self):
+        """测试后清理"""
+        self.temp_dir.cleanup()
+
+    def test_cache_key_normalizes_prompt(self):
+        """测试缓存键忽略缩进和空行，但区分模型和配置"""
+        prompt_a = "\n        标题: 测试\n        H Score: 480\n"
+        prompt_b = "标题: 测试\n\nH Score: 480"
+
+        key = make_cache_key("gemini-2.5-flash", {"temperature": 0.7}, prompt_a)
+
+        self.assertEqual(normalize_prompt(prompt_a), normalize_prompt(prompt_b))
+        self.assertEqual(
+            key, make_cache_key("gemini-2.5-flash", {"temperature": 0.7}, prompt_b)
+        )
+        self.assertNotEqual(
+            key, make_cache_key("gemini-2.5-pro", {"temperature": 0.7}, prompt_a)
+        )
+        self.assertNotEqual(
+            key, make_cache_key("gemini-2.5-flash", {"temperature": 0.2}, prompt_a)
+        )
+
+    def test_memory_cache_lru_eviction(self):
+        """测试内存缓存按最近使用淘汰"""
+        cache = MemoryCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(len(cache), 2)
+
+    def test_memory_cache_ttl(self):
+        """测试缓存过期"""
+        cache = MemoryCache(ttl=60)
+        with patch("llm_cache.time.time", return_value=1000.0):
+            cache.set("a", 1)
+        with patch("llm_cache.time.time", return_value=1030.0):
+            self.assertEqual(cache.get("a"), 1)
+        with patch("llm_cache.time.time", return_value=1061.0):
+            self.assertIsNone(cache.get("a"))
+
+    def test_sqlite_cache_persists_and_evicts(self):
+        """测试SQLite缓存跨实例持久化并按条数淘汰"""
+        cache = SQLiteCache(self.db_path, max_entries=2)
+        cache.set("a", {"analysis": "结果A"})
+        cache.set("b", {"analysis": "结果B"})
+        cache.set("c", {"analysis": "结果C"})
+        cache.close()
+
+        reopened = SQLiteCache(self.db_path, max_entries=2)
+        self.assertEqual(len(reopened), 2)
+        self.assertIsNone(reopened.get("a"))
+        self.assertEqual(reopened.get("c"), {"analysis": "结果C"})
+        reopened.close()
+
+    def test_response_cache_hits_misses_and_bypass(self):
+        """测试两级缓存的命中统计和旁路开关"""
+        cache = ResponseCache.from_path(self.db_path)
+        self.assertIsNone(cache.get("key"))
+        cache.set("key", {"analysis": "ok"})
+        self.assertEqual(cache.get("key"), {"analysis": "ok"})
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+        # 新进程只有磁盘缓存
+        fresh = ResponseCache.from_path(self.db_path)
+        self.assertEqual(fresh.get("key"), {"analysis": "ok"})
+
+        bypassed = ResponseCache.from_path(self.db_path, bypass=True)
+        self.assertIsNone(bypassed.get("key"))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,97 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+from unittest.mock import MagicMock
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from metrics import Metrics
+
+
+class TestMetrics(unittest.TestCase):
+    """测试运行指标"""
+
+    def setUp(self):
+        """测试前设置"""
+        self.metrics = Metrics()
+
+    def test_counters(self):
+        """测试计数器累加"""
+        self.metrics.inc("llm_requests")
+        self.metrics.inc("llm_requests", 2)
+
+        self.assertEqual(self.metrics.snapshot()["counters"], {"llm_requests": 3})
+
+    def test_quantiles(self):
+        """测试分位数按最近秩计算"""
+        for i in range(1, 101):
+            self.metrics.observe("llm", i / 100)
+
+        summary = self.metrics.summary("llm")
+        self.assertEqual(summary["count"], 100)
+        self.assertAlmostEqual(summary["p50"], 0.50)
+        self.assertAlmostEqual(summary["p95"], 0.95)
+        self.assertAlmostEqual(summary["p99"], 0.99)
+        self.assertAlmostEqual(summary["max"], 1.0)
+        self.assertEqual(self.metrics.summary("missing")["p95"], 0.0)
+
+    def test_span_records_time_and_errors(self):
+        """测试 span 计时，异常时计入错误数并继续抛出"""
+        with self.metrics.span("parse"):
+            pass
+        with self.assertRaises(ValueError):
+            with self.metrics.span("parse"):
+                raise ValueError("bad json")
+
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(snapshot["timings"]["parse"]["count"], 2)
+        self.assertEqual(snapshot["counters"]["parse_errors"], 1)
+
+    def test_record_usage_ignores_non_int(self):
+        """测试只累计整数 token 数，mock 响应被忽略"""
+        response = MagicMock()
+        response.usage_metadata.prompt_token_count = 120
+        response.usage_metadata.candidates_token_count = 30
+        self.metrics.record_usage(response)
+        self.metrics.record_usage(MagicMock())
+        self.metrics.record_usage(None)
+
+        counters = self.metrics.snapshot()["counters"]
+        self.assertEqual(
+            counters, {"llm_prompt_tokens": 120, "llm_response_tokens": 30}
+        )
+
+    def test_prometheus_format(self):
+        """测试 Prometheus textfile 格式"""
+        self.metrics.inc("feishu_requests", 3)
+        self.metrics.observe("feishu-fetch", 0.5)
+
+        text = self.metrics.to_prometheus()
+
+        self.assertIn("# TYPE rednote_feishu_requests_total counter", text)
+        self.assertIn("rednote_feishu_requests_total 3", text)
+        self.assertIn('rednote_feishu_fetch_seconds{quantile="0.95"} 0.500000', text)
+        self.assertIn("rednote_feishu_fetch_seconds_count 1", text)
+        self.assertTrue(text.endswith("\n"))
+
+    def test_export(self):
+        """测试导出 JSON 和 Prometheus 文件"""
+        self.metrics.inc("llm_requests")
+        with tempfile.TemporaryDirectory() as temp_dir:
+            json_path, prom_path = self.metrics.export(
+                os.path.join(temp_dir, "metrics")
+            )
+            with open(json_path, encoding="utf-8") as f:
+                data = json.load(f)
+            with open(prom_path, encoding="utf-8") as f:
+                text = f.read()
+
+        self.assertEqual(data["counters"], {"llm_requests": 1})
+        self.assertIn("rednote_llm_requests_total 1", text)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,123 @@
+import unittest
+import os
+import sys
+import tempfile
+
+# 添加项目根目录和测试目录 (microbench.py) 到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from microbench import (
+    BUDGET_FILE,
+    CASES,
+    DEFAULT_RUNS,
+    IMPORT_MODULES,
+    MIN_BUDGET,
+    MIN_SAMPLE_TIME,
+    NO_HISTORY,
+    best_time,
+    case_key,
+    check_budget,
+    import_time,
+    load_budget,
+    run_all,
+    save_budget,
+    synthetic_factors,
+)
+from agent import QuantContentAgent
+from factors import compute_h_scores
+
+
+class TestMicrobench(unittest.TestCase):
+    """测试微基准用例和性能预算检查"""
+
+    def test_all_cases_run_at_small_size(self):
+        """测试每个用例都能在小规模下运行"""
+        timings = run_all([(name, 50) for name in CASES], repeat=1)
+        self.assertEqual(set(timings), {case_key(name, 50) for name in CASES})
+        for value in timings.values():
+            self.assertGreaterEqual(value, 0.0)
+
+    def test_budget_file_covers_default_runs(self):
+        """测试仓库中的参考耗时覆盖全部默认用例"""
+        budget = load_budget(BUDGET_FILE)
+        self.assertIsNotNone(budget)
+        self.assertGreater(budget["calibration"], 0)
+        for name, size in DEFAULT_RUNS:
+            self.assertIn(case_key(name, size), budget["cases"])
+        for module in IMPORT_MODULES:
+            self.assertIn(f"import[{module}]", budget["cases"])
+
+    def test_check_budget_scales_by_calibration(self):
+        """测试预算上限按校准耗时换算，超出容差判定为回退"""
+        budget = {"calibration": 1.0, "tolerance": 0.5, "cases": {"a[10]": 0.1}}
+        # 本机速度相同：上限为 0.15 秒
+        report = check_budget({"a[10]": 0.14}, budget, calibration=1.0)
+        self.assertEqual(len(report), 1)
+        self.assertFalse(report[0][3])
+        self.assertAlmostEqual(report[0][2], 0.15)
+        report = check_budget({"a[10]": 0.16}, budget, calibration=1.0)
+        self.assertTrue(report[0][3])
+
+        # 本机慢一倍：上限也放宽一倍
+        report = check_budget({"a[10]": 0.25}, budget, calibration=2.0)
+        self.assertFalse(report[0][3])
+
+        # 显式容差覆盖文件中的容差
+        report = check_budget({"a[10]": 0.14}, budget, 1.0, tolerance=0.2)
+        self.assertTrue(report[0][3])
+
+    def test_check_budget_absolute_floor(self):
+        """测试亚毫秒级用例的预算上限不低于 MIN_BUDGET"""
+        budget = {"calibration": 1.0, "tolerance": 0.5, "cases": {"a[10]": 0.0001}}
+        report = check_budget({"a[10]": 0.0002}, budget, calibration=1.0)
+        self.assertEqual(report[0][2], MIN_BUDGET)
+        self.assertFalse(report[0][3])
+        report = check_budget({"a[10]": MIN_BUDGET * 2}, budget, calibration=1.0)
+        self.assertTrue(report[0][3])
+
+    def test_best_time_repeats_fast_cases(self):
+        """测试很快的用例每次采样连续调用多次，直到耗时可以测量"""
+        calls = []
+        elapsed = best_time(lambda: calls.append(None), repeat=3)
+        self.assertGreater(len(calls), 3)
+        self.assertLess(elapsed, MIN_SAMPLE_TIME)
+
+    def test_check_budget_skips_unknown_cases(self):
+        """测试没有参考耗时的用例不参与检查"""
+        budget = {"calibration": 1.0, "cases": {}}
+        self.assertEqual(check_budget({"b[10]": 9.9}, budget, 1.0), [])
+
+    def test_save_and_load_budget(self):
+        """测试参考耗时的写入和读取"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "budget.json")
+            self.assertIsNone(load_budget(path))
+            save_budget({"a[10]": 0.1234567}, 0.5, 0.3, path)
+            budget = load_budget(path)
+        self.assertEqual(budget["calibration"], 0.5)
+        self.assertEqual(budget["tolerance"], 0.3)
+        self.assertEqual(budget["cases"], {"a[10]": 0.123457})
+
+    def test_import_does_not_load_heavy_dependencies(self):
+        """测试导入入口模块时不执行 google.genai、pandas 和 requests (第一次使用时才加载)"""
+        for module in IMPORT_MODULES:
+            elapsed, loaded = import_time(module)
+            self.assertGreater(elapsed, 0)
+            self.assertNotIn("google.genai.types", loaded, module)
+            self.assertNotIn("pandas.core.frame", loaded, module)
+            self.assertNotIn("requests.sessions", loaded, module)
+
+    def test_vectorized_h_score_faster_than_row_wise(self):
+        """测试列式 H Score 明显快于逐行计算 (与机器速度无关的相对预算)"""
+        df = synthetic_factors(20000)
+        agent = QuantContentAgent(history_file=NO_HISTORY)
+        vectorized = best_time(lambda: compute_h_scores(df), repeat=3)
+        row_wise = best_time(
+            lambda: df.apply(agent._calculate_h_score, axis=1), repeat=1
+        )
+        self.assertLess(vectorized * 10, row_wise)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,168 @@
+import unittest
+import os
+import sys
+import tempfile
+import time
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from mirror import FULL_SYNC_INTERVAL, BitableMirror
+
+
+def make_item(record_id, status, last_modified, like=0, created=0):
+    return {
+        "record_id": record_id,
+        "fields": {"状态": status, "点赞": like},
+        "created_time": created,
+        "last_modified_time": last_modified,
+    }
+
+
+class FakeConnector:
+    """按筛选条件返回记录的简化飞书连接器"""
+
+    def __init__(self, full=(), incremental=(), fail_incremental=False):
+        self.full = list(full)
+        self.incremental = list(incremental)
+        self.fail_incremental = fail_incremental
+        self.last_error = None
+        self.filters = []
+
+    @staticmethod
+    def modified_since_filter(field, timestamp):
+        return f"{field}>={timestamp}"
+
+    def iter_records(self, app_token, table_id, filter_formula=None, **kwargs):
+        self.filters.append(filter_formula)
+        self.last_error = None
+        if filter_formula is None:
+            return iter(self.full)
+        if self.fail_incremental:
+            self.last_error = "code 1254045"
+            return iter([])
+        return iter(self.incremental)
+
+
+class TestBitableMirror(unittest.TestCase):
+    """测试多维表格本地镜像"""
+
+    def setUp(self):
+        """测试前设置"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.mirror = BitableMirror(
+            os.path.join(self.temp_dir.name, "cache", "mirror.sqlite")
+        )
+
+    def tearDown(self):
+        """测试后清理"""
+        self.mirror.close()
+        self.temp_dir.cleanup()
+
+    def test_upsert_skips_unchanged_records(self):
+        """测试最后修改时间不变的记录不会重复写入"""
+        items = [make_item("rec1", "已分析", 1), make_item("rec2", "待分析", 1)]
+        self.assertEqual(len(self.mirror.upsert(items)), 2)
+
+        items[1] = make_item("rec2", "已分析", 2, like=10)
+        changed = self.mirror.upsert(items)
+
+        self.assertEqual([item["record_id"] for item in changed], ["rec2"])
+        self.assertEqual(len(self.mirror), 2)
+        self.assertEqual(self.mirror.records("已分析")[1]["fields"]["点赞"], 10)
+
+    def test_records_ordered_and_filtered_by_status(self):
+        """测试记录按创建时间排序，可按状态筛选"""
+        self.mirror.upsert(
+            [
+                make_item("rec2", "已分析", 1, created=20),
+                make_item("rec1", "已分析", 1, created=10),
+                make_item("rec3", "待分析", 1, created=30),
+            ]
+        )
+
+        self.assertEqual(
+            [r["record_id"] for r in self.mirror.records()], ["rec1", "rec2", "rec3"]
+        )
+        self.assertEqual(
+            [r["record_id"] for r in self.mirror.records("待分析")], ["rec3"]
+        )
+
+    def test_update_fields_changes_status(self):
+        """测试本地回写后记录移到新状态下"""
+        self.mirror.upsert([make_item("rec1", "待分析", 1)])
+        self.mirror.update_fields("rec1", {"状态": "已分析"})
+        self.mirror.update_fields("missing", {"状态": "已分析"})
+
+        self.assertEqual(self.mirror.records("待分析"), [])
+        self.assertEqual(self.mirror.records("已分析")[0]["fields"]["点赞"], 0)
+
+    def test_full_sync_deletes_missing_records(self):
+        """测试全量同步删除表格中已不存在的记录"""
+        self.mirror.upsert([make_item("gone", "已分析", 1)])
+        connector = FakeConnector(full=[make_item("rec1", "待分析", 1)])
+
+        stats = self.mirror.sync(connector, "app", "table")
+
+        self.assertEqual(
+            stats, {"mode": "full", "fetched": 1, "changed": 1, "deleted": 1}
+        )
+        self.assertEqual(self.mirror.record_ids(), {"rec1"})
+        self.assertIsNotNone(self.mirror.get_meta("checkpoint"))
+
+    def test_incremental_sync_after_full_sync(self):
+        """测试有检查点时只拉取修改过的记录"""
+        connector = FakeConnector(
+            full=[make_item("rec1", "已分析", 1), make_item("rec2", "待分析", 1)],
+            incremental=[make_item("rec2", "已分析", 2)],
+        )
+        self.mirror.sync(connector, "app", "table")
+
+        stats = self.mirror.sync(connector, "app", "table", modified_field="修改时间")
+
+        self.assertEqual(stats["mode"], "incremental")
+        self.assertEqual(stats["changed"], 1)
+        self.assertTrue(connector.filters[-1].startswith("修改时间>="))
+        self.assertEqual(len(self.mirror.records("已分析")), 2)
+
+    def test_incremental_failure_falls_back_to_full_sync(self):
+        """测试增量拉取失败 (如缺少修改时间字段) 时退回全量同步"""
+        connector = FakeConnector(
+            full=[make_item("rec1", "已分析", 1)], fail_incremental=True
+        )
+        self.mirror.sync(connector, "app", "table")
+
+        stats = self.mirror.sync(connector, "app", "table")
+
+        self.assertEqual(stats["mode"], "full")
+        self.assertIsNone(connector.filters[-1])
+
+    def test_periodic_full_sync(self):
+        """测试距上次全量同步过久时重新全量同步"""
+        connector = FakeConnector(full=[make_item("rec1", "已分析", 1)])
+        self.mirror.sync(connector, "app", "table")
+        self.mirror.set_meta("last_full_sync", time.time() - FULL_SYNC_INTERVAL - 1)
+
+        stats = self.mirror.sync(connector, "app", "table")
+
+        self.assertEqual(stats["mode"], "full")
+
+    def test_failed_full_sync_keeps_records(self):
+        """测试全量同步中途失败时不删除记录，也不推进检查点"""
+        self.mirror.upsert([make_item("rec1", "已分析", 1)])
+        connector = FakeConnector()
+        connector.iter_records = lambda *args, **kwargs: self._fail(connector)
+
+        self.mirror.sync(connector, "app", "table")
+
+        self.assertEqual(self.mirror.record_ids(), {"rec1"})
+        self.assertIsNone(self.mirror.get_meta("checkpoint"))
+
+    @staticmethod
+    def _fail(connector):
+        connector.last_error = "HTTP 500"
+        return iter([])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,116 @@
+import unittest
+import os
+import sys
+import threading
+import time
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from pipeline import Pipeline, Stage
+
+
+class TestPipeline(unittest.TestCase):
+    """测试分阶段流水线"""
+
+    def test_items_flow_through_all_stages(self):
+        """测试数据依次经过各阶段，最后一个阶段收到全部结果"""
+        collected = []
+        pipeline = Pipeline(
+            [
+                Stage("double", lambda x: x * 2, workers=3),
+                Stage("collect", collected.append),
+            ]
+        )
+
+        stats = pipeline.run(range(10))
+
+        self.assertEqual(sorted(collected), [x * 2 for x in range(10)])
+        self.assertEqual(stats["source"]["items"], 10)
+        self.assertEqual(stats["double"]["items"], 10)
+        self.assertEqual(stats["collect"]["items"], 10)
+
+    def test_none_drops_item_and_errors_are_counted(self):
+        """测试返回 None 的数据被丢弃，出错的数据计数后丢弃"""
+        collected = []
+
+        def check(x):
+            if x == 3:
+                raise ValueError("bad")
+            return x if x % 2 == 0 else None
+
+        pipeline = Pipeline([Stage("check", check), Stage("collect", collected.append)])
+        stats = pipeline.run(range(6))
+
+        self.assertEqual(collected, [0, 2, 4])
+        self.assertEqual(stats["check"]["errors"], 1)
+        self.assertEqual(stats["collect"]["items"], 3)
+
+    def test_close_called_once_after_all_workers(self):
+        """测试多线程阶段结束后 close 只调用一次，且在全部数据之后"""
+        seen = []
+        closed = []
+        stage = Stage(
+            "sink", seen.append, workers=4, close=lambda: closed.append(len(seen))
+        )
+
+        Pipeline([stage]).run(range(20))
+
+        self.assertEqual(closed, [20])
+
+    def test_source_error_keeps_read_items(self):
+        """测试数据源中途出错时已读到的数据照常处理"""
+        collected = []
+
+        def source():
+            yield 1
+            yield 2
+            raise IOError("connection reset")
+
+        stats = Pipeline([Stage("collect", collected.append)]).run(source())
+
+        self.assertEqual(collected, [1, 2])
+        self.assertEqual(stats["source"]["errors"], 1)
+
+    def test_bounded_queue_applies_backpressure(self):
+        """测试下游阻塞时上游最多多读 maxsize 条"""
+        release = threading.Event()
+        read = []
+
+        def source():
+            for i in range(20):
+                read.append(i)
+                yield i
+
+        def slow(x):
+            release.wait()
+            return None
+
+        pipeline = Pipeline([Stage("slow", slow)], maxsize=2)
+        thread = threading.Thread(target=pipeline.run, args=(source(),))
+        thread.start()
+        time.sleep(0.1)
+        # 1 条在处理中，2 条在队列中，1 条阻塞在 put 上
+        self.assertLessEqual(len(read), 4)
+        release.set()
+        thread.join()
+        self.assertEqual(len(read), 20)
+
+    def test_stages_overlap(self):
+        """测试各阶段并发运行，总耗时接近最慢阶段而不是各阶段之和"""
+        pipeline = Pipeline(
+            [
+                Stage("a", lambda x: time.sleep(0.01) or x),
+                Stage("b", lambda x: time.sleep(0.01) or x),
+                Stage("c", lambda x: time.sleep(0.01)),
+            ]
+        )
+
+        stats = pipeline.run(range(20))
+
+        # 串行执行需要 0.6 秒
+        self.assertLess(stats["wall_time"], 0.45)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,126 @@
+import unittest
+import os
+import sys
+from unittest.mock import patch, MagicMock
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from rate_limiter import RateLimiter, estimate_tokens, is_rate_limit_error
+
+
+class FakeClock:
+    """可控的时钟，sleep 时直接推进时间"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestRateLimiter(unittest.TestCase):
+    """测试RPM/TPM限流器"""
+
+    def setUp(self):
+        """测试前设置"""
+        self.clock = FakeClock()
+        for name in ("monotonic", "sleep"):
+            patcher = patch(f"rate_limiter.time.{name}", getattr(self.clock, name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_estimate_tokens(self):
+        """测试token估算 - 中文按字计，其余约4字符1个token"""
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("你好世界"), 4)
+        self.assertEqual(estimate_tokens("abcdefgh"), 2)
+        self.assertEqual(estimate_tokens("标题abcd"), 3)
+
+    def test_requests_per_minute_queues_callers(self):
+        """测试超出RPM时排队等待而不是失败"""
+        limiter = RateLimiter(rpm=2, tpm=1000)
+
+        self.assertEqual(limiter.acquire(), 0.0)
+        self.assertEqual(limiter.acquire(), 0.0)
+        # 每分钟 2 次，第三次需要等待 30 秒补充一个令牌
+        waited = limiter.acquire()
+
+        self.assertAlmostEqual(waited, 30.0)
+        self.assertEqual(limiter.total_requests, 3)
+
+    def test_tokens_per_minute_budget(self):
+        """测试TPM预算不足时等待"""
+        limiter = RateLimiter(rpm=100, tpm=600)
+
+        limiter.acquire(tokens=600)
+        waited = limiter.acquire(tokens=300)
+
+        # 每秒补充 10 个 token，300 个需要 30 秒
+        self.assertAlmostEqual(waited, 30.0)
+        self.assertEqual(limiter.total_tokens, 900)
+
+    def test_call_retries_on_429(self):
+        """测试遇到429时退避重试"""
+        limiter = RateLimiter(rpm=100, tpm=10000)
+        error = Exception("429 RESOURCE_EXHAUSTED")
+        response = MagicMock()
+        response.usage_metadata.total_token_count = 50
+        fn = MagicMock(side_effect=[error, error, response])
+
+        result = limiter.call(fn, tokens=20, backoff=1.0)
+
+        self.assertIs(result, response)
+        self.assertEqual(fn.call_count, 3)
+        self.assertEqual(limiter.rate_limited_retries, 2)
+        self.assertEqual(self.clock.sleeps, [1.0, 2.0])
+        # 实际用量修正了预估的 token 数：3 次预估 20 + 一次修正 (50 - 20)
+        self.assertEqual(limiter.total_tokens, 90)
+
+    def test_call_raises_other_errors(self):
+        """测试非限流错误直接抛出"""
+        limiter = RateLimiter(rpm=100, tpm=10000)
+        fn = MagicMock(side_effect=ValueError("bad request"))
+
+        with self.assertRaises(ValueError):
+            limiter.call(fn)
+        self.assertEqual(fn.call_count, 1)
+
+    def test_call_gives_up_after_max_retries(self):
+        """测试持续限流时最终抛出异常"""
+        limiter = RateLimiter(rpm=100, tpm=10000)
+        error = Exception("429 Too Many Requests")
+        fn = MagicMock(side_effect=error)
+
+        with self.assertRaises(Exception):
+            limiter.call(fn, max_retries=2)
+        self.assertEqual(fn.call_count, 3)
+
+    def test_rate_limit_error_detection(self):
+        """测试限流错误识别"""
+        coded = Exception("quota")
+        coded.code = 429
+        self.assertTrue(is_rate_limit_error(coded))
+        self.assertTrue(is_rate_limit_error(Exception("RESOURCE_EXHAUSTED")))
+        self.assertFalse(is_rate_limit_error(Exception("500 INTERNAL")))
+
+    def test_utilization(self):
+        """测试预算占用率统计"""
+        limiter = RateLimiter(rpm=10, tpm=1000)
+        limiter.acquire(tokens=250)
+        limiter.acquire(tokens=250)
+
+        stats = limiter.utilization()
+
+        self.assertAlmostEqual(stats["rpm_utilization"], 0.2)
+        self.assertAlmostEqual(stats["tpm_utilization"], 0.5)
+        self.assertEqual(stats["total_requests"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,88 @@
+import unittest
+import os
+import sys
+import tempfile
+from unittest.mock import MagicMock
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from token_budget import TokenEstimator, pack_batches
+
+
+class TestTokenBudget(unittest.TestCase):
+    """测试token估算与按预算装箱"""
+
+    def test_estimate(self):
+        """测试默认系数：中文1字1 token，其他字符4个1 token"""
+        estimator = TokenEstimator()
+
+        self.assertEqual(estimator.estimate(""), 0)
+        self.assertEqual(estimator.estimate("你好世界"), 4)
+        self.assertEqual(estimator.estimate("abcdefgh"), 2)
+        self.assertEqual(estimator.estimate("标题abcd"), 3)
+
+    def test_calibrate_with_count_tokens(self):
+        """测试用count_tokens结果拟合中文和其他字符的系数"""
+        client = MagicMock()
+
+        def count_tokens(model, contents):
+            # 模拟真实分词：中文 0.5 token/字，其他 0.5 token/字符
+            cjk = sum(1 for ch in contents if "一" <= ch <= "鿿")
+            return MagicMock(total_tokens=int(cjk * 0.5 + (len(contents) - cjk) * 0.5))
+
+        client.models.count_tokens.side_effect = count_tokens
+        samples = ["你好世界你好世界", "abcdefgh", "标题标题abcdabcd"]
+
+        estimator = TokenEstimator().calibrate(client, samples)
+
+        self.assertAlmostEqual(estimator.cjk_ratio, 0.5)
+        self.assertAlmostEqual(estimator.other_ratio, 0.5)
+        self.assertEqual(estimator.estimate("你好abcd"), 3)
+        self.assertEqual(client.models.count_tokens.call_count, 3)
+
+    def test_calibrate_single_sample_scales(self):
+        """测试样本无法区分两类字符时整体缩放"""
+        client = MagicMock()
+        client.models.count_tokens.return_value = MagicMock(total_tokens=8)
+
+        estimator = TokenEstimator().calibrate(client, ["你好世界"])
+
+        self.assertAlmostEqual(estimator.cjk_ratio, 2.0)
+        self.assertAlmostEqual(estimator.other_ratio, 0.5)
+
+    def test_save_and_load(self):
+        """测试校准结果保存后可离线加载，文件缺失时使用默认系数"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "estimator.json")
+            TokenEstimator(0.8, 0.3).save(path)
+
+            loaded = TokenEstimator.load(path)
+            missing = TokenEstimator.load(os.path.join(temp_dir, "missing.json"))
+
+        self.assertEqual((loaded.cjk_ratio, loaded.other_ratio), (0.8, 0.3))
+        self.assertEqual((missing.cjk_ratio, missing.other_ratio), (1.0, 0.25))
+
+    def test_pack_batches_respects_budget(self):
+        """测试装箱后每批不超过预算，且比顺序切分用更少的批次"""
+        sizes = [60, 30, 50, 20, 40, 10, 70, 20]
+
+        batches = pack_batches(sizes, budget=110, overhead=10)
+
+        self.assertEqual(sorted(i for b in batches for i in b), list(range(8)))
+        for batch in batches:
+            self.assertLessEqual(10 + sum(sizes[i] for i in batch), 110)
+            self.assertEqual(batch, sorted(batch))
+        self.assertEqual(len(batches), 3)
+
+    def test_pack_batches_max_items_and_oversized(self):
+        """测试每批篇数上限，以及超出预算的条目独占一批"""
+        batches = pack_batches([500, 10, 10, 10, 10, 10], budget=100, max_items=2)
+
+        self.assertIn([0], batches)
+        self.assertTrue(all(len(batch) <= 2 for batch in batches))
+        self.assertEqual(len(batches), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
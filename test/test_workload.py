@@ -0,0 +1,105 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录和测试目录 (workload.py) 到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from workload import WorkloadGenerator, write_bitable_json, write_csv, write_parquet
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+class TestWorkload(unittest.TestCase):
+    """测试合成工作负载生成器"""
+
+    def test_deterministic_by_seed(self):
+        """测试相同种子生成相同数据，不同种子不同"""
+        first = WorkloadGenerator(500, seed=7, chunk_size=128).frame()
+        second = WorkloadGenerator(500, seed=7, chunk_size=128).frame()
+        other = WorkloadGenerator(500, seed=8, chunk_size=128).frame()
+
+        pd.testing.assert_frame_equal(first, second)
+        self.assertFalse(first["like"].equals(other["like"]))
+
+    def test_columns_and_shapes(self):
+        """测试列与样本 CSV 一致，发布时间递增，账号数不超过设定值"""
+        df = WorkloadGenerator(1000, accounts=5, chunk_size=300).frame()
+
+        self.assertEqual(len(df), 1000)
+        for column in ["title", "like", "comment", "save", "share"]:
+            self.assertIn(column, df)
+        self.assertTrue(df["publish_time"].is_monotonic_increasing)
+        self.assertLessEqual(df["account"].nunique(), 5)
+        self.assertTrue((df[["like", "comment", "save", "share"]] >= 0).all().all())
+        # 评论摘录长短不一
+        self.assertGreater(df["comment_extracted"].str.len().nunique(), 5)
+
+    def test_heavy_tail_correlation_and_outliers(self):
+        """测试指标重尾、彼此正相关，并含有爆款离群值"""
+        df = WorkloadGenerator(20000, seed=1, viral_rate=0.005).frame()
+        like = df["like"].to_numpy()
+
+        self.assertGreater(like.max(), 50 * np.median(like))
+        ranks = df[["like", "save", "share"]].rank()
+        self.assertGreater(ranks.corr().to_numpy().min(), 0.5)
+
+    def test_bitable_pages(self):
+        """测试多维表格分页格式，末尾记录为待分析"""
+        generator = WorkloadGenerator(1200, chunk_size=500)
+        pages = list(generator.bitable_pages(page_size=500, pending=100))
+
+        self.assertEqual([len(p["items"]) for p in pages], [500, 500, 200])
+        self.assertEqual([p["has_more"] for p in pages], [True, True, False])
+        self.assertEqual(pages[0]["page_token"], "500")
+        items = [item for page in pages for item in page["items"]]
+        statuses = [item["fields"]["状态"] for item in items]
+        self.assertEqual(statuses.count("待分析"), 100)
+        self.assertEqual(statuses[-1], "待分析")
+        self.assertIsInstance(items[0]["fields"]["点赞"], int)
+        json.dumps(pages[0], ensure_ascii=False)
+
+    def test_write_csv_streams_chunks(self):
+        """测试分块写出的 CSV 可以完整读回"""
+        generator = WorkloadGenerator(250, chunk_size=100)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "posts.csv")
+            self.assertEqual(write_csv(generator, path), 250)
+            df = pd.read_csv(path)
+
+        self.assertEqual(len(df), 250)
+        self.assertEqual(df["like"].tolist(), generator.frame()["like"].tolist())
+
+    def test_write_bitable_json(self):
+        """测试每行一页的多维表格 JSON"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "pages.jsonl")
+            rows = write_bitable_json(WorkloadGenerator(30), path, page_size=10)
+            with open(path, encoding="utf-8") as f:
+                pages = [json.loads(line) for line in f]
+
+        self.assertEqual(rows, 30)
+        self.assertEqual(len(pages), 3)
+
+    @unittest.skipIf(pyarrow is None, "未安装 pyarrow")
+    def test_write_parquet(self):
+        """测试写出 Parquet"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "posts.parquet")
+            write_parquet(WorkloadGenerator(250, chunk_size=100), path)
+            df = pd.read_parquet(path)
+
+        self.assertEqual(len(df), 250)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+合成工作负载 - 按种子确定性地生成接近真实分布的小红书帖子表：
+点赞/收藏/分享为重尾分布且彼此相关，少量爆款离群值 (类似样本中的"装修攻略")，
+评论摘录长短不一，附带发布时间和账号；
+可分块流式输出为 CSV、Parquet (需要 pyarrow) 或多维表格分页 JSON，用于 10^6 行级别的压测
+
+用法:
+    python test/workload.py --rows 1000000 --format csv --out posts.csv
+    python test/workload.py --rows 100000 --format bitable --out pages.jsonl
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+TOPICS = [
+    "量化策略",
+    "Python数据分析",
+    "机器学习",
+    "金融数据可视化",
+    "投资组合优化",
+    "高频交易",
+    "小红书运营",
+    "深度学习",
+    "区块链",
+    "装修攻略",
+    "职场干货",
+    "读书笔记",
+]
+TITLE_SUFFIXES = [
+    "入门指南",
+    "实战分析",
+    "核心技术",
+    "详解",
+    "避坑清单",
+    "从零到一",
+    "进阶教程",
+    "经验分享",
+]
+COMMENT_SNIPPETS = [
+    "内容很实用！",
+    "收藏了！",
+    "请问有没有更详细的教程？",
+    "能否分享下代码实现？",
+    "讲得很清楚，",
+    "希望能出一期进阶内容。",
+    "有实盘验证吗？",
+    "这个部分没看懂，",
+    "预算大概需要多少？",
+    "期待更多内容！",
+    "博主能不能细讲一下原理？",
+    "太适合新手了。",
+]
+
+# 多维表格中的字段名
+BITABLE_FIELDS = {
+    "title": "标题",
+    "like": "点赞",
+    "comment": "评论",
+    "save": "收藏",
+    "share": "分享",
+    "comment_extracted": "评论摘录",
+    "publish_time": "发布时间",
+    "account": "账号",
+}
+
+
+class WorkloadGenerator:
+    """
+    分块生成帖子表 (DataFrame)，列与 post_data_sample.csv 一致，
+    另有 publish_time 和 account 两列；相同的参数和 seed 生成完全相同的数据
+
+    rows: 总行数
+    accounts: 账号数，每个账号有自己的基础热度
+    viral_rate: 爆款离群值的比例
+    chunk_size: 每块的行数
+    """
+
+    def __init__(
+        self,
+        rows,
+        seed=0,
+        accounts=50,
+        viral_rate=0.002,
+        chunk_size=50000,
+        start=datetime(2024, 1, 1),
+    ):
+        self.rows = rows
+        self.seed = seed
+        self.accounts = accounts
+        self.viral_rate = viral_rate
+        self.chunk_size = chunk_size
+        self.start = start
+
+    def chunks(self):
+        """逐块产出 DataFrame，内存占用只与 chunk_size 有关"""
+        rng = np.random.default_rng(self.seed)
+        # 账号的基础热度 (对数点赞中位数) 与发帖频率
+        account_level = rng.normal(5.0, 0.8, self.accounts)
+        account_weight = rng.pareto(1.5, self.accounts) + 1
+        account_weight /= account_weight.sum()
+
+        published = self.start
+        for offset in range(0, self.rows, self.chunk_size):
+            n = min(self.chunk_size, self.rows - offset)
+            frame = self._chunk(rng, n, account_level, account_weight, published)
+            published = frame["publish_time"].iloc[-1]
+            yield frame
+
+    def _chunk(self, rng, n, account_level, account_weight, published):
+        accounts = rng.choice(self.accounts, size=n, p=account_weight)
+
+        # 潜在因子：内容质量 (影响全部指标)、干货程度 (收藏/分享)、争议度 (评论)
+        quality = rng.normal(0, 1, n)
+        dry = rng.normal(0, 1, n)
+        debate = rng.normal(0, 1, n)
+        base = account_level[accounts] + 0.9 * quality
+
+        like = rng.poisson(np.exp(base + rng.normal(0, 0.3, n)))
+        save = rng.poisson(np.exp(base + np.log(0.35) + 0.6 * dry))
+        comment = rng.poisson(np.exp(base + np.log(0.08) + 0.6 * debate))
+        share = rng.poisson(np.exp(base + np.log(0.03) + 0.5 * dry))
+        factors = np.stack([like, comment, save, share], axis=1).astype(np.int64)
+
+        # 爆款：全部指标按帕累托分布放大一个数量级以上
+        viral = rng.random(n) < self.viral_rate
+        boost = 10 + rng.pareto(1.2, n) * 10
+        factors[viral] = (factors[viral] * boost[viral, None]).astype(np.int64)
+
+        # 发布间隔服从指数分布，平均每 20 分钟一篇
+        gaps = np.cumsum(rng.exponential(1200, n))
+        publish_time = pd.Timestamp(published) + pd.to_timedelta(gaps, unit="s")
+
+        topics = rng.integers(0, len(TOPICS), n)
+        suffixes = rng.integers(0, len(TITLE_SUFFIXES), n)
+        # 评论摘录由 1~N 个片段拼成，长度近似几何分布
+        snippet_counts = rng.geometric(0.35, n)
+        snippets = np.array(COMMENT_SNIPPETS, dtype=object)[
+            rng.integers(0, len(COMMENT_SNIPPETS), snippet_counts.sum())
+        ]
+        bounds = np.concatenate([[0], np.cumsum(snippet_counts)])
+        comments = ["".join(snippets[bounds[i] : bounds[i + 1]]) for i in range(n)]
+
+        return pd.DataFrame(
+            {
+                "title": [
+                    TOPICS[t] + TITLE_SUFFIXES[s] for t, s in zip(topics, suffixes)
+                ],
+                "like": factors[:, 0],
+                "comment": factors[:, 1],
+                "save": factors[:, 2],
+                "share": factors[:, 3],
+                "comment_extracted": comments,
+                "publish_time": publish_time,
+                "account": [f"acct{a:04d}" for a in accounts],
+            }
+        )
+
+    def frame(self):
+        """一次性生成整张表"""
+        return pd.concat(self.chunks(), ignore_index=True)
+
+    def bitable_records(self, pending=0):
+        """
+        逐条产出多维表格格式的记录 (与记录接口返回的 items 一致)；
+        最后 pending 条记录的状态为"待分析"，其余为"已分析"
+        """
+        pending_from = self.rows - pending
+        position = 0
+        for frame in self.chunks():
+            timestamps = (frame["publish_time"].astype("int64") // 1_000_000).to_numpy()
+            for row, timestamp in zip(frame.to_dict("records"), timestamps):
+                fields = {
+                    BITABLE_FIELDS[key]: value
+                    for key, value in row.items()
+                    if key != "publish_time"
+                }
+                fields["发布时间"] = int(timestamp)
+                fields["状态"] = "已分析" if position < pending_from else "待分析"
+                yield {
+                    "record_id": f"rec{position:07d}",
+                    "fields": _plain(fields),
+                    "created_time": int(timestamp),
+                    "last_modified_time": int(timestamp),
+                }
+                position += 1
+
+    def bitable_pages(self, page_size=500, pending=0):
+        """按多维表格记录接口的分页格式逐页产出 data 对象"""
+        page = []
+        position = 0
+        for record in self.bitable_records(pending):
+            page.append(record)
+            position += 1
+            if len(page) == page_size:
+                has_more = position < self.rows
+                yield _page(page, has_more, position, self.rows)
+                page = []
+        if page or position == 0:
+            yield _page(page, False, position, self.rows)
+
+
+def _plain(fields):
+    """numpy 标量转换为 Python 内置类型，便于 JSON 序列化"""
+    return {
+        key: value.item() if isinstance(value, np.generic) else value
+        for key, value in fields.items()
+    }
+
+
+def _page(items, has_more, position, total):
+    return {
+        "items": items,
+        "has_more": has_more,
+        "page_token": str(position) if has_more else None,
+        "total": total,
+    }
+
+
+def write_csv(generator, path):
+    """流式写出 CSV，返回行数"""
+    rows = 0
+    for i, frame in enumerate(generator.chunks()):
+        frame.to_csv(path, mode="w" if i == 0 else "a", header=i == 0, index=False)
+        rows += len(frame)
+    return rows
+
+
+def write_parquet(generator, path):
+    """流式写出 Parquet (每块一个 row group)，需要安装 pyarrow"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    rows = 0
+    writer = None
+    try:
+        for frame in generator.chunks():
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+            rows += len(frame)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def write_bitable_json(generator, path, page_size=500, pending=0):
+    """写出多维表格分页 JSON (每行一页)，返回记录数"""
+    rows = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for page in generator.bitable_pages(page_size, pending):
+            f.write(json.dumps(page, ensure_ascii=False) + "\n")
+            rows += len(page["items"])
+    return rows
+
+
+WRITERS = {"csv": write_csv, "parquet": write_parquet, "bitable": write_bitable_json}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成合成小红书帖子表")
+    parser.add_argument("--rows", type=int, default=100000, help="行数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--accounts", type=int, default=50, help="账号数")
+    parser.add_argument(
+        "--viral-rate", type=float, default=0.002, help="爆款离群值比例"
+    )
+    parser.add_argument("--format", choices=list(WRITERS), default="csv")
+    parser.add_argument(
+        "--pending", type=int, default=0, help="bitable 格式中末尾待分析记录条数"
+    )
+    parser.add_argument("--out", required=True, help="输出文件")
+    args = parser.parse_args(argv)
+
+    generator = WorkloadGenerator(
+        args.rows, seed=args.seed, accounts=args.accounts, viral_rate=args.viral_rate
+    )
+    if args.format == "bitable":
+        rows = write_bitable_json(generator, args.out, pending=args.pending)
+    else:
+        rows = WRITERS[args.format](generator, args.out)
+    print(f"已生成 {rows} 行 -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
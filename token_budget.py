@@ -0,0 +1,110 @@
+"""
+Token 预算 - 本地 token 估算器与按 token 预算装箱的批次构建
+"""
+
+import json
+import re
+
+import numpy as np
+
+# 中日韩字符 (含全角标点)
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+
+
+class TokenEstimator:
+    """
+    本地 token 估算：token ≈ 中文字符数 × cjk_ratio + 其他字符数 × other_ratio
+    默认系数为经验值，可用 Gemini count_tokens 校准后保存到文件离线复用
+    """
+
+    def __init__(self, cjk_ratio=1.0, other_ratio=0.25):
+        self.cjk_ratio = cjk_ratio
+        self.other_ratio = other_ratio
+
+    @staticmethod
+    def _char_counts(text):
+        cjk = len(_CJK_PATTERN.findall(text))
+        return cjk, len(text) - cjk
+
+    def estimate(self, text):
+        """估算一段文本的 token 数"""
+        if not text:
+            return 0
+        cjk, other = self._char_counts(text)
+        return int(np.ceil(cjk * self.cjk_ratio + other * self.other_ratio))
+
+    def calibrate(self, client, samples, model="gemini-2.5-flash"):
+        """
+        用 client.models.count_tokens 的真实结果拟合两个系数 (最小二乘)
+        样本不足以区分两类字符时，退化为整体缩放
+        """
+        counts = np.array([self._char_counts(text) for text in samples], dtype=float)
+        actual = np.array(
+            [
+                client.models.count_tokens(model=model, contents=text).total_tokens
+                for text in samples
+            ],
+            dtype=float,
+        )
+
+        if len(samples) >= 2 and np.linalg.matrix_rank(counts) == 2:
+            (cjk_ratio, other_ratio), *_ = np.linalg.lstsq(counts, actual, rcond=None)
+            if cjk_ratio > 0 and other_ratio > 0:
+                self.cjk_ratio, self.other_ratio = float(cjk_ratio), float(other_ratio)
+                return self
+
+        estimated = counts @ np.array([self.cjk_ratio, self.other_ratio])
+        if estimated.sum() > 0:
+            scale = actual.sum() / estimated.sum()
+            self.cjk_ratio *= scale
+            self.other_ratio *= scale
+        return self
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"cjk_ratio": self.cjk_ratio, "other_ratio": self.other_ratio}, f)
+
+    @classmethod
+    def load(cls, path):
+        """读取校准结果，文件不存在或损坏时使用默认系数"""
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            return cls(data["cjk_ratio"], data["other_ratio"])
+        except (OSError, ValueError, KeyError):
+            return cls()
+
+
+# 全局默认估算器，rate_limiter 的 TPM 预算也使用它
+default_estimator = TokenEstimator()
+
+
+def pack_batches(sizes, budget, overhead=0, max_items=None):
+    """
+    首次适应递减 (First-Fit Decreasing) 装箱：
+    把各条目按 token 数装入若干批次，每批 overhead + 条目之和不超过 budget
+
+    sizes: 每个条目的 token 数
+    overhead: 每个批次的固定开销 (共用的指令部分)
+    max_items: 每批最多条目数
+    返回批次列表，每个批次是条目下标的列表 (批内按原顺序排列)
+    单个条目本身超出预算时独占一个批次
+    """
+    capacity = budget - overhead
+    order = sorted(range(len(sizes)), key=lambda i: sizes[i], reverse=True)
+
+    batches = []
+    remaining = []
+    for i in order:
+        for b, batch in enumerate(batches):
+            if sizes[i] <= remaining[b] and (
+                max_items is None or len(batch) < max_items
+            ):
+                batch.append(i)
+                remaining[b] -= sizes[i]
+                break
+        else:
+            batches.append([i])
+            remaining.append(capacity - sizes[i])
+
+    return [sorted(batch) for batch in batches]